@@ -16,6 +16,9 @@ load_dotenv()
 # SECURITY: Use same password as main admin dashboard
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'educapp2024')
 
+# Rows per page in the All Users tab
+USERS_PAGE_SIZE = 100
+
 # Page config
 st.set_page_config(
     page_title="EducApp User Management",
@@ -62,29 +65,21 @@ def show_user_dashboard():
     conn = sqlite3.connect('educapp_users.db')
     cursor = conn.cursor()
     
-    # Total users
-    cursor.execute('SELECT COUNT(*) FROM users')
-    total_users = cursor.fetchone()[0]
-    
-    # Free vs Paid
-    cursor.execute('SELECT COUNT(*) FROM users WHERE subscription_status = "free"')
-    free_users = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(*) FROM users WHERE subscription_status = "paid"')
-    paid_users = cursor.fetchone()[0]
+    # All user counts in one pass; new users by a created_at range the index can use
+    month_start = datetime.now().strftime('%Y-%m-01')
+    cursor.execute('''
+        SELECT COUNT(*),
+               COALESCE(SUM(subscription_status = 'free'), 0),
+               COALESCE(SUM(subscription_status = 'paid'), 0),
+               COALESCE(SUM(created_at >= ?), 0)
+        FROM users
+    ''', (month_start,))
+    total_users, free_users, paid_users, new_users_month = cursor.fetchone()
     
     # Total conversations
     cursor.execute('SELECT COUNT(*) FROM conversations')
     total_conversations = cursor.fetchone()[0]
     
-    # New users this month
-    current_month = datetime.now().strftime('%Y-%m')
-    cursor.execute('''
-        SELECT COUNT(*) FROM users 
-        WHERE strftime('%Y-%m', created_at) = ?
-    ''', (current_month,))
-    new_users_month = cursor.fetchone()[0]
-    
     conn.close()
     
     # Display metrics
@@ -129,53 +124,52 @@ def show_user_dashboard():
 
 
 def show_all_users():
-    """Display all registered users with search"""
+    """Display registered users a page at a time, with search"""
     st.subheader("📋 All Registered Users")
     
     # Search box
     search_query = st.text_input("🔍 Search by name or email", placeholder="Type to search...")
     
-    conn = sqlite3.connect('educapp_users.db')
+    # Keyset cursors (created_at, id) of the pages before the current one
+    if st.session_state.get('users_search') != search_query:
+        st.session_state.users_search = search_query
+        st.session_state.users_cursors = [None]
+    cursors = st.session_state.users_cursors
+    cursor = cursors[-1]
     
-    # Base query
+    conditions, params = [], []
     if search_query:
-        query = '''
-            SELECT 
-                u.id,
-                u.email,
-                u.name,
-                u.created_at,
-                u.subscription_status,
-                u.questions_this_month,
-                COUNT(c.id) as total_conversations
-            FROM users u
-            LEFT JOIN conversations c ON u.id = c.user_id
-            WHERE u.email LIKE ? OR u.name LIKE ?
-            GROUP BY u.id
-            ORDER BY u.created_at DESC
-        '''
+        conditions.append('(u.email LIKE ? OR u.name LIKE ?)')
         search_pattern = f'%{search_query}%'
-        df_users = pd.read_sql_query(query, conn, params=(search_pattern, search_pattern))
-    else:
-        query = '''
-            SELECT 
-                u.id,
-                u.email,
-                u.name,
-                u.created_at,
-                u.subscription_status,
-                u.questions_this_month,
-                COUNT(c.id) as total_conversations
-            FROM users u
-            LEFT JOIN conversations c ON u.id = c.user_id
-            GROUP BY u.id
-            ORDER BY u.created_at DESC
-        '''
-        df_users = pd.read_sql_query(query, conn)
+        params += [search_pattern, search_pattern]
+    if cursor:
+        conditions.append('(u.created_at, u.id) < (?, ?)')
+        params += list(cursor)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    
+    # Conversations are counted only for the rows on this page
+    query = f'''
+        SELECT 
+            u.id,
+            u.email,
+            u.name,
+            u.created_at,
+            u.subscription_status,
+            u.questions_this_month,
+            (SELECT COUNT(*) FROM conversations c WHERE c.user_id = u.id) as total_conversations
+        FROM users u
+        {where}
+        ORDER BY u.created_at DESC, u.id DESC
+        LIMIT ?
+    '''
     
+    conn = sqlite3.connect('educapp_users.db')
+    df_users = pd.read_sql_query(query, conn, params=params + [USERS_PAGE_SIZE])
     conn.close()
     
     if not df_users.empty:
+        next_cursor = (df_users['created_at'].iloc[-1], int(df_users['id'].iloc[-1]))
+        
         df_users.columns = [
             'ID', 'Email', 'Name', 'Joined', 
             'Status', 'Questions This Month', 'Total Conversations'
@@ -184,7 +178,19 @@ def show_all_users():
         df_users['Status'] = df_users['Status'].apply(lambda x: '💎 Paid' if x == 'paid' else '🆓 Free')
         
         st.dataframe(df_users, use_container_width=True, hide_index=True)
-        st.caption(f"**Showing {len(df_users)} users**")
+        
+        first = (len(cursors) - 1) * USERS_PAGE_SIZE + 1
+        st.caption(f"**Showing users {first}-{first + len(df_users) - 1}**")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if len(cursors) > 1 and st.button("⬅️ Previous page"):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            if len(df_users) == USERS_PAGE_SIZE and st.button("Next page ➡️"):
+                cursors.append(next_cursor)
+                st.rerun()
     else:
         st.info("No users found" if search_query else "No users in database")
 
@@ -5,13 +5,18 @@ Streamlit web application for Christian Education
 
 import streamlit as st
 from core.chatbot import EducAppTutor
+from core.concurrency import llm_limiter
 from core.auth import check_authentication, logout, get_current_user
-from core.freemium import get_user_usage, can_ask_question, increment_question_count, get_upgrade_message
+from core.freemium import get_user_usage, reserve_question, commit_question, release_question, get_upgrade_message
 from core.conversation_manager import ConversationManager
-from core.database_supabase import SupabaseDatabase
+from core.write_behind import queue_conversation
+from core.supabase_client import get_database
 import sys
 from datetime import datetime
 
+# Conversations per window on the History page
+HISTORY_PAGE_SIZE = 20
+
 # Hide GitHub fork button and Streamlit branding
 hide_streamlit_style = """
 <style>
@@ -22,12 +27,6 @@ header {visibility: hidden;}
 """
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
-# Initialize database
-@st.cache_resource
-def get_database():
-    """Get database instance - cached to reuse connection"""
-    return SupabaseDatabase()
-
 # Helper function to get user ID by email
 def get_user_id_by_email(email):
     """Get user ID from email"""
@@ -46,7 +45,7 @@ st.set_page_config(
 # Initialize chatbot (cached to avoid reloading)
 @st.cache_resource
 def load_tutor():
-    """Load the AI tutor - this only runs once"""
+    """Load the AI tutor - this only runs once and is shared by all sessions"""
     try:
         return EducAppTutor()
     except Exception as e:
@@ -59,6 +58,90 @@ def load_conversation_manager():
     """Load conversation manager - this only runs once"""
     return ConversationManager()
 
+def spinner_until_first_chunk(chunks, message):
+    """Show a spinner while waiting for the first streamed chunk, then pass chunks through"""
+    with st.spinner(message):
+        first = next(chunks, None)
+    if first is not None:
+        yield first
+        yield from chunks
+
+def show_conversation(conv, conv_mgr, user_id, expanded=False):
+    """One conversation with rename and delete controls"""
+    timestamp = conv['timestamp']
+    subject = conv['subject'] or "General"
+    conv_id = conv['id']
+    
+    # Get display title - ensure it's never None or empty
+    custom_title = conv.get('title')
+    if custom_title:
+        display_title = custom_title
+    else:
+        display_title = f"#{conv_id} - {subject} - {timestamp}"
+    
+    with st.expander(display_title, expanded=expanded):
+        # Rename section
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            new_title = st.text_input(
+                "✏️ Rename conversation", 
+                value=custom_title if custom_title else '',
+                placeholder=f"e.g., 'Technology Discussion'",
+                key=f"title_{conv_id}"
+            )
+        with col2:
+            st.write("")  # Spacing
+            st.write("")  # Spacing
+            if st.button("💾 Save", key=f"save_title_{conv_id}"):
+                if conv_mgr.update_conversation_title(conv_id, new_title if new_title else None, user_id):
+                    st.success("Title updated!")
+                    st.rerun()
+                else:
+                    st.error("Failed to update title")
+        with col3:
+            st.write("")  # Spacing
+            st.write("")  # Spacing
+            if st.button("🔄 Reset", key=f"reset_title_{conv_id}"):
+                if conv_mgr.update_conversation_title(conv_id, None, user_id):
+                    st.success("Title reset!")
+                    st.rerun()
+        
+        st.markdown("---")
+        st.markdown(f"**📅 Date:** {timestamp}")
+        st.markdown(f"**📚 Subject:** {subject}")
+        st.markdown("---")
+        
+        # Question section
+        st.markdown("**❓ Question:**")
+        st.info(conv['question'])
+        
+        st.markdown("---")
+        
+        # Answer section
+        st.markdown("**✅ Answer:**")
+        st.success(conv['answer'])
+        
+        # Delete button
+        st.markdown("---")
+        if st.button(f"🗑️ Delete this conversation", key=f"delete_{conv_id}"):
+            if conv_mgr.delete_conversation(conv_id, user_id):
+                st.success("Conversation deleted!")
+                st.session_state.open_conversation = None
+                st.rerun()
+            else:
+                st.error("Failed to delete conversation.")
+
+def show_conversation_list(conversations):
+    """One row per conversation (no answers); clicking a row opens it above the list"""
+    for conv in conversations:
+        question = conv['question'] if len(conv['question']) <= 100 else conv['question'][:100] + "…"
+        label = f"{str(conv['timestamp'])[:16]} · {conv['subject']} · {question}"
+        if st.button(label, key=f"open_{conv['id']}", use_container_width=True):
+            st.session_state.open_conversation = conv['id']
+            st.rerun()
+        if conv.get('answer_highlight'):
+            st.caption(conv['answer_highlight'])
+
 def show_conversation_history():
     """Display user's conversation history with search and rename"""
     st.title("📚 Conversation History")
@@ -72,17 +155,14 @@ def show_conversation_history():
         return
     
     conv_mgr = load_conversation_manager()
-    conversations = conv_mgr.get_user_conversations(user_id, limit=100)
     
-    if not conversations:
-        st.info("📝 No conversations yet. Start asking questions!")
-        return
-    
-    # Search box
-    col1, col2 = st.columns([3, 1])
+    # Search box and subject filter
+    col1, col2, col3 = st.columns([3, 1, 1])
     with col1:
-        search_query = st.text_input("🔍 Search conversations", placeholder="Enter keyword to filter...")
+        search_query = st.text_input("🔍 Search conversations", placeholder="Search your whole history...")
     with col2:
+        subject_filter = st.selectbox("📚 Subject", ["All subjects"] + conv_mgr.get_subjects(user_id))
+    with col3:
         st.write("")  # Spacing
         st.write("")  # Spacing
         if st.button("🗑️ Clear All History"):
@@ -95,90 +175,77 @@ def show_conversation_history():
                 st.session_state.confirm_clear = True
                 st.warning("Click again to confirm deletion of ALL conversations")
     
-    # Filter conversations by search query
-    filtered_conversations = conversations
-    if search_query:
-        search_lower = search_query.lower()
-        filtered_conversations = [
-            conv for conv in conversations 
-            if search_lower in conv['question'].lower() 
-            or search_lower in conv['answer'].lower()
-            or (conv['subject'] and search_lower in conv['subject'].lower())
-            or (conv.get('title') and search_lower in conv['title'].lower())
-        ]
+    subject = None if subject_filter == "All subjects" else subject_filter
     
-    # Display results
-    st.write(f"**Showing {len(filtered_conversations)} of {len(conversations)} conversations**")
+    # The opened conversation is the only one loaded with its answer
+    open_id = st.session_state.get('open_conversation')
+    if open_id:
+        conv = conv_mgr.get_conversation(open_id, user_id)
+        if conv:
+            show_conversation(conv, conv_mgr, user_id, expanded=True)
+            if st.button("✖️ Close conversation"):
+                st.session_state.open_conversation = None
+                st.rerun()
+            st.markdown("---")
     
-    if search_query and not filtered_conversations:
+    if not search_query.strip():
+        # One window of summaries at a time; cursors of the windows above this one
+        if st.session_state.get('history_subject') != subject:
+            st.session_state.history_subject = subject
+            st.session_state.history_cursors = [None]
+        cursors = st.session_state.history_cursors
+        
+        conversations = conv_mgr.get_user_conversations(
+            user_id, HISTORY_PAGE_SIZE, after=cursors[-1], summaries=True, subject=subject)
+        
+        if not conversations:
+            if len(cursors) > 1:
+                cursors.pop()
+                st.rerun()
+            st.info("📝 No conversations yet. Start asking questions!")
+            return
+        
+        first = (len(cursors) - 1) * HISTORY_PAGE_SIZE + 1
+        st.write(f"**Conversations {first}-{first + len(conversations) - 1}, newest first**")
+        show_conversation_list(conversations)
+        
+        next_cursor = conv_mgr.next_cursor(conversations, HISTORY_PAGE_SIZE)
+        col1, col2 = st.columns(2)
+        with col1:
+            if len(cursors) > 1 and st.button("⬆️ Newer conversations"):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            if next_cursor and st.button("⬇️ Load more"):
+                cursors.append(next_cursor)
+                st.rerun()
+        return
+    
+    # Full-text search, a page at a time; a new query or filter starts at page 1
+    search_key = (search_query, subject)
+    if st.session_state.get('search_key') != search_key:
+        st.session_state.search_key = search_key
+        st.session_state.search_page = 1
+    
+    found = conv_mgr.search(user_id, search_query, subject, page=st.session_state.search_page)
+    
+    if not found['results']:
         st.warning(f"No conversations found matching '{search_query}'")
         return
     
-    st.markdown("---")
+    st.write(f"**{found['total']} conversations match '{search_query}'** "
+             f"(page {found['page']} of {found['pages']})")
+    show_conversation_list(found['results'])
     
-    # Display conversations
-    for i, conv in enumerate(filtered_conversations, 1):
-        timestamp = conv['timestamp']
-        subject = conv['subject'] or "General"
-        conv_id = conv['id']
-        
-        # Get display title - ensure it's never None or empty
-        custom_title = conv.get('title')
-        if custom_title:
-            display_title = custom_title
-        else:
-            display_title = f"#{conv_id} - {subject} - {timestamp}"
-        
-        with st.expander(display_title, expanded=(i==1)):
-            # Rename section
-            col1, col2, col3 = st.columns([3, 1, 1])
-            with col1:
-                new_title = st.text_input(
-                    "✏️ Rename conversation", 
-                    value=custom_title if custom_title else '',
-                    placeholder=f"e.g., 'Technology Discussion'",
-                    key=f"title_{conv_id}"
-                )
-            with col2:
-                st.write("")  # Spacing
-                st.write("")  # Spacing
-                if st.button("💾 Save", key=f"save_title_{conv_id}"):
-                    if conv_mgr.update_conversation_title(conv_id, new_title if new_title else None, user_id):
-                        st.success("Title updated!")
-                        st.rerun()
-                    else:
-                        st.error("Failed to update title")
-            with col3:
-                st.write("")  # Spacing
-                st.write("")  # Spacing
-                if st.button("🔄 Reset", key=f"reset_title_{conv_id}"):
-                    if conv_mgr.update_conversation_title(conv_id, None, user_id):
-                        st.success("Title reset!")
-                        st.rerun()
-            
-            st.markdown("---")
-            st.markdown(f"**📅 Date:** {timestamp}")
-            st.markdown(f"**📚 Subject:** {subject}")
-            st.markdown("---")
-            
-            # Question section
-            st.markdown("**❓ Question:**")
-            st.info(conv['question'])
-            
-            st.markdown("---")
-            
-            # Answer section
-            st.markdown("**✅ Answer:**")
-            st.success(conv['answer'])
-            
-            # Delete button
-            st.markdown("---")
-            if st.button(f"🗑️ Delete this conversation", key=f"delete_{conv_id}"):
-                if conv_mgr.delete_conversation(conv_id, user_id):
-                    st.success("Conversation deleted!")
-                    st.rerun()
-                else:
-                    st.error("Failed to delete conversation.")
+    col1, col2 = st.columns(2)
+    with col1:
+        if found['page'] > 1 and st.button("⬅️ Previous results"):
+            st.session_state.search_page -= 1
+            st.rerun()
+    with col2:
+        if found['page'] < found['pages'] and st.button("More results ➡️"):
+            st.session_state.search_page += 1
+            st.rerun()
 
 def main():
     # Check authentication first
@@ -189,6 +256,9 @@ def main():
     user_email = current_user['email']
     user_name = current_user['name']
     
+    # Load the user row once for this rerun (shared user cache, so usually no request)
+    user = get_database().get_user_by_email(user_email)
+    
     # Sidebar configuration
     with st.sidebar:
         # Navigation
@@ -205,7 +275,7 @@ def main():
         st.caption(user_email)
         
         # Show usage for free users
-        usage = get_user_usage(user_email)
+        usage = get_user_usage(user_email, user)
         if usage and usage['has_limit']:
             questions_left = usage['limit'] - usage['questions_used']
             if questions_left > 0:
@@ -244,16 +314,15 @@ def main():
     st.markdown("*An EdTech platform with a Christian worldview, with its principles and values biblically based*")
     st.markdown("---")
     
-    # Load tutor and conversation manager
+    # Load tutor
     tutor = load_tutor()
-    conv_mgr = load_conversation_manager()
     
     if tutor is None:
         st.error("Failed to initialize AI tutor. Please check your setup and try again.")
         return
     
     # Get user ID for conversation saving
-    user_id = get_user_id_by_email(user_email)
+    user_id = user['id'] if user else None
     
     # Initialize conversation history
     if "messages" not in st.session_state:
@@ -271,8 +340,9 @@ def main():
     
     # User input
     if prompt := st.chat_input(f"Ask your question, {user_name}..."):
-        # Check if user can ask questions
-        if not can_ask_question(user_email):
+        # Check the limit and reserve this question in one call
+        reservation = reserve_question(user_email)
+        if not reservation or not reservation['allowed']:
             from core.stripe_payment import check_payment_success
             
             st.error("⚠️ You've reached your monthly question limit!")
@@ -296,34 +366,43 @@ def main():
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Generate AI response
+        # Generate AI response, rendering tokens as they arrive
         with st.chat_message("assistant"):
-            with st.spinner("🙏 Thinking biblically..."):
-                try:
-                    response = tutor.get_response(
+            # Calls beyond the process-wide LLM limit wait in line
+            queue_depth = llm_limiter.queue_depth
+            thinking_message = "🙏 Thinking biblically..."
+            if queue_depth:
+                thinking_message += f" ({queue_depth} questions ahead of yours)"
+            try:
+                response = st.write_stream(spinner_until_first_chunk(
+                    tutor.get_response_stream(
                         student_question=prompt,
                         subject=subject,
                         student_grade=grade,
-                        user_email=user_email
+                        user_email=user_email,
+                        # This session's earlier messages (the new question is already appended)
+                        history=st.session_state.messages[:-1]
+                    ),
+                    thinking_message
+                ))
+                
+                # Save conversation to database (in the background, after the answer has rendered)
+                if user_id:
+                    queue_conversation(
+                        user_id=user_id,
+                        question=prompt,
+                        answer=response,
+                        subject=subject
                     )
-                    st.markdown(response)
-                    
-                    # Save conversation to database
-                    if user_id:
-                        conv_mgr.save_conversation(
-                            user_id=user_id,
-                            question=prompt,
-                            answer=response,
-                            subject=subject
-                        )
-                    
-                    # Increment question counter AFTER successful response
-                    increment_question_count(user_email)
-                    
-                except Exception as e:
-                    error_msg = f"I encountered an error. Please try again. Error: {str(e)}"
-                    st.error(error_msg)
-                    response = error_msg
+                
+                commit_question(reservation)
+                
+            except Exception as e:
+                # A failed answer does not use up the student's question
+                release_question(reservation)
+                error_msg = f"I encountered an error. Please try again. Error: {str(e)}"
+                st.error(error_msg)
+                response = error_msg
         
         # Add assistant response to history
         st.session_state.messages.append({"role": "assistant", "content": response})
@@ -0,0 +1,200 @@
+"""
+Benchmark: monthly usage queries on a synthetic database
+Compares the old strftime() filters (no secondary indexes) with the current
+queries in core/database.py (an indexed month range for the question count,
+usage_rollup lookups for costs), and checks with
+EXPLAIN QUERY PLAN that they search an index instead of scanning the table
+
+Usage:
+    python benchmark_database.py
+    python benchmark_database.py --rows 200000
+"""
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from core import database
+
+INDEXES = ['idx_user_conversations', 'idx_api_usage_user_timestamp', 'idx_api_usage_timestamp']
+
+# The previous implementations, kept here for comparison
+LEGACY_QUERIES = {
+    'get_monthly_usage': ('''SELECT COUNT(*) FROM conversations
+                             WHERE user_id = ?
+                             AND strftime('%Y-%m', timestamp) = ?''', 'user_id'),
+    'get_monthly_cost': ('''SELECT COALESCE(SUM(estimated_cost), 0) as total_cost
+                            FROM api_usage
+                            WHERE user_email = ?
+                            AND strftime('%Y-%m', timestamp) = ?''', 'email'),
+    'get_monthly_api_costs': ('''SELECT COUNT(*), SUM(input_tokens), SUM(output_tokens),
+                                        SUM(estimated_cost), AVG(estimated_cost),
+                                        SUM(cache_read_tokens), SUM(cache_write_tokens)
+                                 FROM api_usage
+                                 WHERE strftime('%Y-%m', timestamp) = ?''', None),
+    'get_top_users_by_cost': ('''SELECT u.email, u.name, u.subscription_status,
+                                        COUNT(a.id), SUM(a.estimated_cost) as total_cost
+                                 FROM users u
+                                 LEFT JOIN api_usage a ON u.email = a.user_email
+                                 WHERE strftime('%Y-%m', a.timestamp) = ?
+                                 GROUP BY u.email
+                                 ORDER BY total_cost DESC
+                                 LIMIT 10''', None),
+}
+
+
+def populate(rows, users, months):
+    """Spread rows of conversations and api_usage evenly over the last few months"""
+    random.seed(42)
+    now = datetime.now()
+    span = timedelta(days=30 * months).total_seconds()
+
+    def timestamp():
+        return str(now - timedelta(seconds=random.random() * span))
+
+    with database.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO users (email, password_hash, name) VALUES (?, 'x', ?)",
+            [(f'user{i}@example.com', f'User {i}') for i in range(users)])
+        conn.executemany(
+            "INSERT INTO conversations (user_id, question, answer, subject, timestamp) VALUES (?, 'q', 'a', 'math', ?)",
+            ((random.randint(1, users), timestamp()) for _ in range(rows)))
+        conn.executemany(
+            '''INSERT INTO api_usage (user_email, input_tokens, output_tokens, estimated_cost, timestamp)
+               VALUES (?, 1500, 400, 0.05, ?)''',
+            ((f'user{random.randrange(users)}@example.com', timestamp()) for _ in range(rows)))
+        conn.commit()
+
+
+def time_ms(fn, repeat):
+    """Median milliseconds per call"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return sorted(samples)[len(samples) // 2]
+
+
+def run_legacy(name, user_id, email):
+    sql, key = LEGACY_QUERIES[name]
+    month = datetime.now().strftime('%Y-%m')
+    params = {'user_id': (user_id, month), 'email': (email, month), None: (month,)}[key]
+    with database.get_connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def query_plans(calls):
+    """Capture the SQL each function runs and return its EXPLAIN QUERY PLAN details"""
+    plans = {}
+    with database.get_connection() as conn:
+        for name, call in calls.items():
+            statements = []
+            conn.set_trace_callback(statements.append)
+            call()
+            conn.set_trace_callback(None)
+            # The last SELECT is the monthly query (get_monthly_usage looks up the user id first)
+            sql = [s for s in statements if s.lstrip().upper().startswith('SELECT')][-1]
+            plans[name] = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}')]
+    return plans
+
+
+def check_month_bounds():
+    """Month ranges must hold on every day, including the 29th-31st and December"""
+    cases = {
+        datetime(2025, 1, 31): ('2025-01-01', '2025-02-01'),
+        datetime(2024, 1, 30): ('2024-01-01', '2024-02-01'),
+        datetime(2025, 3, 31): ('2025-03-01', '2025-04-01'),
+        datetime(2025, 8, 31): ('2025-08-01', '2025-09-01'),
+        datetime(2024, 2, 29): ('2024-02-01', '2024-03-01'),
+        datetime(2025, 12, 31): ('2025-12-01', '2026-01-01'),
+    }
+    ok = True
+    for now, expected in cases.items():
+        try:
+            bounds = database._month_bounds(now)
+        except ValueError as e:
+            bounds = e
+        passed = bounds == expected
+        ok = ok and passed
+        print(f"  {'✅' if passed else '❌'} {now:%Y-%m-%d} -> {bounds}")
+    return ok
+
+
+def check_plans(plans):
+    """Every monthly query must search through an index, never scan its table"""
+    ok = True
+    for name, details in plans.items():
+        scans = [d for d in details if d.startswith('SCAN') and 'INDEX' not in d]
+        uses_index = any('INDEX' in d or 'PRIMARY KEY' in d for d in details)
+        passed = uses_index and not scans
+        ok = ok and passed
+        print(f"  {'✅' if passed else '❌'} {name}")
+        for detail in details:
+            print(f"      {detail}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='rows in each of conversations and api_usage')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print("\n📅 Month bounds")
+    if not check_month_bounds():
+        raise SystemExit("❌ Month bounds are wrong")
+
+    workdir = tempfile.mkdtemp(prefix='educapp_db_bench_')
+    database.DB_PATH = os.path.join(workdir, 'bench.db')
+    database.init_database()
+
+    print(f"\n📦 Inserting {args.rows:,} conversations and {args.rows:,} api_usage rows...")
+    start = time.perf_counter()
+    populate(args.rows, args.users, args.months)
+    database.rebuild_usage_rollup()
+    print(f"   done in {time.perf_counter() - start:.1f}s")
+
+    email = 'user7@example.com'
+    user_id = database.get_user_id_by_email(email)
+    calls = {
+        'get_monthly_usage': lambda: database.get_monthly_usage(email),
+        'get_monthly_cost': lambda: database.get_monthly_cost(email),
+        'get_monthly_api_costs': database.get_monthly_api_costs,
+        'get_top_users_by_cost': database.get_top_users_by_cost,
+    }
+
+    # Before: no secondary indexes, strftime() filters
+    with database.get_connection() as conn:
+        for index in INDEXES:
+            conn.execute(f'DROP INDEX IF EXISTS {index}')
+        conn.commit()
+    legacy = {name: time_ms(lambda: run_legacy(name, user_id, email), args.repeat) for name in calls}
+
+    # After: indexes from init_database, usage_rollup
+    database.init_database()
+    with database.get_connection() as conn:
+        conn.execute('ANALYZE')
+        conn.commit()
+    current = {name: time_ms(call, args.repeat) for name, call in calls.items()}
+
+    print(f"\n⏱️ Median of {args.repeat} runs")
+    print(f"  {'query':<24}{'strftime':>12}{'current':>14}")
+    for name in calls:
+        print(f"  {name:<24}{legacy[name]:>10.2f}ms{current[name]:>12.2f}ms  ({legacy[name] / current[name]:.0f}x)")
+
+    print("\n🔍 EXPLAIN QUERY PLAN")
+    ok = check_plans(query_plans(calls))
+    print("\n✅ All monthly queries use an index" if ok else "\n❌ Some monthly queries scan a table")
+
+    database._pools.pop(database.DB_PATH).close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
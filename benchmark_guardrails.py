@@ -0,0 +1,108 @@
+"""
+Microbenchmark: compiled guardrail matching vs the previous substring scans
+Also lists queries where the two disagree (substring misfires like "man" in "many",
+and stopwords from the topic phrases like "and" firing on their own)
+
+Usage:
+    python benchmark_guardrails.py
+"""
+
+import time
+from config.worldview_foundation import PARENT_DISCUSSION_TOPICS
+from core.guardrails import BiblicalGuardrails, SENSITIVE_KEYWORDS
+
+SAMPLE_QUERIES = [
+    "What is photosynthesis?",
+    "Why did God create the world?",
+    "How many businesses are there in my town?",
+    "Can you explain Saxon Math incremental development?",
+    "What does Colossians 1:16 mean?",
+    "What happens in the end times?",
+    "Is speaking in tongues for today?",
+    "How do I solve long division problems with remainders?",
+    "Why do people believe in evolution?",
+    "What is the difference between right and wrong?",
+    "Tell me about the human heart and how it pumps blood.",
+    "Is it a sin to lie if it protects someone?",
+    "What is the theme of Romeo and Juliet?",
+    "How did the Romans build their roads and aqueducts?",
+    "What does the Bible say about marriage?",
+]
+
+
+def legacy_keywords():
+    """The old keyword list: every word of every discussion topic, stopwords included"""
+    keywords = set(SENSITIVE_KEYWORDS)
+    for topic in PARENT_DISCUSSION_TOPICS:
+        keywords.update(topic.lower().split())
+    return keywords
+
+
+LEGACY_KEYWORDS = legacy_keywords()
+
+
+def legacy_check_query(query):
+    """The pre-compilation implementation, kept here for comparison"""
+    query_lower = query.lower()
+
+    result = {
+        "needs_parent_discussion": False,
+        "detected_topics": [],
+        "biblical_context_area": None
+    }
+
+    for keyword in LEGACY_KEYWORDS:
+        if keyword in query_lower:
+            result["needs_parent_discussion"] = True
+            result["detected_topics"].append(keyword)
+
+    if any(word in query_lower for word in ["evolution", "darwin", "created", "creation", "origins", "big bang"]):
+        result["biblical_context_area"] = "creation_and_science"
+    elif any(word in query_lower for word in ["bible", "scripture", "god's word", "biblical"]):
+        result["biblical_context_area"] = "biblical_authority"
+    elif any(word in query_lower for word in ["human", "person", "people", "mankind", "man", "woman", "male", "female", "gender"]):
+        result["biblical_context_area"] = "human_nature"
+    elif any(word in query_lower for word in ["right", "wrong", "moral", "ethics", "ethical", "good", "evil", "sin"]):
+        result["biblical_context_area"] = "morality_and_ethics"
+    elif any(word in query_lower for word in ["sex", "sexuality", "marriage", "married", "dating", "relationship"]):
+        result["biblical_context_area"] = "human_sexuality_and_marriage"
+    elif any(word in query_lower for word in ["life", "death", "die", "eternal", "heaven", "hell", "afterlife", "resurrection"]):
+        result["biblical_context_area"] = "life_and_death"
+
+    return result
+
+
+def time_per_query(check, queries, rounds):
+    """Average microseconds per check"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for query in queries:
+            check(query)
+    return (time.perf_counter() - start) / (rounds * len(queries)) * 1_000_000
+
+
+def main():
+    guardrails = BiblicalGuardrails()
+    rounds = 2000
+
+    legacy_us = time_per_query(legacy_check_query, SAMPLE_QUERIES, rounds)
+    compiled_us = time_per_query(guardrails.check_query, SAMPLE_QUERIES, rounds)
+
+    print(f"\n⏱️ {len(SAMPLE_QUERIES)} queries x {rounds} rounds")
+    print(f"  Substring scans: {legacy_us:8.2f} µs/query")
+    print(f"  Compiled regex:  {compiled_us:8.2f} µs/query  ({legacy_us / compiled_us:.1f}x)")
+
+    print("\n🔍 Differences (substring scan → whole-word match):")
+    for query in SAMPLE_QUERIES:
+        old = legacy_check_query(query)
+        new = guardrails.check_query(query)
+        old_topics = sorted(old["detected_topics"])
+        new_topics = sorted(new["detected_topics"])
+        if old_topics != new_topics or old["biblical_context_area"] != new["biblical_context_area"]:
+            print(f"  {query}")
+            print(f"    topics: {old_topics} → {new_topics}")
+            print(f"    area:   {old['biblical_context_area']} → {new['biblical_context_area']}")
+
+
+if __name__ == "__main__":
+    main()
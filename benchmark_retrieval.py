@@ -0,0 +1,165 @@
+"""
+Benchmark the in-process NumPy vector index against Chroma
+Reports search latency, resident memory and recall@k versus exact float32 search
+
+Usage:
+    python benchmark_retrieval.py                 # local embeddings, no API keys needed
+    python benchmark_retrieval.py --backend openai
+    python benchmark_retrieval.py --synthetic 50000   # pad the corpus with random vectors
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import numpy as np
+from langchain_core.documents import Document
+from core.embeddings import get_embeddings
+from core.rag_engine import load_directory, chunk_id
+from core.vector_index import NumpyVectorIndex, SUPPORTED_DTYPES, top_k
+
+SAMPLE_QUESTIONS = [
+    "What is photosynthesis?",
+    "Why did God create the world?",
+    "Saxon Math incremental development",
+    "Colossians 1:16",
+    "How should I study the Bible?",
+    "What is the classical trivium?",
+    "How do scientists study creation?",
+    "What does the Bible say about marriage?",
+    "How do I solve fractions?",
+    "Who wrote the book of Genesis?",
+]
+
+
+def rss_mb():
+    """Current resident set size in MB (falls back to peak RSS off Linux)"""
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KB on Linux
+    return peak / (1024 * 1024) if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def time_searches(search, query_vectors, k, repeat):
+    """Median and p95 latency in ms over all queries"""
+    samples = []
+    for _ in range(repeat):
+        for vector in query_vectors:
+            start = time.perf_counter()
+            search(vector, k)
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def recall(found_ids, exact_ids):
+    """Fraction of the exact top-k that a store returned"""
+    hits = sum(len(set(found) & set(exact)) for found, exact in zip(found_ids, exact_ids))
+    total = sum(len(exact) for exact in exact_ids)
+    return hits / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='local', help="embedding backend: local or openai")
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--synthetic', type=int, default=0, help="extra random vectors to add to the corpus")
+    args = parser.parse_args()
+
+    embeddings = get_embeddings(args.backend)
+
+    documents = []
+    for path in ("knowledge_base/biblical_worldview/", "knowledge_base/curricula/", "knowledge_base/scripture/"):
+        documents.extend(load_directory(path))
+    ids = [chunk_id(doc) for doc in documents]
+
+    vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in documents]), dtype=np.float32)
+    query_vectors = [np.asarray(v, dtype=np.float32) for v in embeddings.embed_documents(SAMPLE_QUESTIONS)]
+
+    if args.synthetic:
+        rng = np.random.default_rng(42)
+        vectors = np.vstack([vectors, rng.normal(size=(args.synthetic, vectors.shape[1])).astype(np.float32)])
+        documents += [Document(page_content=f"synthetic {i}", metadata={"source": "synthetic"}) for i in range(args.synthetic)]
+        ids += [f"synthetic-{i}" for i in range(args.synthetic)]
+
+    # Serve the precomputed vectors so building the stores measures indexing, not embedding
+    class PrecomputedEmbeddings:
+        model_name = embeddings.model_name
+        lookup = {doc.page_content: vector for doc, vector in zip(documents, vectors)}
+
+        def embed_documents(self, texts):
+            return [self.lookup[text].tolist() for text in texts]
+
+        def embed_query(self, text):
+            return embeddings.embed_query(text)
+
+    precomputed = PrecomputedEmbeddings()
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    exact_ids = [
+        [ids[i] for i in top_k(normalized @ (q / np.linalg.norm(q)), args.k)]
+        for q in query_vectors
+    ]
+
+    print(f"\n📊 Corpus: {len(documents)} chunks x {vectors.shape[1]} dims, {len(SAMPLE_QUESTIONS)} queries, k={args.k}")
+    print(f"{'store':<18}{'build s':>10}{'p50 ms':>10}{'p95 ms':>10}{'+RSS MB':>10}{'recall':>10}")
+    print("-" * 68)
+
+    workdir = tempfile.mkdtemp(prefix="educapp-bench-")
+    try:
+        for dtype in SUPPORTED_DTYPES:
+            before = rss_mb()
+            start = time.perf_counter()
+            index = NumpyVectorIndex.build(documents, ids, precomputed, os.path.join(workdir, dtype), dtype=dtype)
+            build_time = time.perf_counter() - start
+
+            id_by_content = dict(zip((doc.page_content for doc in documents), ids))
+            found = [
+                [id_by_content[doc.page_content] for doc in index.similarity_search_by_vector(q, k=args.k)]
+                for q in query_vectors
+            ]
+            p50, p95 = time_searches(index.similarity_search_by_vector, query_vectors, args.k, args.repeat)
+            print(f"{'numpy-' + dtype:<18}{build_time:>10.2f}{p50:>10.3f}{p95:>10.3f}{rss_mb() - before:>10.1f}{recall(found, exact_ids):>10.3f}")
+
+        try:
+            from langchain_community.vectorstores import Chroma
+        except ImportError:
+            print("chroma            (langchain_community not installed - skipped)")
+            return
+
+        before = rss_mb()
+        start = time.perf_counter()
+        chroma = Chroma.from_documents(
+            documents,
+            precomputed,
+            ids=ids,
+            collection_name="benchmark",
+            persist_directory=os.path.join(workdir, "chroma")
+        )
+        build_time = time.perf_counter() - start
+
+        id_by_content = dict(zip((doc.page_content for doc in documents), ids))
+        found = [
+            [id_by_content[doc.page_content] for doc in chroma.similarity_search_by_vector(q.tolist(), k=args.k)]
+            for q in query_vectors
+        ]
+        p50, p95 = time_searches(
+            lambda vector, k: chroma.similarity_search_by_vector(vector.tolist(), k=k),
+            query_vectors, args.k, args.repeat
+        )
+        print(f"{'chroma':<18}{build_time:>10.2f}{p50:>10.3f}{p95:>10.3f}{rss_mb() - before:>10.1f}{recall(found, exact_ids):>10.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,28 +4,66 @@ Handles user login, signup, and session management
 """
 
 import streamlit as st
-from core.database_supabase import SupabaseDatabase
-import bcrypt
+from core.supabase_client import get_database
+from core.session_tokens import session_tokens
+
+# Query parameter that carries the signed session token across reloads
+# It is visible in the URL, browser history, Referer headers and copied links;
+# the token's short lifetime (core/session_tokens.py) limits what a leak exposes
+SESSION_PARAM = 'session'
 
-# Initialize database
-db = SupabaseDatabase()
 
 def create_user(email, password=None, name=None, google_id=None):
     """Create new user"""
-    return db.create_user(email, password, name, google_id)
+    return get_database().create_user(email, password, name, google_id)
 
 def verify_password(email, password):
     """Verify user password"""
-    return db.verify_password(email, password)
+    return get_database().verify_password(email, password)
+
+def update_password(email, new_password):
+    """Change a user's password and sign out every session issued before the change"""
+    user_id = get_database().update_password(email, new_password)
+    if not user_id:
+        return False
+    session_tokens.revoke_user(user_id)
+    return True
 
 def user_exists(email):
     """Check if user exists"""
-    user = db.get_user_by_email(email)
+    user = get_database().get_user_by_email(email)
     return user is not None
 
 def get_user(email):
     """Get user by email"""
-    return db.get_user_by_email(email)
+    return get_database().get_user_by_email(email)
+
+def start_session(user_id, email, name, tier='free'):
+    """Log the user in for this browser session and hand the browser a signed token"""
+    st.session_state.authenticated = True
+    st.session_state.user_email = email
+    st.session_state.user_name = name
+    st.session_state.user_id = user_id
+    st.session_state.subscription_tier = tier
+    st.query_params[SESSION_PARAM] = session_tokens.issue(user_id, email, name, tier)
+
+def restore_session():
+    """Log in from the browser's session token (checked locally, no database calls)"""
+    token = st.query_params.get(SESSION_PARAM)
+    if not token:
+        return False
+    
+    claims = session_tokens.verify(token)
+    if not claims:
+        del st.query_params[SESSION_PARAM]
+        return False
+    
+    st.session_state.authenticated = True
+    st.session_state.user_email = claims['email']
+    st.session_state.user_name = claims['name']
+    st.session_state.user_id = claims['uid']
+    st.session_state.subscription_tier = claims['tier']
+    return True
 
 def show_login_form():
     """Display login form"""
@@ -49,10 +87,8 @@ def show_login_form():
                     st.error("Please enter both email and password")
                 elif verify_password(email, password):
                     user = get_user(email)
-                    st.session_state.authenticated = True
-                    st.session_state.user_email = email
-                    st.session_state.user_name = user.get('name', email.split('@')[0])
-                    st.session_state.user_id = user.get('id')
+                    start_session(user.get('id'), email, user.get('name') or email.split('@')[0],
+                                  user.get('subscription_status', 'free'))
                     st.success("Login successful!")
                     st.rerun()
                 else:
@@ -84,10 +120,7 @@ def show_login_form():
                 else:
                     user_id = create_user(email, password, name)
                     if user_id:
-                        st.session_state.authenticated = True
-                        st.session_state.user_email = email
-                        st.session_state.user_name = name
-                        st.session_state.user_id = user_id
+                        start_session(user_id, email, name)
                         st.success("Account created successfully!")
                         st.rerun()
                     else:
@@ -108,15 +141,23 @@ def show_login_form():
 def check_authentication():
     """Check if user is authenticated"""
     if 'authenticated' not in st.session_state or not st.session_state.authenticated:
+        if restore_session():
+            return
         show_login_form()
         st.stop()
 
 def logout():
     """Logout user"""
+    token = st.query_params.get(SESSION_PARAM)
+    if token:
+        session_tokens.revoke(token)
+        del st.query_params[SESSION_PARAM]
+    
     st.session_state.authenticated = False
     st.session_state.user_email = None
     st.session_state.user_name = None
     st.session_state.user_id = None
+    st.session_state.subscription_tier = None
     st.rerun()
 
 def get_current_user():
@@ -4,19 +4,78 @@ Christian AI tutor that integrates biblical worldview across all subjects
 """
 
 from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from core.rag_engine import BiblicalWorldviewRAG
 from core.guardrails import BiblicalGuardrails
+from core.response_cache import SemanticResponseCache
 from config.worldview_foundation import WORLDVIEW_STATEMENT, get_biblical_context
+from core.concurrency import llm_limiter
 import os
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Earlier exchanges from the student's session sent along with each question
+HISTORY_TURNS = int(os.getenv('EDUCAPP_HISTORY_TURNS', '3'))
+
+
+# Everything in the system prompt that never changes between requests. It must stay
+# byte-identical so Anthropic prompt caching can reuse it - keep per-request values out.
+STATIC_SYSTEM_PROMPT = f"""
+{WORLDVIEW_STATEMENT}
+
+You are a Christian AI tutor helping a student with their studies.
+
+**YOUR ROLE:**
+- Teach the student's subject through a biblical worldview
+- Help students see how their studies relate to God's truth and character
+- Use questions to develop critical thinking (Socratic method)
+- Be patient, encouraging, and academically rigorous
+- Direct theological and personal questions to parents and church leaders
+- Teach biblical truth without compromise
+
+**WHEN TO DIRECT TO PARENTS:**
+- Theological questions requiring pastoral wisdom
+- Topics where Christian families may have different biblical applications
+- Personal or family matters
+- Salvation and personal faith decisions
+
+**RESPONSE STYLE:**
+- Start with encouragement when appropriate
+- Explain concepts clearly with examples
+- Connect subject matter to God's design when natural and relevant
+- End with a thought-provoking question when suitable
+- Maintain academic excellence alongside biblical integration
+- Be concise but thorough
+
+**REMEMBER:**
+You serve parents as primary educators. Your role is to support and empower them, not replace them.
+The Bible is true and authoritative. Jesus is the Way, the Truth, and the Life.
+
+The student details and reference material for this question follow.
+"""
+
+
+def _chunk_text(content):
+    """Text of a streamed message chunk (a string, or a list of content blocks)"""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") for block in content
+        if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+
 class EducAppTutor:
     """
     Faith-Driven AI Tutor for Christian Education
     Biblical worldview integrated across all subjects
+    
+    One instance is shared by every Streamlit session, so it holds no per-user
+    state: everything about the student, including the session's conversation
+    history, arrives as call arguments, and the shared components (retrieval,
+    caches, LLM client) are safe to use from many threads.
     """
     
     def __init__(self):
@@ -30,32 +89,199 @@ class EducAppTutor:
         print("Initializing EducApp Tutor...")
         self.rag_engine = BiblicalWorldviewRAG()
         self.guardrails = BiblicalGuardrails()
-        self.conversation_history = []
+        self.response_cache = SemanticResponseCache()
         print("EducApp Tutor ready!\n")
     
-    def get_response(self, student_question, subject="general", student_grade=None, user_email=None):
+    def get_response(self, student_question, subject="general", student_grade=None, user_email=None,
+                     history=None):
         """
         Main entry point for student questions
         Returns AI tutor response grounded in biblical worldview
         NOW WITH USAGE TRACKING!
+        history: the session's earlier messages, [{"role": "user"|"assistant", "content": ...}]
+        """
+        
+        request = self._prepare_request(student_question, subject, student_grade, history)
+        if request["cached_response"] is not None:
+            return self._finalize_response(request["cached_response"], request["guardrail_check"], request["context"])
+        
+        # Step 6: Generate AI response
+        print("💭 Generating response...")
+        try:
+            with llm_limiter.slot():
+                ai_response = self.llm.invoke(request["messages"])
+            response = ai_response.content
+            
+            # Track token usage and cost
+            if user_email:
+                # Get token counts from response metadata (input_tokens excludes cached tokens)
+                usage = ai_response.response_metadata.get('usage', {})
+                self._track_usage(
+                    user_email,
+                    usage.get('input_tokens', 0),
+                    usage.get('output_tokens', 0),
+                    cache_read_tokens=usage.get('cache_read_input_tokens') or 0,
+                    cache_write_tokens=usage.get('cache_creation_input_tokens') or 0
+                )
+            
+            # Note: Conversation saving is handled in app.py via ConversationManager
+            
+        except Exception as e:
+            response = f"I encountered an error generating a response. Please try again. Error: {str(e)}"
+            print(f"❌ Error: {e}")
+            return response
+        
+        self._cache_response(request, subject, student_grade, response)
+        return self._finalize_response(response, request["guardrail_check"], request["context"])
+    
+    async def aget_response(self, student_question, subject="general", student_grade=None, user_email=None,
+                            history=None):
+        """
+        Async version of get_response
+        Retrieval and bookkeeping run in worker threads; the LLM call is awaited,
+        so one event loop can serve many students while calls are in flight
+        """
+        
+        request = await asyncio.to_thread(self._prepare_request, student_question, subject, student_grade, history)
+        if request["cached_response"] is not None:
+            return self._finalize_response(request["cached_response"], request["guardrail_check"], request["context"])
+        
+        # Step 6: Generate AI response
+        print("💭 Generating response...")
+        try:
+            async with llm_limiter.aslot():
+                ai_response = await self.llm.ainvoke(request["messages"])
+            response = ai_response.content
+            
+            if user_email:
+                usage = ai_response.response_metadata.get('usage', {})
+                await asyncio.to_thread(
+                    self._track_usage,
+                    user_email,
+                    usage.get('input_tokens', 0),
+                    usage.get('output_tokens', 0),
+                    usage.get('cache_read_input_tokens') or 0,
+                    usage.get('cache_creation_input_tokens') or 0
+                )
+        
+        except Exception as e:
+            response = f"I encountered an error generating a response. Please try again. Error: {str(e)}"
+            print(f"❌ Error: {e}")
+            return response
+        
+        self._cache_response(request, subject, student_grade, response)
+        return self._finalize_response(response, request["guardrail_check"], request["context"])
+    
+    def get_response_stream(self, student_question, subject="general", student_grade=None, user_email=None,
+                            history=None):
+        """
+        Streaming version of get_response
+        Yields answer text as the model generates it, then the post-processing
+        trailer (parent guidance, biblical grounding, Scripture excerpt)
+        """
+        
+        request = self._prepare_request(student_question, subject, student_grade, history)
+        if request["cached_response"] is not None:
+            yield self._finalize_response(request["cached_response"], request["guardrail_check"], request["context"])
+            return
+        
+        # Step 6: Stream AI response
+        print("💭 Streaming response...")
+        parts = []
+        usage = {'input_tokens': 0, 'output_tokens': 0, 'cache_read': 0, 'cache_creation': 0}
+        try:
+            # The slot is held until the stream is finished or abandoned
+            with llm_limiter.slot():
+                for chunk in self.llm.stream(request["messages"]):
+                    text = _chunk_text(chunk.content)
+                    if text:
+                        parts.append(text)
+                        yield text
+                    
+                    # Anthropic reports input tokens at the start and output tokens at the end
+                    chunk_usage = getattr(chunk, 'usage_metadata', None) or {}
+                    usage['input_tokens'] += chunk_usage.get('input_tokens') or 0
+                    usage['output_tokens'] += chunk_usage.get('output_tokens') or 0
+                    details = chunk_usage.get('input_token_details') or {}
+                    usage['cache_read'] += details.get('cache_read') or 0
+                    usage['cache_creation'] += details.get('cache_creation') or 0
+        
+        except Exception as e:
+            # Raised so the caller can give the reserved question back
+            print(f"❌ Error: {e}")
+            raise
+        
+        response = "".join(parts)
+        
+        if user_email:
+            # Streamed input_tokens include cached tokens; track the uncached part separately
+            self._track_usage(
+                user_email,
+                max(usage['input_tokens'] - usage['cache_read'] - usage['cache_creation'], 0),
+                usage['output_tokens'],
+                cache_read_tokens=usage['cache_read'],
+                cache_write_tokens=usage['cache_creation']
+            )
+        
+        self._cache_response(request, subject, student_grade, response)
+        
+        # Post-processing only appends, so the trailer is whatever it added
+        trailer = self._finalize_response(response, request["guardrail_check"], request["context"])[len(response):]
+        if trailer:
+            yield trailer
+    
+    def _prepare_request(self, student_question, subject, student_grade, history=None):
+        """
+        Steps shared by get_response, aget_response and get_response_stream:
+        guardrails, semantic cache, retrieval and prompt construction
         """
         
+        # Only the last few exchanges go to the model
+        history = [m for m in (history or []) if m.get("role") in ("user", "assistant")]
+        history = history[max(len(history) - 2 * HISTORY_TURNS, 0):]
+        
         print(f"\n📝 Student Question: {student_question}")
         print(f"📚 Subject: {subject}")
         
         # Step 1: Check for topics requiring parental discussion
         guardrail_check = self.guardrails.check_query(student_question)
         
-        # Step 2: Retrieve relevant context from knowledge base
+        request = {
+            "guardrail_check": guardrail_check,
+            "query_vector": None,
+            "context": None,
+            "messages": None,
+            "cached_response": None,
+            "history": history
+        }
+        
+        # Step 2: Serve near-duplicate questions from the semantic cache
+        query_vector = self.rag_engine.try_embed_query(student_question)
+        request["query_vector"] = query_vector
+        # A follow-up depends on the conversation before it, so it never shares a cached answer
+        if query_vector is not None and not history:
+            cached = self.response_cache.lookup(query_vector, subject, student_grade, guardrail_check)
+            if cached:
+                print(f"⚡ Cache hit (similarity {cached['similarity']:.3f})")
+                request["context"] = {"scripture": cached["scripture"]}
+                request["cached_response"] = cached["response"]
+                return request
+        
+        # Step 3: Retrieve relevant context from knowledge base
         print("🔍 Retrieving biblical worldview context...")
-        context = self.rag_engine.retrieve_context(student_question, subject)
+        # Embedding was already tried above: if it failed, go straight to keyword search
+        context = self.rag_engine.retrieve_context(student_question, subject, query_vector=query_vector, embed=False)
+        timings = context.get("timings", {})
+        if timings:
+            print("⏱️ Retrieval: " + ", ".join(f"{name} {ms:.0f}ms" for name, ms in timings.items()))
+        request["context"] = context
         
-        # Step 3: Get specific biblical context if applicable
+        # Step 4: Get specific biblical context if applicable
         biblical_principle = None
         if guardrail_check["biblical_context_area"]:
             biblical_principle = get_biblical_context(guardrail_check["biblical_context_area"])
         
-        # Step 4: Build system prompt with biblical foundation
+        # Step 5: Build system prompt with biblical foundation
         system_prompt = self._build_system_prompt(
             subject, 
             student_grade, 
@@ -63,57 +289,57 @@ class EducAppTutor:
             biblical_principle
         )
         
-        # Step 5: Generate AI response
-        print("💭 Generating response...")
-        messages = [
-            SystemMessage(content=system_prompt),
-            HumanMessage(content=f"Student question: {student_question}")
-        ]
-        
+        request["messages"] = [SystemMessage(content=system_prompt)]
+        for message in history:
+            if message["role"] == "user":
+                request["messages"].append(HumanMessage(content=f"Student question: {message['content']}"))
+            else:
+                request["messages"].append(AIMessage(content=message["content"]))
+        request["messages"].append(HumanMessage(content=f"Student question: {student_question}"))
+        return request
+    
+    def _track_usage(self, user_email, input_tokens, output_tokens, cache_read_tokens=0, cache_write_tokens=0):
+        """Log token usage and cost for a completed API call"""
         try:
-            ai_response = self.llm.invoke(messages)
-            response = ai_response.content
-            
-            # Track token usage and cost
-            if user_email:
-                try:
-                    # Get token counts from response metadata
-                    usage = ai_response.response_metadata.get('usage', {})
-                    input_tokens = usage.get('input_tokens', 0)
-                    output_tokens = usage.get('output_tokens', 0)
-                    
-                    if input_tokens > 0 and output_tokens > 0:
-                        from core.usage_monitor import track_api_call
-                        estimated_cost = track_api_call(
-                            user_email=user_email,
-                            input_tokens=input_tokens,
-                            output_tokens=output_tokens,
-                            model='claude-3-opus'
-                        )
-                        
-                        print(f"📊 API Call: {input_tokens} in + {output_tokens} out = ${estimated_cost:.4f}")
+            if (input_tokens > 0 or cache_read_tokens > 0 or cache_write_tokens > 0) and output_tokens > 0:
+                from core.usage_monitor import track_api_call
+                estimated_cost = track_api_call(
+                    user_email=user_email,
+                    input_tokens=input_tokens,
+                    output_tokens=output_tokens,
+                    model='claude-3-opus',
+                    cache_read_tokens=cache_read_tokens,
+                    cache_write_tokens=cache_write_tokens
+                )
                 
-                except Exception as e:
-                    print(f"⚠️ Error tracking usage: {e}")
-            
-            # Note: Conversation saving is handled in app.py via ConversationManager
-            
+                print(f"📊 API Call: {input_tokens} in + {cache_read_tokens} cache read + "
+                      f"{cache_write_tokens} cache write + {output_tokens} out = ${estimated_cost:.4f}")
+        
         except Exception as e:
-            response = f"I encountered an error generating a response. Please try again. Error: {str(e)}"
-            print(f"❌ Error: {e}")
-            return response
+            print(f"⚠️ Error tracking usage: {e}")
+    
+    def _cache_response(self, request, subject, student_grade, response):
+        """Only successful answers are cached, before post-processing"""
+        if request["query_vector"] is not None and response and not request["history"]:
+            self.response_cache.store(
+                request["query_vector"], subject, student_grade, request["guardrail_check"],
+                response, request["context"]["scripture"]
+            )
+    
+    def _finalize_response(self, response, guardrail_check, context):
+        """Apply guardrail notes and the Scripture excerpt to a raw answer"""
         
-        # Step 6: Apply guardrails - add parent discussion note if needed
+        # Add parent discussion note if needed
         response = self.guardrails.add_parent_guidance(response, guardrail_check)
         
-        # Step 7: Ensure biblical grounding when relevant
+        # Ensure biblical grounding when relevant
         if guardrail_check["biblical_context_area"]:
             response = self.guardrails.ensure_biblical_grounding(
                 response, 
                 guardrail_check["biblical_context_area"]
             )
         
-        # Step 8: Add Scripture reference if relevant and available
+        # Add Scripture reference if relevant and available
         if context["scripture"] and len(context["scripture"]) > 0:
             scripture_excerpt = context["scripture"][0][:300]
             if not guardrail_check["needs_parent_discussion"]:
@@ -124,66 +350,40 @@ class EducAppTutor:
 
     def _build_system_prompt(self, subject, grade, context, biblical_principle):
         """
-        Create system prompt with biblical worldview and retrieved context
+        Create system prompt content blocks, most stable first:
+        1. STATIC_SYSTEM_PROMPT (identical on every call, cached)
+        2. Biblical principle for the detected topic area (one of a few variants, cached)
+        3. Student details and retrieved context (changes per question)
         """
         
-        # Build curriculum context section
-        curriculum_context = ""
-        if context["curriculum"]:
-            curriculum_context = "**CURRICULUM CONTEXT:**\n" + "\n\n".join(context["curriculum"][:2])
-        
-        # Build biblical worldview context section
-        worldview_context = ""
-        if context["worldview"]:
-            worldview_context = "**BIBLICAL WORLDVIEW CONTEXT:**\n" + "\n\n".join(context["worldview"][:2])
+        blocks = [{
+            "type": "text",
+            "text": STATIC_SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"}
+        }]
         
         # Add specific biblical principle if identified
-        biblical_principle_text = ""
         if biblical_principle:
-            biblical_principle_text = f"""
-**BIBLICAL PRINCIPLE FOR THIS TOPIC:**
+            blocks.append({
+                "type": "text",
+                "text": f"""**BIBLICAL PRINCIPLE FOR THIS TOPIC:**
 Foundation: {biblical_principle['foundation']}
 Scripture: {', '.join(biblical_principle['scripture'])}
-Approach: {biblical_principle['educational_approach']}
-"""
+Approach: {biblical_principle['educational_approach']}""",
+                "cache_control": {"type": "ephemeral"}
+            })
         
-        # Build complete system prompt
-        system_prompt = f"""
-{WORLDVIEW_STATEMENT}
-
-You are a Christian AI tutor helping a student (Grade: {grade or 'Not specified'}) with {subject}.
-
-**YOUR ROLE:**
-- Teach {subject} through a biblical worldview
-- Help students see how their studies relate to God's truth and character
-- Use questions to develop critical thinking (Socratic method)
-- Be patient, encouraging, and academically rigorous
-- Direct theological and personal questions to parents and church leaders
-- Teach biblical truth without compromise
-
-{biblical_principle_text}
-
-{worldview_context}
-
-{curriculum_context}
-
-**WHEN TO DIRECT TO PARENTS:**
-- Theological questions requiring pastoral wisdom
-- Topics where Christian families may have different biblical applications
-- Personal or family matters
-- Salvation and personal faith decisions
-
-**RESPONSE STYLE:**
-- Start with encouragement when appropriate
-- Explain concepts clearly with examples
-- Connect subject matter to God's design when natural and relevant
-- End with a thought-provoking question when suitable
-- Maintain academic excellence alongside biblical integration
-- Be concise but thorough
-
-**REMEMBER:**
-You serve parents as primary educators. Your role is to support and empower them, not replace them.
-The Bible is true and authoritative. Jesus is the Way, the Truth, and the Life.
-"""
+        dynamic_sections = [
+            f"**THIS STUDENT:**\nYou are helping a student (Grade: {grade or 'Not specified'}) with {subject}."
+        ]
+        
+        # Build biblical worldview context section
+        if context["worldview"]:
+            dynamic_sections.append("**BIBLICAL WORLDVIEW CONTEXT:**\n" + "\n\n".join(context["worldview"][:2]))
+        
+        # Build curriculum context section
+        if context["curriculum"]:
+            dynamic_sections.append("**CURRICULUM CONTEXT:**\n" + "\n\n".join(context["curriculum"][:2]))
         
-        return system_prompt
\ No newline at end of file
+        blocks.append({"type": "text", "text": "\n\n".join(dynamic_sections)})
+        return blocks
@@ -0,0 +1,176 @@
+"""
+Concurrency Limits for EducApp
+A process-wide cap on in-flight LLM calls, shared by every session
+Works from Streamlit script threads and from asyncio code alike
+Also a token bucket for in-process rate limits
+"""
+
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv('EDUCAPP_MAX_CONCURRENT_LLM_CALLS', '8'))
+
+
+class _ThreadWaiter:
+    """A blocked thread waiting for a slot"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        self.event.set()
+        return True
+
+
+class _AsyncWaiter:
+    """A coroutine waiting for a slot, possibly on another thread's event loop"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.granted = False
+
+    def grant(self):
+        if self.loop.is_closed() or self.future.done():
+            return False
+        self.granted = True
+        self.loop.call_soon_threadsafe(self._wake)
+        return True
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class ConcurrencyLimiter:
+    """
+    FIFO semaphore across threads and event loops
+    A released slot is handed straight to the longest-waiting caller
+    """
+
+    def __init__(self, limit=MAX_CONCURRENT_LLM_CALLS):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._in_flight = 0
+        self._peak_queue_depth = 0
+        self._completed = 0
+
+    def _try_acquire(self, waiter):
+        """Take a free slot, or queue the waiter. Returns True if a slot was taken."""
+        with self._lock:
+            if self._in_flight < self.limit and not self._waiters:
+                self._in_flight += 1
+                return True
+            self._waiters.append(waiter)
+            self._peak_queue_depth = max(self._peak_queue_depth, len(self._waiters))
+            return False
+
+    def _release(self):
+        with self._lock:
+            self._completed += 1
+            while self._waiters:
+                if self._waiters.popleft().grant():
+                    return
+            self._in_flight -= 1
+
+    def _abandon(self, waiter):
+        """Withdraw a waiter that gave up; pass its slot on if it was already granted"""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return
+        self._release()
+
+    @contextmanager
+    def slot(self):
+        """Hold one slot for the duration of a blocking call"""
+        waiter = _ThreadWaiter()
+        if not self._try_acquire(waiter):
+            print(f"⏳ Waiting for an LLM slot (queue depth {self.queue_depth})")
+            try:
+                waiter.event.wait()
+            except BaseException:
+                self._abandon(waiter)
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Hold one slot for the duration of an awaited call, without blocking the event loop"""
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        if not self._try_acquire(waiter):
+            print(f"⏳ Waiting for an LLM slot (queue depth {self.queue_depth})")
+            try:
+                await waiter.future
+            except BaseException:
+                self._abandon(waiter)
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    @property
+    def queue_depth(self):
+        with self._lock:
+            return len(self._waiters)
+
+    def stats(self):
+        """Current load, for monitoring"""
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'in_flight': self._in_flight,
+                'queue_depth': len(self._waiters),
+                'peak_queue_depth': self._peak_queue_depth,
+                'completed': self._completed
+            }
+
+
+class TokenBucket:
+    """Up to capacity tokens, refilled continuously at refill_per_second"""
+
+    def __init__(self, capacity, refill_per_second, clock=time.monotonic):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def try_take(self):
+        """Take one token if there is one"""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def give_back(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def fill(self):
+        with self._lock:
+            self._tokens = self.capacity
+            self._updated = self.clock()
+
+
+# Shared by every EducAppTutor in the process
+llm_limiter = ConcurrencyLimiter()
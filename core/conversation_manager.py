@@ -3,26 +3,38 @@ Conversation Manager for EducApp
 Handles saving, retrieving, and managing user conversations
 """
 
-from core.database_supabase import SupabaseDatabase
+from core.supabase_client import get_database
 from datetime import datetime
 
+# Search results per page
+SEARCH_PAGE_SIZE = 20
+
+# History list rows: everything but the answer
+SUMMARY_COLUMNS = 'id, question, subject, timestamp'
+
 class ConversationManager:
     def __init__(self):
-        self.db = SupabaseDatabase()
+        self.db = get_database()
     
     def save_conversation(self, user_id, question, answer, subject=None):
         """Save a conversation to database"""
         try:
-            self.db.save_conversation(user_id, question, answer)
+            self.db.save_conversation(user_id, question, answer, subject)
             return True
         except Exception as e:
             print(f"Error saving conversation: {e}")
             return False
     
-    def get_user_conversations(self, user_id, limit=50):
-        """Get user's conversation history"""
+    def get_user_conversations(self, user_id, limit=50, after=None, summaries=False, subject=None):
+        """
+        Get user's conversation history, newest first
+        after: cursor (timestamp, id) from next_cursor() to continue from
+        summaries: leave out answers (load one with get_conversation when it is opened)
+        """
         try:
-            conversations = self.db.get_user_conversations(user_id, limit)
+            columns = SUMMARY_COLUMNS if summaries else '*'
+            conversations = self.db.get_user_conversations(user_id, limit, after=after, columns=columns,
+                                                           subject=subject)
             
             # Format conversations for display
             formatted = []
@@ -30,9 +42,9 @@ class ConversationManager:
                 formatted.append({
                     'id': conv['id'],
                     'question': conv['question'],
-                    'answer': conv['answer'],
+                    'answer': conv.get('answer'),
                     'timestamp': conv['timestamp'],
-                    'subject': 'General',  # Add subject detection if needed
+                    'subject': conv.get('subject') or 'General',
                     'title': None  # Custom titles not yet implemented
                 })
             
@@ -41,6 +53,71 @@ class ConversationManager:
             print(f"Error retrieving conversations: {e}")
             return []
     
+    @staticmethod
+    def next_cursor(conversations, limit):
+        """Cursor for the page after these conversations, or None if this was the last page"""
+        if len(conversations) < limit:
+            return None
+        return (conversations[-1]['timestamp'], conversations[-1]['id'])
+    
+    def get_conversation(self, conversation_id, user_id):
+        """One full conversation (with its answer)"""
+        try:
+            conv = self.db.get_conversation(conversation_id, user_id)
+            if not conv:
+                return None
+            return {
+                'id': conv['id'],
+                'question': conv['question'],
+                'answer': conv['answer'],
+                'timestamp': conv['timestamp'],
+                'subject': conv.get('subject') or 'General',
+                'title': None
+            }
+        except Exception as e:
+            print(f"Error retrieving conversation: {e}")
+            return None
+    
+    def search(self, user_id, query, subject=None, page=1, page_size=SEARCH_PAGE_SIZE):
+        """
+        Search a user's whole history (full-text index), best match first
+        Matches are wrapped in ** in question_highlight and answer_highlight
+        Returns {'results', 'total', 'page', 'pages'}
+        """
+        try:
+            rows, total = self.db.search_conversations(
+                user_id, query, subject, limit=page_size, offset=(page - 1) * page_size)
+            
+            results = [{
+                'id': row['id'],
+                'question': row['question'],
+                'answer': row['answer'],
+                'timestamp': row['timestamp'],
+                'subject': row.get('subject') or 'General',
+                'title': None,
+                'rank': row['rank'],
+                'question_highlight': row['question_highlight'],
+                'answer_highlight': row['answer_highlight']
+            } for row in rows]
+            
+            return {
+                'results': results,
+                'total': total,
+                'page': page,
+                'pages': -(-total // page_size)
+            }
+        except Exception as e:
+            print(f"Error searching conversations: {e}")
+            return {'results': [], 'total': 0, 'page': page, 'pages': 0}
+    
+    def get_subjects(self, user_id):
+        """Subjects to filter a user's history by"""
+        try:
+            return self.db.get_conversation_subjects(user_id)
+        except Exception as e:
+            print(f"Error getting subjects: {e}")
+            return []
+    
     def delete_conversation(self, conversation_id, user_id):
         """Delete a specific conversation"""
         try:
@@ -1,74 +1,214 @@
 # core/database.py
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timezone
 import os
+import queue
+import threading
+from contextlib import contextmanager
 
 # Use educapp_users.db (the one we just fixed)
 DB_PATH = 'educapp_users.db'
 
+# Connection pool settings
+POOL_SIZE = int(os.getenv('EDUCAPP_DB_POOL_SIZE', '8'))
+BUSY_TIMEOUT_SECONDS = 5
+MMAP_SIZE = 256 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 256
+
+
+class ConnectionPool:
+    """
+    Small pool of long-lived SQLite connections in WAL mode
+    Each thread holds at most one connection at a time, so nested calls share it
+    """
+
+    def __init__(self, path, max_connections=POOL_SIZE):
+        self.path = path
+        self._idle = queue.LifoQueue()
+        self._available = threading.BoundedSemaphore(max_connections)
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS,
+                               check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        # WAL lets the dashboards read while the chat app writes
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_SECONDS * 1000}')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow this thread's connection, or check one out of the pool"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # Nested call on the same thread: reuse the outer connection
+            yield conn
+            return
+
+        self._available.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+        except BaseException:
+            self._available.release()
+            raise
+
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+            self._available.release()
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection():
+    """Pooled connection for DB_PATH, used as `with get_connection() as conn:`"""
+    with _pools_lock:
+        pool = _pools.get(DB_PATH)
+        if pool is None:
+            pool = _pools[DB_PATH] = ConnectionPool(DB_PATH)
+    return pool.connection()
+
+
+def _month_key(now=None):
+    """usage_rollup month (UTC, like the Supabase rollup), e.g. '2025-01'"""
+    return (now or datetime.now(timezone.utc)).strftime('%Y-%m')
+
+
+def _month_bounds(now=None):
+    """Half-open range for the (UTC) month, e.g. ('2025-01-01', '2025-02-01')"""
+    # Move to the 1st first: the 31st has no counterpart in a shorter next month
+    month_start = (now or datetime.now(timezone.utc)).replace(day=1)
+    if month_start.month == 12:
+        next_month = month_start.replace(year=month_start.year + 1, month=1)
+    else:
+        next_month = month_start.replace(month=month_start.month + 1)
+    return month_start.strftime('%Y-%m-%d'), next_month.strftime('%Y-%m-%d')
+
+
 def init_database():
     """Initialize SQLite database with all tables"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Users table (with id column)
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  email TEXT UNIQUE NOT NULL,
-                  password_hash TEXT NOT NULL,
-                  name TEXT,
-                  is_parent INTEGER DEFAULT 1,
-                  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                  subscription_status TEXT DEFAULT 'free',
-                  subscription_start_date TIMESTAMP,
-                  stripe_customer_id TEXT,
-                  questions_this_month INTEGER DEFAULT 0,
-                  last_reset_date TEXT)''')
-    
-    # Conversations table (using user_id, not email)
-    c.execute('''CREATE TABLE IF NOT EXISTS conversations
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_id INTEGER NOT NULL,
-                  question TEXT NOT NULL,
-                  answer TEXT NOT NULL,
-                  subject TEXT,
-                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                  FOREIGN KEY (user_id) REFERENCES users(id))''')
-    
-    # Children table (for parent oversight)
-    c.execute('''CREATE TABLE IF NOT EXISTS children
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  parent_email TEXT,
-                  child_email TEXT,
-                  child_name TEXT,
-                  FOREIGN KEY (parent_email) REFERENCES users(email))''')
-    
-    # API Usage table
-    c.execute('''CREATE TABLE IF NOT EXISTS api_usage
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  user_email TEXT,
-                  input_tokens INTEGER,
-                  output_tokens INTEGER,
-                  estimated_cost REAL,
-                  timestamp TIMESTAMP,
-                  model TEXT DEFAULT 'claude-3-opus',
-                  FOREIGN KEY (user_email) REFERENCES users(email))''')
-    
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        # Users table (with id column)
+        c.execute('''CREATE TABLE IF NOT EXISTS users
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      email TEXT UNIQUE NOT NULL,
+                      password_hash TEXT NOT NULL,
+                      name TEXT,
+                      is_parent INTEGER DEFAULT 1,
+                      created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                      subscription_status TEXT DEFAULT 'free',
+                      subscription_start_date TIMESTAMP,
+                      stripe_customer_id TEXT,
+                      questions_this_month INTEGER DEFAULT 0,
+                      last_reset_date TEXT)''')
+        
+        # Conversations table (using user_id, not email)
+        c.execute('''CREATE TABLE IF NOT EXISTS conversations
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER NOT NULL,
+                      question TEXT NOT NULL,
+                      answer TEXT NOT NULL,
+                      subject TEXT,
+                      timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                      FOREIGN KEY (user_id) REFERENCES users(id))''')
+        
+        # Children table (for parent oversight)
+        c.execute('''CREATE TABLE IF NOT EXISTS children
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      parent_email TEXT,
+                      child_email TEXT,
+                      child_name TEXT,
+                      FOREIGN KEY (parent_email) REFERENCES users(email))''')
+        
+        # API Usage table
+        c.execute('''CREATE TABLE IF NOT EXISTS api_usage
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_email TEXT,
+                      input_tokens INTEGER,
+                      output_tokens INTEGER,
+                      estimated_cost REAL,
+                      timestamp TIMESTAMP,
+                      model TEXT DEFAULT 'claude-3-opus',
+                      cache_read_tokens INTEGER DEFAULT 0,
+                      cache_write_tokens INTEGER DEFAULT 0,
+                      FOREIGN KEY (user_email) REFERENCES users(email))''')
+        
+        # Prompt-caching columns for databases created before they existed
+        c.execute('PRAGMA table_info(api_usage)')
+        api_usage_columns = [col[1] for col in c.fetchall()]
+        for column in ('cache_read_tokens', 'cache_write_tokens'):
+            if column not in api_usage_columns:
+                c.execute(f'ALTER TABLE api_usage ADD COLUMN {column} INTEGER DEFAULT 0')
+        
+        # Indexes for per-user history, monthly quotas and the admin dashboards
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_user_conversations
+                     ON conversations(user_id, timestamp DESC)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_api_usage_user_timestamp
+                     ON api_usage(user_email, timestamp)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_api_usage_timestamp
+                     ON api_usage(timestamp)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_users_created_at
+                     ON users(created_at, id)''')
+        c.execute('''CREATE INDEX IF NOT EXISTS idx_users_subscription_status
+                     ON users(subscription_status)''')
+        
+        # Monthly totals per user and model, kept in step with api_usage by log_api_call
+        # (api_calls, not questions: a question can take several calls, and cache hits take none)
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usage_rollup'")
+        backfill_rollup = c.fetchone() is None
+        c.execute('PRAGMA table_info(usage_rollup)')
+        if 'questions' in [col[1] for col in c.fetchall()]:
+            c.execute('ALTER TABLE usage_rollup RENAME COLUMN questions TO api_calls')
+        c.execute('''CREATE TABLE IF NOT EXISTS usage_rollup
+                     (month TEXT NOT NULL,
+                      user_email TEXT NOT NULL,
+                      model TEXT NOT NULL,
+                      api_calls INTEGER DEFAULT 0,
+                      input_tokens INTEGER DEFAULT 0,
+                      output_tokens INTEGER DEFAULT 0,
+                      cache_read_tokens INTEGER DEFAULT 0,
+                      cache_write_tokens INTEGER DEFAULT 0,
+                      estimated_cost REAL DEFAULT 0,
+                      PRIMARY KEY (month, user_email, model)) WITHOUT ROWID''')
+        
+        conn.commit()
     print("✅ Database initialized successfully!")
+    
+    if backfill_rollup:
+        rebuild_usage_rollup()
 
 
 def get_user_id_by_email(email: str) -> int:
     """Get user ID from email address"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
-        result = cursor.fetchone()
-        
-        conn.close()
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT id FROM users WHERE email = ?', (email,))
+            result = cursor.fetchone()
         
         if result:
             return result[0]
@@ -81,86 +221,88 @@ def get_user_id_by_email(email: str) -> int:
 
 def create_user(email, name, password=None):
     """Create a new user account with optional password"""
-    import bcrypt
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    from core.password_hashing import password_hasher
     
     # Hash password if provided
     password_hash = None
     if password:
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        password_hash = password_hasher.hash(password)
     
-    try:
-        c.execute('''INSERT INTO users (email, name, password_hash, created_at, subscription_status)
-                     VALUES (?, ?, ?, ?, 'free')''',
-                  (email, name, password_hash, datetime.now()))
+    with get_connection() as conn:
+        c = conn.cursor()
         
-        conn.commit()
-        print(f"✅ User created: {email}")
-        return True
-    except sqlite3.IntegrityError:
-        print(f"ℹ️ User already exists: {email}")
-        return False
-    finally:
-        conn.close()
+        try:
+            c.execute('''INSERT INTO users (email, name, password_hash, created_at, subscription_status)
+                         VALUES (?, ?, ?, ?, 'free')''',
+                      (email, name, password_hash, datetime.now()))
+            
+            conn.commit()
+            print(f"✅ User created: {email}")
+            return True
+        except sqlite3.IntegrityError:
+            print(f"ℹ️ User already exists: {email}")
+            return False
 
 
 def verify_password(email, password):
     """Verify user password"""
-    import bcrypt
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    from core.password_hashing import password_hasher
     
-    c.execute('SELECT password_hash FROM users WHERE email = ?', (email,))
-    result = c.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('SELECT password_hash FROM users WHERE email = ?', (email,))
+        result = c.fetchone()
     
     if not result or not result[0]:
         return False
     
-    stored_hash = result[0].encode('utf-8')
-    return bcrypt.checkpw(password.encode('utf-8'), stored_hash)
+    matches, new_hash = password_hasher.verify_and_update(password, result[0])
+    
+    # Stored with a different bcrypt cost: re-hash at the configured one
+    if new_hash:
+        with get_connection() as conn:
+            conn.execute('UPDATE users SET password_hash = ? WHERE email = ?', (new_hash, email))
+            conn.commit()
+    
+    return matches
 
 
 def update_password(email, new_password):
     """Update user password"""
-    import bcrypt
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    from core.password_hashing import password_hasher
     
-    password_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    # Hash before taking a connection from the pool
+    password_hash = password_hasher.hash(new_password)
     
-    c.execute('UPDATE users SET password_hash = ? WHERE email = ?', 
-              (password_hash, email))
-    
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('UPDATE users SET password_hash = ? WHERE email = ?', 
+                  (password_hash, email))
+        
+        conn.commit()
     print(f"✅ Password updated for: {email}")
 
 
 def user_exists(email):
     """Check if user exists"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('SELECT email FROM users WHERE email = ?', (email,))
-    result = c.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('SELECT email FROM users WHERE email = ?', (email,))
+        result = c.fetchone()
     
     return result is not None
 
 
 def get_user(email):
     """Get user information"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('SELECT * FROM users WHERE email = ?', (email,))
-    user = c.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('SELECT * FROM users WHERE email = ?', (email,))
+        user = c.fetchone()
     
     return user
 
@@ -194,210 +336,246 @@ def get_conversation_history(user_email, limit=50):
 
 
 def get_monthly_usage(user_email):
-    """Get user's message count for current month"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
+    """Get user's question count for current month (one saved conversation per question)"""
     user_id = get_user_id_by_email(user_email)
     if not user_id:
         return 0
     
-    current_month = datetime.now().strftime('%Y-%m')
-    c.execute('''SELECT COUNT(*) FROM conversations 
-                 WHERE user_id = ? 
-                 AND strftime('%Y-%m', timestamp) = ?''',
-              (user_id, current_month))
-    
-    count = c.fetchone()[0]
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        month_start, month_end = _month_bounds()
+        c.execute('''SELECT COUNT(*) FROM conversations 
+                     WHERE user_id = ? 
+                     AND timestamp >= ? AND timestamp < ?''',
+                  (user_id, month_start, month_end))
+        
+        count = c.fetchone()[0]
     return count
 
 
 def check_subscription_status(user_email):
     """Check if user has paid subscription"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('SELECT subscription_status FROM users WHERE email = ?', (user_email,))
-    result = c.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('SELECT subscription_status FROM users WHERE email = ?', (user_email,))
+        result = c.fetchone()
     
     return result[0] if result else 'free'
 
 
 def upgrade_to_paid(user_email, stripe_customer_id=None):
     """Upgrade user to paid subscription"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''UPDATE users 
-                 SET subscription_status = 'paid',
-                     subscription_start_date = ?,
-                     stripe_customer_id = ?
-                 WHERE email = ?''',
-              (datetime.now(), stripe_customer_id, user_email))
-    
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('''UPDATE users 
+                     SET subscription_status = 'paid',
+                         subscription_start_date = ?,
+                         stripe_customer_id = ?
+                     WHERE email = ?''',
+                  (datetime.now(), stripe_customer_id, user_email))
+        
+        conn.commit()
     print(f"✅ User upgraded to paid: {user_email}")
 
 
 def link_child(parent_email, child_email, child_name):
     """Link a child account to a parent"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''INSERT INTO children (parent_email, child_email, child_name)
-                 VALUES (?, ?, ?)''', (parent_email, child_email, child_name))
-    
-    conn.commit()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('''INSERT INTO children (parent_email, child_email, child_name)
+                     VALUES (?, ?, ?)''', (parent_email, child_email, child_name))
+        
+        conn.commit()
 
 
 def get_children(parent_email):
     """Get all children linked to a parent"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''SELECT child_email, child_name FROM children 
-                 WHERE parent_email = ?''', (parent_email,))
-    
-    children = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('''SELECT child_email, child_name FROM children 
+                     WHERE parent_email = ?''', (parent_email,))
+        
+        children = c.fetchall()
     return children
 
 
 # API Usage tracking functions
 
-def log_api_call(user_email, input_tokens, output_tokens, estimated_cost, model='claude-3-opus'):
-    """Log API usage to database"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''INSERT INTO api_usage 
-                 (user_email, input_tokens, output_tokens, estimated_cost, timestamp, model)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-              (user_email, input_tokens, output_tokens, estimated_cost, datetime.now(), model))
-    
-    conn.commit()
-    conn.close()
+def log_api_call(user_email, input_tokens, output_tokens, estimated_cost, model='claude-3-opus',
+                 cache_read_tokens=0, cache_write_tokens=0):
+    """Log API usage to database and add it to the monthly rollup in the same transaction"""
+    now = datetime.now()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('''INSERT INTO api_usage 
+                     (user_email, input_tokens, output_tokens, estimated_cost, timestamp, model,
+                      cache_read_tokens, cache_write_tokens)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                  (user_email, input_tokens, output_tokens, estimated_cost, now, model,
+                   cache_read_tokens, cache_write_tokens))
+        
+        c.execute('''INSERT INTO usage_rollup 
+                     (month, user_email, model, api_calls, input_tokens, output_tokens,
+                      cache_read_tokens, cache_write_tokens, estimated_cost)
+                     VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+                     ON CONFLICT (month, user_email, model) DO UPDATE SET
+                         api_calls = api_calls + 1,
+                         input_tokens = input_tokens + excluded.input_tokens,
+                         output_tokens = output_tokens + excluded.output_tokens,
+                         cache_read_tokens = cache_read_tokens + excluded.cache_read_tokens,
+                         cache_write_tokens = cache_write_tokens + excluded.cache_write_tokens,
+                         estimated_cost = estimated_cost + excluded.estimated_cost''',
+                  (_month_key(now.astimezone(timezone.utc)), user_email, model, input_tokens, output_tokens,
+                   cache_read_tokens, cache_write_tokens, estimated_cost))
+        
+        conn.commit()
+
+
+def rebuild_usage_rollup():
+    """Recompute usage_rollup from api_usage (backfills, or after editing api_usage by hand)"""
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('DELETE FROM usage_rollup')
+        # api_usage holds local times; months are UTC, as in log_api_call
+        c.execute('''INSERT INTO usage_rollup 
+                     (month, user_email, model, api_calls, input_tokens, output_tokens,
+                      cache_read_tokens, cache_write_tokens, estimated_cost)
+                     SELECT 
+                         strftime('%Y-%m', timestamp, 'utc'),
+                         user_email,
+                         COALESCE(model, 'claude-3-opus'),
+                         COUNT(*),
+                         COALESCE(SUM(input_tokens), 0),
+                         COALESCE(SUM(output_tokens), 0),
+                         COALESCE(SUM(cache_read_tokens), 0),
+                         COALESCE(SUM(cache_write_tokens), 0),
+                         COALESCE(SUM(estimated_cost), 0)
+                     FROM api_usage
+                     WHERE user_email IS NOT NULL AND timestamp IS NOT NULL
+                     GROUP BY 1, 2, 3''')
+        rows = c.rowcount
+        
+        conn.commit()
+    print(f"✅ Usage rollup rebuilt: {rows} rows")
+    return rows
 
 
 def get_monthly_cost(user_email):
     """Get user's total API cost for current month"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    current_month = datetime.now().strftime('%Y-%m')
-    c.execute('''SELECT COALESCE(SUM(estimated_cost), 0) as total_cost
-                 FROM api_usage 
-                 WHERE user_email = ? 
-                 AND strftime('%Y-%m', timestamp) = ?''',
-              (user_email, current_month))
-    
-    cost = c.fetchone()[0]
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('''SELECT COALESCE(SUM(estimated_cost), 0) as total_cost
+                     FROM usage_rollup 
+                     WHERE month = ? AND user_email = ?''',
+                  (_month_key(), user_email))
+        
+        cost = c.fetchone()[0]
     return cost
 
 
 def get_all_users_stats():
     """Get statistics for all users (admin dashboard)"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Total users by subscription type
-    c.execute('''SELECT subscription_status, COUNT(*) as count 
-                 FROM users 
-                 GROUP BY subscription_status''')
-    user_stats = c.fetchall()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        # Total users by subscription type
+        c.execute('''SELECT subscription_status, COUNT(*) as count 
+                     FROM users 
+                     GROUP BY subscription_status''')
+        user_stats = c.fetchall()
     
-    conn.close()
     return dict(user_stats)
 
 
 def get_monthly_api_costs():
     """Get total API costs for current month (admin dashboard)"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    current_month = datetime.now().strftime('%Y-%m')
-    c.execute('''SELECT 
-                     COUNT(*) as total_calls,
-                     SUM(input_tokens) as total_input_tokens,
-                     SUM(output_tokens) as total_output_tokens,
-                     SUM(estimated_cost) as total_cost,
-                     AVG(estimated_cost) as avg_cost_per_call
-                 FROM api_usage
-                 WHERE strftime('%Y-%m', timestamp) = ?''',
-              (current_month,))
-    
-    stats = c.fetchone()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('''SELECT 
+                         SUM(api_calls) as total_calls,
+                         SUM(input_tokens) as total_input_tokens,
+                         SUM(output_tokens) as total_output_tokens,
+                         SUM(estimated_cost) as total_cost,
+                         SUM(estimated_cost) / SUM(api_calls) as avg_cost_per_call,
+                         SUM(cache_read_tokens) as total_cache_read_tokens,
+                         SUM(cache_write_tokens) as total_cache_write_tokens
+                     FROM usage_rollup
+                     WHERE month = ?''',
+                  (_month_key(),))
+        
+        stats = c.fetchone()
     
     return {
         'total_calls': stats[0] or 0,
         'total_input_tokens': stats[1] or 0,
         'total_output_tokens': stats[2] or 0,
         'total_cost': stats[3] or 0,
-        'avg_cost_per_call': stats[4] or 0
+        'avg_cost_per_call': stats[4] or 0,
+        'total_cache_read_tokens': stats[5] or 0,
+        'total_cache_write_tokens': stats[6] or 0
     }
 
 
 def get_top_users_by_cost(limit=10):
     """Get top users by API cost (admin dashboard)"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    current_month = datetime.now().strftime('%Y-%m')
-    c.execute('''SELECT 
-                     u.email,
-                     u.name,
-                     u.subscription_status,
-                     COUNT(a.id) as total_calls,
-                     SUM(a.estimated_cost) as total_cost
-                 FROM users u
-                 LEFT JOIN api_usage a ON u.email = a.user_email
-                 WHERE strftime('%Y-%m', a.timestamp) = ?
-                 GROUP BY u.email
-                 ORDER BY total_cost DESC
-                 LIMIT ?''',
-              (current_month, limit))
-    
-    top_users = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('''SELECT 
+                         u.email,
+                         u.name,
+                         u.subscription_status,
+                         SUM(r.api_calls) as total_calls,
+                         SUM(r.estimated_cost) as total_cost
+                     FROM usage_rollup r
+                     JOIN users u ON u.email = r.user_email
+                     WHERE r.month = ?
+                     GROUP BY u.email
+                     ORDER BY total_cost DESC
+                     LIMIT ?''',
+                  (_month_key(), limit))
+        
+        top_users = c.fetchall()
     return top_users
 
 
 def get_recent_api_calls(limit=20):
     """Get recent API calls (admin dashboard)"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('''SELECT 
-                     user_email,
-                     input_tokens,
-                     output_tokens,
-                     estimated_cost,
-                     timestamp,
-                     model
-                 FROM api_usage
-                 ORDER BY timestamp DESC
-                 LIMIT ?''', (limit,))
-    
-    recent = c.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('''SELECT 
+                         user_email,
+                         input_tokens,
+                         output_tokens,
+                         estimated_cost,
+                         timestamp,
+                         model
+                     FROM api_usage
+                     ORDER BY timestamp DESC
+                     LIMIT ?''', (limit,))
+        
+        recent = c.fetchall()
     return recent
 
 
 def get_user_subscription_status(email):
     """Get user's current subscription status"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute('SELECT subscription_status FROM users WHERE email = ?', (email,))
-    result = c.fetchone()
+    with get_connection() as conn:
+        c = conn.cursor()
+        
+        c.execute('SELECT subscription_status FROM users WHERE email = ?', (email,))
+        result = c.fetchone()
     
-    conn.close()
     
     if result:
         return result[0]
@@ -405,7 +583,14 @@ def get_user_subscription_status(email):
 
 
 if __name__ == "__main__":
-    # Initialize database when run directly
-    init_database()
-    print("\n🎉 Database setup complete!")
-    print("Tables created: users, conversations, children, api_usage")
\ No newline at end of file
+    import sys
+    
+    if sys.argv[1:] == ['rebuild-rollup']:
+        # python -m core.database rebuild-rollup
+        init_database()
+        rebuild_usage_rollup()
+    else:
+        # Initialize database when run directly
+        init_database()
+        print("\n🎉 Database setup complete!")
+        print("Tables created: users, conversations, children, api_usage, usage_rollup")
\ No newline at end of file
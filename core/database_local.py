@@ -0,0 +1,488 @@
+"""
+Local Database for EducApp
+SQLite stand-in with the same interface as SupabaseDatabase, for development
+and tests without the live service (EDUCAPP_DB_BACKEND=local)
+Set EDUCAPP_LOCAL_DB_PATH=:memory: for a throwaway in-memory database
+"""
+
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone, timedelta
+from core.password_hashing import password_hasher
+
+LOCAL_DB_PATH = os.getenv('EDUCAPP_LOCAL_DB_PATH', './educapp_local.db')
+
+# usage_rollup counters
+USAGE_FIELDS = ('api_calls', 'input_tokens', 'output_tokens', 'cache_read_tokens',
+                'cache_write_tokens', 'estimated_cost')
+
+# Same projection and page size as SupabaseDatabase
+ADMIN_USER_COLUMNS = 'id, email, name, created_at, subscription_status, questions_asked, last_reset_date'
+USERS_PAGE_SIZE = 500
+
+# period -> start of the period containing created_at
+SIGNUP_PERIODS = {
+    'day': "date(created_at)",
+    'week': "date(created_at, '-6 days', 'weekday 1')",
+    'month': "date(created_at, 'start of month')"
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT,
+    name TEXT,
+    google_id TEXT,
+    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    subscription_status TEXT DEFAULT 'free',
+    subscription_id TEXT,
+    questions_asked INTEGER DEFAULT 0,
+    last_reset_date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_users_google_id ON users(google_id);
+CREATE INDEX IF NOT EXISTS idx_users_subscription_status ON users(subscription_status);
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_users_last_reset_date ON users(last_reset_date);
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    subject TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_user_timestamp ON conversations(user_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations(timestamp);
+
+CREATE TABLE IF NOT EXISTS api_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_email TEXT NOT NULL,
+    input_tokens INTEGER DEFAULT 0,
+    output_tokens INTEGER DEFAULT 0,
+    cache_read_tokens INTEGER DEFAULT 0,
+    cache_write_tokens INTEGER DEFAULT 0,
+    estimated_cost REAL DEFAULT 0,
+    model TEXT DEFAULT 'claude-3-opus',
+    timestamp TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS usage_rollup (
+    month TEXT NOT NULL,
+    user_email TEXT NOT NULL,
+    model TEXT NOT NULL,
+    api_calls INTEGER DEFAULT 0,
+    input_tokens INTEGER DEFAULT 0,
+    output_tokens INTEGER DEFAULT 0,
+    cache_read_tokens INTEGER DEFAULT 0,
+    cache_write_tokens INTEGER DEFAULT 0,
+    estimated_cost REAL DEFAULT 0,
+    PRIMARY KEY (month, user_email, model)
+) WITHOUT ROWID;
+'''
+
+# Full-text index over conversations; the triggers keep it in step with every
+# insert, update and delete (external content: the text is stored only once)
+SEARCH_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+    question, answer, content='conversations', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+    INSERT INTO conversations_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+    INSERT INTO conversations_fts (conversations_fts, rowid, question, answer)
+    VALUES ('delete', old.id, old.question, old.answer);
+END;
+CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF question, answer ON conversations BEGIN
+    INSERT INTO conversations_fts (conversations_fts, rowid, question, answer)
+    VALUES ('delete', old.id, old.question, old.answer);
+    INSERT INTO conversations_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+END;
+'''
+
+# bm25 column weights: question matches count double
+SEARCH_QUERY = '''
+SELECT c.id, c.question, c.answer, c.subject, c.timestamp,
+       bm25(conversations_fts, 2.0, 1.0) AS rank,
+       highlight(conversations_fts, 0, '**', '**') AS question_highlight,
+       snippet(conversations_fts, 1, '**', '**', ' … ', 30) AS answer_highlight
+FROM conversations_fts
+JOIN conversations c ON c.id = conversations_fts.rowid
+WHERE conversations_fts MATCH ? AND c.user_id = ? AND (? IS NULL OR c.subject = ?)
+ORDER BY rank, c.timestamp DESC, c.id DESC
+LIMIT ? OFFSET ?
+'''
+
+# The match set is computed once, then filtered by user (not one MATCH per user row)
+SEARCH_COUNT = '''
+SELECT COUNT(*) AS total
+FROM conversations c
+WHERE c.id IN (SELECT rowid FROM conversations_fts WHERE conversations_fts MATCH ?)
+  AND c.user_id = ? AND (? IS NULL OR c.subject = ?)
+'''
+
+ROLLUP_UPSERT = '''
+INSERT INTO usage_rollup (month, user_email, model, api_calls, input_tokens, output_tokens,
+                          cache_read_tokens, cache_write_tokens, estimated_cost)
+VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+ON CONFLICT (month, user_email, model) DO UPDATE SET
+    api_calls = api_calls + 1,
+    input_tokens = input_tokens + excluded.input_tokens,
+    output_tokens = output_tokens + excluded.output_tokens,
+    cache_read_tokens = cache_read_tokens + excluded.cache_read_tokens,
+    cache_write_tokens = cache_write_tokens + excluded.cache_write_tokens,
+    estimated_cost = estimated_cost + excluded.estimated_cost
+'''
+
+
+def _utc_today():
+    """Today in UTC, the date the rpcs get from current_date"""
+    return datetime.now(timezone.utc).date()
+
+
+def _utc_month(timestamp=None):
+    """usage_rollup month ('YYYY-MM', UTC) for an ISO timestamp, default now"""
+    moment = datetime.fromisoformat(timestamp) if timestamp else datetime.now(timezone.utc)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc)
+    return moment.strftime('%Y-%m')
+
+
+def _fts_query(text):
+    """FTS5 MATCH expression for free text: every word must appear, the last may be a prefix"""
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class LocalDatabase:
+    """
+    SupabaseDatabase over one SQLite connection
+    Rows come back as dicts shaped like the Supabase responses
+    """
+
+    def __init__(self, path=LOCAL_DB_PATH):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock:
+            rollup_columns = [row['name'] for row in self._conn.execute('PRAGMA table_info(usage_rollup)')]
+            if 'questions' in rollup_columns:
+                # The rollup always counted API calls (009_rollup_api_calls.sql)
+                self._conn.execute('ALTER TABLE usage_rollup RENAME COLUMN questions TO api_calls')
+            self._conn.executescript(SCHEMA)
+            columns = [row['name'] for row in self._conn.execute('PRAGMA table_info(conversations)')]
+            if 'subject' not in columns:
+                self._conn.execute('ALTER TABLE conversations ADD COLUMN subject TEXT')
+            index_exists = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'conversations_fts'").fetchone()
+            self._conn.executescript(SEARCH_SCHEMA)
+            if not index_exists:
+                # Index conversations saved before search existed
+                self._conn.execute("INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')")
+            self._conn.commit()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    # USER MANAGEMENT
+    def create_user(self, email, password=None, name=None, google_id=None):
+        """Create new user"""
+        password_hash = None
+        if password:
+            password_hash = password_hasher.hash(password)
+
+        try:
+            cursor = self._execute(
+                '''INSERT INTO users (email, password_hash, name, google_id, last_reset_date,
+                                      questions_asked, subscription_status)
+                   VALUES (?, ?, ?, ?, ?, 0, 'free')''',
+                (email, password_hash, name, google_id, _utc_today().isoformat()))
+            return cursor.lastrowid
+
+        except Exception as e:
+            print(f"Error creating user: {e}")
+            return None
+
+    def get_user_by_email(self, email):
+        """Get user by email"""
+        rows = self._query('SELECT * FROM users WHERE email = ?', (email,))
+        return rows[0] if rows else None
+
+    def get_user_by_google_id(self, google_id):
+        """Get user by Google ID"""
+        rows = self._query('SELECT * FROM users WHERE google_id = ?', (google_id,))
+        return rows[0] if rows else None
+
+    def verify_password(self, email, password):
+        """Verify user password"""
+        user = self.get_user_by_email(email)
+        if not user or not user.get('password_hash'):
+            return False
+
+        try:
+            matches, new_hash = password_hasher.verify_and_update(password, user['password_hash'])
+        except:
+            return False
+
+        # Stored with a different bcrypt cost: re-hash at the configured one
+        if new_hash:
+            self._execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user['id']))
+        return matches
+
+    def update_password(self, email, new_password):
+        """Set a new password; returns the user's id, or None if there is no such user"""
+        password_hash = password_hasher.hash(new_password)
+        user = self.get_user_by_email(email)
+        if not user:
+            return None
+        self._execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hash, user['id']))
+        return user['id']
+
+    def update_subscription(self, email, status, subscription_id=None):
+        """Update user subscription"""
+        self._execute('UPDATE users SET subscription_status = ?, subscription_id = ? WHERE email = ?',
+                      (status, subscription_id, email))
+
+    # CONVERSATION MANAGEMENT
+    def save_conversation(self, user_id, question, answer, subject=None):
+        """Save conversation"""
+        self.save_conversations([{
+            'user_id': user_id,
+            'question': question,
+            'answer': answer,
+            'subject': subject,
+            'timestamp': datetime.now().isoformat()
+        }])
+
+    def save_conversations(self, conversations):
+        """Bulk insert conversations (dicts with user_id, question, answer, subject, timestamp)"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO conversations (user_id, question, answer, subject, timestamp) VALUES (?, ?, ?, ?, ?)',
+                [(conv['user_id'], conv['question'], conv['answer'], conv.get('subject'), conv['timestamp'])
+                 for conv in conversations])
+
+    def get_user_conversations(self, user_id, limit=50, after=None, columns='*', subject=None):
+        """Get user conversations, newest first, after a (timestamp, id) cursor"""
+        sql = f'SELECT {columns} FROM conversations WHERE user_id = ?'
+        params = (user_id,)
+        if subject:
+            sql += ' AND subject = ?'
+            params += (subject,)
+        if after:
+            sql += ' AND (timestamp, id) < (?, ?)'
+            params += tuple(after)
+        return self._query(sql + ' ORDER BY timestamp DESC, id DESC LIMIT ?', params + (limit,))
+
+    def get_conversation(self, conversation_id, user_id):
+        """One full conversation, if it belongs to this user"""
+        rows = self._query('SELECT * FROM conversations WHERE id = ? AND user_id = ?',
+                           (conversation_id, user_id))
+        return rows[0] if rows else None
+
+    def search_conversations(self, user_id, query, subject=None, limit=20, offset=0):
+        """
+        Full-text search of a user's conversations, best match first
+        Returns (rows with rank and ** highlights, total matches)
+        """
+        match = _fts_query(query)
+        if not match:
+            return [], 0
+        params = (match, user_id, subject, subject)
+        with self._lock:
+            rows = self._query(SEARCH_QUERY, params + (limit, offset))
+            total = self._query(SEARCH_COUNT, params)[0]['total']
+        return rows, total
+
+    def get_conversation_subjects(self, user_id):
+        """Subjects this user has conversations in"""
+        rows = self._query('''SELECT DISTINCT subject FROM conversations
+                              WHERE user_id = ? AND subject IS NOT NULL ORDER BY subject''', (user_id,))
+        return [row['subject'] for row in rows]
+
+    def delete_conversation(self, conversation_id, user_id):
+        """Delete specific conversation"""
+        self._execute('DELETE FROM conversations WHERE id = ? AND user_id = ?', (conversation_id, user_id))
+
+    def clear_user_conversations(self, user_id):
+        """Clear all conversations for user"""
+        self._execute('DELETE FROM conversations WHERE user_id = ?', (user_id,))
+
+    # USAGE TRACKING
+    def increment_questions_asked(self, user_id, amount=1):
+        """Increment question count; returns the new count"""
+        with self._lock, self._conn:
+            row = self._conn.execute('''UPDATE users SET questions_asked = COALESCE(questions_asked, 0) + ?
+                                        WHERE id = ? RETURNING questions_asked''', (amount, user_id)).fetchone()
+        return row[0] if row else None
+
+    def increment_questions_asked_batch(self, increments):
+        """Add amounts to several users' question counts ([{user_id, amount}, ...])"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE users SET questions_asked = COALESCE(questions_asked, 0) + ? WHERE id = ?',
+                [(increment['amount'], increment['user_id']) for increment in increments])
+
+    def reserve_question(self, email, free_limit):
+        """
+        Check the quota and count one question against it (same rules as the reserve_question rpc)
+        Returns {user_id, questions_used, over_limit, is_paid}, or None for unknown users
+        """
+        with self._lock:
+            user = self.get_user_by_email(email)
+            if not user:
+                return None
+
+            used = user['questions_asked'] or 0
+            last_reset = user['last_reset_date']
+            today = _utc_today()
+            if last_reset and last_reset[:7] < today.strftime('%Y-%m'):
+                used = 0
+                last_reset = today.isoformat()
+
+            paid = user['subscription_status'] == 'active'
+            over = not paid and used >= free_limit
+            if not over:
+                used += 1
+
+            self._execute('UPDATE users SET questions_asked = ?, last_reset_date = ? WHERE id = ?',
+                          (used, last_reset, user['id']))
+
+        return {'user_id': user['id'], 'questions_used': used, 'over_limit': over, 'is_paid': paid}
+
+    def release_question(self, user_id, month):
+        """Give back a question reserved in month ('YYYY-MM') if that month is still current"""
+        if month != _utc_today().strftime('%Y-%m'):
+            return
+        self._execute('''UPDATE users SET questions_asked = MAX(COALESCE(questions_asked, 0) - 1, 0)
+                         WHERE id = ?''', (user_id,))
+
+    def log_api_call(self, user_email, input_tokens, output_tokens, estimated_cost, model='claude-3-opus',
+                     cache_read_tokens=0, cache_write_tokens=0):
+        """Log an API call and add it to usage_rollup in one transaction"""
+        self.log_api_calls([{
+            'user_email': user_email,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'estimated_cost': estimated_cost,
+            'model': model,
+            'cache_read_tokens': cache_read_tokens,
+            'cache_write_tokens': cache_write_tokens
+        }])
+
+    def log_api_calls(self, calls):
+        """Bulk log API calls in one transaction; each is rolled up into its own month"""
+        with self._lock, self._conn:
+            for call in calls:
+                timestamp = call.get('timestamp') or datetime.now(timezone.utc).isoformat()
+                model = call.get('model') or 'claude-3-opus'
+                tokens = (call['input_tokens'], call['output_tokens'],
+                          call.get('cache_read_tokens') or 0, call.get('cache_write_tokens') or 0)
+                self._conn.execute(
+                    '''INSERT INTO api_usage (user_email, input_tokens, output_tokens, cache_read_tokens,
+                                              cache_write_tokens, estimated_cost, model, timestamp)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (call['user_email'], *tokens, call['estimated_cost'], model, timestamp))
+                self._conn.execute(ROLLUP_UPSERT, (_utc_month(timestamp), call['user_email'], model,
+                                                   *tokens, call['estimated_cost']))
+
+    def get_monthly_usage_rollup(self, user_email, month=None):
+        """User's usage for a month ('YYYY-MM', UTC; default current), summed over models"""
+        sums = ', '.join(f'COALESCE(SUM({field}), 0) AS {field}' for field in USAGE_FIELDS)
+        rows = self._query(f'SELECT {sums} FROM usage_rollup WHERE month = ? AND user_email = ?',
+                           (month or _utc_month(), user_email))
+        return rows[0]
+
+    def get_monthly_usage_totals(self, month=None):
+        """Usage across all users for a month ('YYYY-MM', UTC; default current)"""
+        sums = ', '.join(f'COALESCE(SUM({field}), 0) AS {field}' for field in USAGE_FIELDS)
+        rows = self._query(f'SELECT {sums} FROM usage_rollup WHERE month = ?', (month or _utc_month(),))
+        return rows[0]
+
+    def rebuild_usage_rollup(self):
+        """Recompute usage_rollup from api_usage (backfills)"""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM usage_rollup')
+            rows = []
+            for row in self._conn.execute('SELECT * FROM api_usage'):
+                rows.append((_utc_month(row['timestamp']), row['user_email'], row['model'],
+                             row['input_tokens'], row['output_tokens'], row['cache_read_tokens'],
+                             row['cache_write_tokens'], row['estimated_cost']))
+            self._conn.executemany(ROLLUP_UPSERT, rows)
+            return self._conn.execute('SELECT COUNT(*) FROM usage_rollup').fetchone()[0]
+
+    def reset_monthly_questions(self, user_id):
+        """Reset monthly question count"""
+        self._execute('UPDATE users SET questions_asked = 0, last_reset_date = ? WHERE id = ?',
+                      (_utc_today().isoformat(), user_id))
+
+    def reset_monthly_questions_batch(self, month_start, batch_size):
+        """Reset up to batch_size users whose counters are from before month_start (a date)"""
+        cursor = self._execute('''UPDATE users SET questions_asked = 0, last_reset_date = ?
+                                  WHERE id IN (SELECT id FROM users WHERE last_reset_date < ?
+                                               ORDER BY id LIMIT ?)''',
+                               (month_start.isoformat(), month_start.isoformat(), batch_size))
+        return cursor.rowcount
+
+    # ADMIN FUNCTIONS
+    def get_users_page(self, after=None, limit=USERS_PAGE_SIZE, columns=ADMIN_USER_COLUMNS):
+        """One page of users, newest first; returns (users, next cursor or None)"""
+        sql = f'SELECT {columns} FROM users'
+        params = ()
+        if after:
+            sql += ' WHERE (created_at, id) < (?, ?)'
+            params = tuple(after)
+        users = self._query(sql + ' ORDER BY created_at DESC, id DESC LIMIT ?', params + (limit,))
+        next_cursor = (users[-1]['created_at'], users[-1]['id']) if len(users) == limit else None
+        return users, next_cursor
+
+    def get_all_users(self, columns=ADMIN_USER_COLUMNS, page_size=USERS_PAGE_SIZE):
+        """Iterate over all users (admin), newest first, one page per query"""
+        cursor = None
+        while True:
+            users, cursor = self.get_users_page(cursor, page_size, columns)
+            yield from users
+            if cursor is None:
+                return
+
+    def get_user_stats(self, month=None):
+        """User counts by status, questions and signups for a month ('YYYY-MM', UTC; default current)"""
+        month = month or _utc_month()
+        stats = self._query('''SELECT COUNT(*) AS total_users,
+                                      COALESCE(SUM(subscription_status = 'active'), 0) AS paid_users,
+                                      COALESCE(SUM(subscription_status = 'free'), 0) AS free_users,
+                                      COALESCE(SUM(substr(created_at, 1, 7) = ?), 0) AS new_users
+                               FROM users''', (month,))[0]
+        # One saved conversation per answered question
+        month_start = datetime.strptime(month, '%Y-%m')
+        next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        stats['total_questions'] = self._query(
+            'SELECT COUNT(*) AS total FROM conversations WHERE timestamp >= ? AND timestamp < ?',
+            (month_start.strftime('%Y-%m-01'), next_month.strftime('%Y-%m-01')))[0]['total']
+        return stats
+
+    def get_signups(self, period='day', since=None):
+        """Signups per 'day', 'week' or 'month' since a datetime (default last 30 days)"""
+        if period not in SIGNUP_PERIODS:
+            print(f"Error getting signups: unknown period {period}")
+            return []
+        since = since or datetime.now(timezone.utc) - timedelta(days=30)
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return self._query(f'''SELECT {SIGNUP_PERIODS[period]} AS period_start, COUNT(*) AS signups
+                                FROM users WHERE created_at >= ?
+                                GROUP BY period_start ORDER BY period_start''', (since.isoformat(),))
@@ -4,13 +4,24 @@ Uses Supabase REST API instead of direct PostgreSQL
 """
 
 import os
-from supabase import create_client, Client
-from datetime import datetime
-import bcrypt
+from supabase import Client
+from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
+from core.user_cache import user_cache
+from core.password_hashing import password_hasher
+from core.supabase_client import create_supabase_client
 
 load_dotenv()
 
+# usage_rollup counters
+USAGE_FIELDS = ('api_calls', 'input_tokens', 'output_tokens', 'cache_read_tokens',
+                'cache_write_tokens', 'estimated_cost')
+USER_STATS_FIELDS = ('total_users', 'paid_users', 'free_users', 'total_questions', 'new_users')
+
+# Admin listings fetch only these columns, a page at a time
+ADMIN_USER_COLUMNS = 'id, email, name, created_at, subscription_status, questions_asked, last_reset_date'
+USERS_PAGE_SIZE = 500
+
 class SupabaseDatabase:
     def __init__(self):
         # Use Supabase REST API
@@ -20,7 +31,7 @@ class SupabaseDatabase:
         if not self.url or not self.key:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env file")
         
-        self.client: Client = create_client(self.url, self.key)
+        self.client: Client = create_supabase_client(self.url, self.key)
         # Note: Table creation should be done via Supabase Dashboard SQL editor
     
     # USER MANAGEMENT
@@ -28,7 +39,7 @@ class SupabaseDatabase:
         """Create new user"""
         password_hash = None
         if password:
-            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+            password_hash = password_hasher.hash(password)
         
         try:
             data = {
@@ -36,7 +47,7 @@ class SupabaseDatabase:
                 'password_hash': password_hash,
                 'name': name,
                 'google_id': google_id,
-                'last_reset_date': datetime.now().date().isoformat(),
+                'last_reset_date': datetime.now(timezone.utc).date().isoformat(),
                 'questions_asked': 0,
                 'subscription_status': 'free'
             }
@@ -52,11 +63,16 @@ class SupabaseDatabase:
             return None
     
     def get_user_by_email(self, email):
-        """Get user by email"""
+        """Get user by email (served from the shared user cache when fresh)"""
+        user = user_cache.get(email)
+        if user is not None:
+            return user
+        
         try:
             response = self.client.table('users').select('*').eq('email', email).execute()
             
             if response.data and len(response.data) > 0:
+                user_cache.put(response.data[0])
                 return response.data[0]
             return None
             
@@ -70,6 +86,7 @@ class SupabaseDatabase:
             response = self.client.table('users').select('*').eq('google_id', google_id).execute()
             
             if response.data and len(response.data) > 0:
+                user_cache.put(response.data[0])
                 return response.data[0]
             return None
             
@@ -84,9 +101,37 @@ class SupabaseDatabase:
             return False
         
         try:
-            return bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8'))
+            matches, new_hash = password_hasher.verify_and_update(password, user['password_hash'])
         except:
             return False
+        
+        # Stored with a different bcrypt cost: re-hash at the configured one
+        if new_hash:
+            try:
+                self.client.table('users').update({'password_hash': new_hash}).eq('id', user['id']).execute()
+            except Exception as e:
+                print(f"Error re-hashing password: {e}")
+            user_cache.invalidate(email=email)
+        
+        return matches
+    
+    def update_password(self, email, new_password):
+        """Set a new password; returns the user's id, or None if it failed"""
+        # Hash before the request so a slow bcrypt never holds the HTTP session
+        password_hash = password_hasher.hash(new_password)
+        
+        try:
+            response = self.client.table('users').update({'password_hash': password_hash})\
+                .eq('email', email).execute()
+            
+            user_cache.invalidate(email=email)
+            if response.data and len(response.data) > 0:
+                return response.data[0]['id']
+            return None
+            
+        except Exception as e:
+            print(f"Error updating password: {e}")
+            return None
     
     def update_subscription(self, email, status, subscription_id=None):
         """Update user subscription"""
@@ -100,15 +145,18 @@ class SupabaseDatabase:
             
         except Exception as e:
             print(f"Error updating subscription: {e}")
+        
+        user_cache.invalidate(email=email)
     
     # CONVERSATION MANAGEMENT
-    def save_conversation(self, user_id, question, answer):
+    def save_conversation(self, user_id, question, answer, subject=None):
         """Save conversation"""
         try:
             data = {
                 'user_id': user_id,
                 'question': question,
                 'answer': answer,
+                'subject': subject,
                 'timestamp': datetime.now().isoformat()
             }
             
@@ -117,15 +165,44 @@ class SupabaseDatabase:
         except Exception as e:
             print(f"Error saving conversation: {e}")
     
-    def get_user_conversations(self, user_id, limit=50):
-        """Get user conversations"""
+    def save_conversations(self, conversations):
+        """
+        Bulk insert conversations (dicts with user_id, question, answer, subject, timestamp)
+        Raises on failure so the write-behind buffer can spill and retry
+        """
+        rows = [
+            {
+                'user_id': conv['user_id'],
+                'question': conv['question'],
+                'answer': conv['answer'],
+                'subject': conv.get('subject'),
+                'timestamp': conv['timestamp']
+            }
+            for conv in conversations
+        ]
+        self.client.table('conversations').insert(rows).execute()
+    
+    def get_user_conversations(self, user_id, limit=50, after=None, columns='*', subject=None):
+        """
+        Get user conversations, newest first, ordered by (timestamp, id)
+        after is the (timestamp, id) of the last conversation already shown
+        """
         try:
-            response = self.client.table('conversations')\
-                .select('*')\
+            query = self.client.table('conversations')\
+                .select(columns)\
                 .eq('user_id', user_id)\
                 .order('timestamp', desc=True)\
-                .limit(limit)\
-                .execute()
+                .order('id', desc=True)\
+                .limit(limit)
+            
+            if subject:
+                query = query.eq('subject', subject)
+            if after:
+                timestamp, conversation_id = after
+                query = query.or_(f'timestamp.lt."{timestamp}",'
+                                  f'and(timestamp.eq."{timestamp}",id.lt.{conversation_id})')
+            
+            response = query.execute()
             
             return response.data if response.data else []
             
@@ -133,6 +210,52 @@ class SupabaseDatabase:
             print(f"Error getting conversations: {e}")
             return []
     
+    def get_conversation(self, conversation_id, user_id):
+        """One full conversation, if it belongs to this user"""
+        try:
+            response = self.client.table('conversations')\
+                .select('*')\
+                .eq('id', conversation_id)\
+                .eq('user_id', user_id)\
+                .execute()
+            
+            return response.data[0] if response.data else None
+            
+        except Exception as e:
+            print(f"Error getting conversation: {e}")
+            return None
+    
+    def search_conversations(self, user_id, query, subject=None, limit=20, offset=0):
+        """
+        Full-text search of a user's conversations, best match first
+        Returns (rows with rank and ** highlights, total matches)
+        """
+        try:
+            response = self.client.rpc('search_conversations', {
+                'p_user_id': user_id,
+                'p_query': query,
+                'p_subject': subject,
+                'p_limit': limit,
+                'p_offset': offset
+            }).execute()
+            
+            rows = response.data if response.data else []
+            return rows, (rows[0]['total'] if rows else 0)
+            
+        except Exception as e:
+            print(f"Error searching conversations: {e}")
+            return [], 0
+    
+    def get_conversation_subjects(self, user_id):
+        """Subjects this user has conversations in"""
+        try:
+            response = self.client.rpc('conversation_subjects', {'p_user_id': user_id}).execute()
+            return [row['subject'] for row in response.data or []]
+            
+        except Exception as e:
+            print(f"Error getting conversation subjects: {e}")
+            return []
+    
     def delete_conversation(self, conversation_id, user_id):
         """Delete specific conversation"""
         try:
@@ -157,80 +280,255 @@ class SupabaseDatabase:
             print(f"Error clearing conversations: {e}")
     
     # USAGE TRACKING
-    def increment_questions_asked(self, user_id):
-        """Increment question count"""
+    def increment_questions_asked(self, user_id, amount=1):
+        """Increment question count atomically on the server; returns the new count"""
         try:
-            # Get current count
-            user_response = self.client.table('users').select('questions_asked').eq('id', user_id).execute()
+            response = self.client.rpc('increment_questions_asked', {
+                'p_user_id': user_id,
+                'p_amount': amount
+            }).execute()
+            
+            return response.data
             
-            if user_response.data and len(user_response.data) > 0:
-                current_count = user_response.data[0].get('questions_asked', 0)
-                new_count = current_count + 1
-                
-                # Update count
-                self.client.table('users').update({'questions_asked': new_count}).eq('id', user_id).execute()
-                
         except Exception as e:
             print(f"Error incrementing questions: {e}")
+            return None
+        
+        finally:
+            user_cache.invalidate(user_id=user_id)
+    
+    def reserve_question(self, email, free_limit):
+        """
+        Check the quota and count one question against it in a single request
+        Returns {user_id, questions_used, over_limit, is_paid}, or None for unknown users
+        """
+        try:
+            response = self.client.rpc('reserve_question', {
+                'p_email': email,
+                'p_free_limit': free_limit
+            }).execute()
+            
+            if response.data and len(response.data) > 0:
+                return response.data[0]
+            return None
+            
+        except Exception as e:
+            print(f"Error reserving question: {e}")
+            return None
+        
+        finally:
+            user_cache.invalidate(email=email)
+    
+    def release_question(self, user_id, month):
+        """Give back a question reserved in month ('YYYY-MM') if that month is still current"""
+        try:
+            self.client.rpc('release_question', {'p_user_id': user_id, 'p_month': month}).execute()
+            
+        except Exception as e:
+            print(f"Error releasing question: {e}")
+        
+        finally:
+            user_cache.invalidate(user_id=user_id)
+    
+    def log_api_call(self, user_email, input_tokens, output_tokens, estimated_cost, model='claude-3-opus',
+                     cache_read_tokens=0, cache_write_tokens=0):
+        """Log an API call and add it to usage_rollup in one transaction (supabase/migrations/001)"""
+        try:
+            self.client.rpc('log_api_call', {
+                'p_user_email': user_email,
+                'p_input_tokens': input_tokens,
+                'p_output_tokens': output_tokens,
+                'p_estimated_cost': estimated_cost,
+                'p_model': model,
+                'p_cache_read_tokens': cache_read_tokens,
+                'p_cache_write_tokens': cache_write_tokens
+            }).execute()
+            
+        except Exception as e:
+            print(f"Error logging API call: {e}")
+    
+    def log_api_calls(self, calls):
+        """
+        Bulk log API calls (dicts with log_api_call's fields plus timestamp) in one transaction
+        Raises on failure so the write-behind buffer can spill and retry
+        """
+        self.client.rpc('log_api_calls', {'p_calls': calls}).execute()
+    
+    def get_monthly_usage_rollup(self, user_email, month=None):
+        """User's usage for a month ('YYYY-MM', UTC; default current), summed over models"""
+        month = month or datetime.now(timezone.utc).strftime('%Y-%m')
+        try:
+            response = self.client.table('usage_rollup')\
+                .select('api_calls, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens, estimated_cost')\
+                .eq('month', month)\
+                .eq('user_email', user_email)\
+                .execute()
+            
+            totals = dict.fromkeys(USAGE_FIELDS, 0)
+            for row in response.data or []:
+                for field in USAGE_FIELDS:
+                    totals[field] += row.get(field) or 0
+            totals['estimated_cost'] = float(totals['estimated_cost'])
+            return totals
+            
+        except Exception as e:
+            print(f"Error getting usage rollup: {e}")
+            return None
+    
+    def get_monthly_usage_totals(self, month=None):
+        """Usage across all users for a month ('YYYY-MM', UTC; default current)"""
+        try:
+            response = self.client.rpc('monthly_usage_totals', {'p_month': month}).execute()
+            
+            row = response.data[0] if response.data else {}
+            totals = {field: row.get(field) or 0 for field in USAGE_FIELDS}
+            totals['estimated_cost'] = float(totals['estimated_cost'])
+            return totals
+            
+        except Exception as e:
+            print(f"Error getting usage totals: {e}")
+            return None
+    
+    def rebuild_usage_rollup(self):
+        """Recompute usage_rollup from api_usage (backfills)"""
+        try:
+            response = self.client.rpc('rebuild_usage_rollup', {}).execute()
+            return response.data
+            
+        except Exception as e:
+            print(f"Error rebuilding usage rollup: {e}")
+            return None
+    
+    def increment_questions_asked_batch(self, increments):
+        """
+        Add amounts to several users' question counts in one request ([{user_id, amount}, ...])
+        Raises on failure so the write-behind buffer can spill and retry
+        """
+        try:
+            self.client.rpc('increment_questions_asked_batch', {'p_increments': increments}).execute()
+        finally:
+            for increment in increments:
+                user_cache.invalidate(user_id=increment['user_id'])
     
     def reset_monthly_questions(self, user_id):
         """Reset monthly question count"""
         try:
             data = {
                 'questions_asked': 0,
-                'last_reset_date': datetime.now().date().isoformat()
+                'last_reset_date': datetime.now(timezone.utc).date().isoformat()
             }
             
             self.client.table('users').update(data).eq('id', user_id).execute()
             
         except Exception as e:
             print(f"Error resetting questions: {e}")
+        
+        user_cache.invalidate(user_id=user_id)
     
-    # ADMIN FUNCTIONS
-    def get_all_users(self):
-        """Get all users (admin)"""
+    def reset_monthly_questions_batch(self, month_start, batch_size):
+        """
+        Reset up to batch_size users whose counters are from before month_start (a date)
+        Returns how many were reset, or None on failure
+        """
         try:
-            response = self.client.table('users')\
-                .select('*')\
-                .order('created_at', desc=True)\
-                .execute()
+            response = self.client.rpc('reset_monthly_questions_batch', {
+                'p_month_start': month_start.isoformat(),
+                'p_batch_size': batch_size
+            }).execute()
             
-            return response.data if response.data else []
+            return response.data or 0
             
         except Exception as e:
-            print(f"Error getting all users: {e}")
-            return []
+            print(f"Error resetting monthly questions: {e}")
+            return None
     
-    def get_user_stats(self):
-        """Get user statistics"""
+    # ADMIN FUNCTIONS
+    def get_users_page(self, after=None, limit=USERS_PAGE_SIZE, columns=ADMIN_USER_COLUMNS):
+        """
+        One page of users, newest first, ordered by (created_at, id)
+        after is the cursor returned with the previous page; columns must include both keys
+        Returns (users, next cursor), next cursor None on the last page
+        """
         try:
-            # Get all users
-            response = self.client.table('users').select('subscription_status, questions_asked').execute()
+            query = self.client.table('users')\
+                .select(columns)\
+                .order('created_at', desc=True)\
+                .order('id', desc=True)\
+                .limit(limit)
             
-            if not response.data:
-                return {
-                    'total_users': 0,
-                    'paid_users': 0,
-                    'free_users': 0,
-                    'total_questions': 0
-                }
+            if after:
+                created_at, user_id = after
+                query = query.or_(f'created_at.lt."{created_at}",'
+                                  f'and(created_at.eq."{created_at}",id.lt.{user_id})')
             
-            users = response.data
+            users = query.execute().data or []
             
-            stats = {
-                'total_users': len(users),
-                'paid_users': sum(1 for u in users if u.get('subscription_status') == 'active'),
-                'free_users': sum(1 for u in users if u.get('subscription_status') == 'free'),
-                'total_questions': sum(u.get('questions_asked', 0) for u in users)
-            }
+        except Exception as e:
+            print(f"Error getting users page: {e}")
+            return [], None
+        
+        next_cursor = (users[-1]['created_at'], users[-1]['id']) if len(users) == limit else None
+        return users, next_cursor
+    
+    def get_all_users(self, columns=ADMIN_USER_COLUMNS, page_size=USERS_PAGE_SIZE):
+        """Iterate over all users (admin), newest first, one page per request"""
+        cursor = None
+        while True:
+            users, cursor = self.get_users_page(cursor, page_size, columns)
+            yield from users
+            if cursor is None:
+                return
+    
+    def _count_users(self, status=None):
+        """Row count from the Content-Range header, no rows transferred"""
+        query = self.client.table('users').select('id', count='exact', head=True)
+        if status:
+            query = query.eq('subscription_status', status)
+        return query.execute().count or 0
+    
+    def _count_conversations(self, month=None):
+        """Conversations saved in a month ('YYYY-MM', UTC; default current), one per question"""
+        month_start = datetime.strptime(month, '%Y-%m') if month else datetime.now(timezone.utc).replace(day=1)
+        next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        response = self.client.table('conversations').select('id', count='exact', head=True)\
+            .gte('timestamp', month_start.strftime('%Y-%m-01'))\
+            .lt('timestamp', next_month.strftime('%Y-%m-01'))\
+            .execute()
+        return response.count or 0
+    
+    def get_user_stats(self, month=None):
+        """User counts by status, questions and signups for a month ('YYYY-MM', UTC; default current)"""
+        try:
+            response = self.client.rpc('user_stats', {'p_month': month}).execute()
+            row = response.data[0] if response.data else {}
+            return {field: row.get(field) or 0 for field in USER_STATS_FIELDS}
             
-            return stats
+        except Exception as e:
+            print(f"Error getting user stats (falling back to counts): {e}")
+        
+        # Before 004_admin_aggregates.sql: count queries, still without downloading users
+        try:
+            return {
+                'total_users': self._count_users(),
+                'paid_users': self._count_users('active'),
+                'free_users': self._count_users('free'),
+                'total_questions': self._count_conversations(month),
+                'new_users': 0
+            }
             
         except Exception as e:
             print(f"Error getting user stats: {e}")
-            return {
-                'total_users': 0,
-                'paid_users': 0,
-                'free_users': 0,
-                'total_questions': 0
-            }
\ No newline at end of file
+            return {field: 0 for field in USER_STATS_FIELDS}
+    
+    def get_signups(self, period='day', since=None):
+        """Signups per 'day', 'week' or 'month' since a datetime (default last 30 days)"""
+        try:
+            params = {'p_period': period}
+            if since:
+                params['p_since'] = since.isoformat()
+            response = self.client.rpc('signups_per_period', params).execute()
+            return response.data if response.data else []
+            
+        except Exception as e:
+            print(f"Error getting signups: {e}")
+            return []
@@ -0,0 +1,167 @@
+"""
+Embedding Providers for EducApp
+Pluggable embedding backends (local sentence-transformers or OpenAI)
+behind a persistent on-disk cache shared by every process
+"""
+
+import os
+import sqlite3
+import hashlib
+import threading
+from array import array
+from langchain_core.embeddings import Embeddings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Backend selection: "openai" (default) or "local"
+EMBEDDING_BACKEND = os.getenv('EDUCAPP_EMBEDDINGS', 'openai')
+LOCAL_EMBEDDING_MODEL = os.getenv('EDUCAPP_LOCAL_EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
+EMBEDDING_CACHE_PATH = os.getenv('EDUCAPP_EMBEDDING_CACHE', './embedding_cache.db')
+
+
+def text_hash(text):
+    """SHA-256 of the text to embed"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    sentence-transformers model running on CPU
+    Texts are encoded in batches; vectors are L2-normalized
+    """
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, batch_size=32):
+        # Imported here so the OpenAI backend does not pay for loading torch
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device='cpu')
+
+    def embed_documents(self, texts):
+        """Embed a list of texts in CPU batches"""
+        if not texts:
+            return []
+        vectors = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        """Embed a single query"""
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any embedding backend with a SQLite cache keyed by (model, text hash)
+    Only texts never seen before by this model reach the backend
+    """
+
+    def __init__(self, backend, model_name, cache_path=EMBEDDING_CACHE_PATH):
+        self.backend = backend
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS embeddings
+                              (model TEXT NOT NULL,
+                               text_hash TEXT NOT NULL,
+                               vector BLOB NOT NULL,
+                               PRIMARY KEY (model, text_hash))''')
+        self._conn.commit()
+
+    def _lookup(self, hashes):
+        """Return {hash: vector} for the hashes already in the cache"""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f'SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})',
+                    [self.model_name, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+
+        return found
+
+    def _store(self, entries):
+        """Persist (hash, vector) pairs"""
+        with self._lock:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)',
+                [(self.model_name, key, array('f', vector).tobytes()) for key, vector in entries]
+            )
+            self._conn.commit()
+
+    def embed_documents(self, texts):
+        """Embed texts, computing only cache misses (in one backend batch)"""
+        hashes = [text_hash(text) for text in texts]
+        cached = self._lookup(hashes)
+
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = self.backend.embed_documents(list(missing.values()))
+            new_entries = list(zip(missing.keys(), vectors))
+            self._store(new_entries)
+            cached.update(new_entries)
+
+        return [cached[key] for key in hashes]
+
+    def embed_query(self, text):
+        """Embed a query, reusing any earlier embedding of the same text"""
+        key = text_hash(text)
+        cached = self._lookup([key])
+
+        if key in cached:
+            self.hits += 1
+            return cached[key]
+
+        self.misses += 1
+        vector = self.backend.embed_query(text)
+        self._store([(key, vector)])
+        return vector
+
+
+def get_embeddings(backend=None):
+    """
+    Build the configured embedding provider wrapped in the persistent cache
+    backend: "openai" or "local" (defaults to EDUCAPP_EMBEDDINGS)
+    """
+    backend = backend or EMBEDDING_BACKEND
+
+    if backend == 'local':
+        provider = LocalEmbeddings()
+        model_name = f"local:{provider.model_name}"
+    elif backend == 'openai':
+        from langchain_openai import OpenAIEmbeddings
+        provider = OpenAIEmbeddings()
+        model_name = f"openai:{provider.model}"
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend} (expected 'openai' or 'local')")
+
+    print(f"Using embedding model {model_name}")
+    return CachedEmbeddings(provider, model_name)
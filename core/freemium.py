@@ -3,50 +3,63 @@ Freemium system for EducApp
 Manages question limits and subscription status
 """
 
+import os
+import time
+import threading
 import streamlit as st
-from datetime import datetime, date
-from core.database_supabase import SupabaseDatabase
+from datetime import datetime, timezone
+from core.supabase_client import get_database
+from core.concurrency import TokenBucket
 
-# Initialize database
-db = SupabaseDatabase()
 
 # Free tier limits
 FREE_QUESTIONS_PER_MONTH = 10
 
-def get_user_usage(email):
-    """Get user's current usage and limits"""
-    user = db.get_user_by_email(email)
+# Paid fast path: users the backend recently confirmed as paid reserve questions
+# in-process, up to a burst of tokens; an empty bucket or stale status goes back
+# to the backend, which re-checks the subscription. Fast-path questions are still
+# counted by the backend's reserve_question, once the answer has been delivered
+PAID_FAST_PATH_BURST = int(os.getenv('EDUCAPP_PAID_FAST_PATH_BURST', '20'))
+PAID_FAST_PATH_REFILL_PER_MINUTE = float(os.getenv('EDUCAPP_PAID_FAST_PATH_REFILL_PER_MINUTE', '2'))
+PAID_STATUS_TTL_SECONDS = float(os.getenv('EDUCAPP_PAID_STATUS_TTL_SECONDS', '300'))
+
+# email -> (user id, confirmed at, token bucket)
+_paid_users = {}
+_paid_users_lock = threading.Lock()
+
+
+def _current_month():
+    # UTC, like current_date in the reserve_question rpc
+    return datetime.now(timezone.utc).strftime('%Y-%m')
+
+def get_user_usage(email, user=None):
+    """
+    Get user's current usage and limits (pass the user row if it is already loaded)
+    Read-only: a count from an earlier month shows as 0; the next reservation or the
+    monthly reset job (core/monthly_reset.py) starts the new count
+    """
+    if user is None:
+        user = get_database().get_user_by_email(email)
     
     if not user:
         return None
     
+    # The stored count belongs to the month of last_reset_date
+    last_reset = user.get('last_reset_date')
+    if last_reset and str(last_reset)[:7] < _current_month():
+        questions_used = 0
+    else:
+        questions_used = user.get('questions_asked', 0)
+    
     # Check if user is paid
     if user.get('subscription_status') == 'active':
         return {
             'status': 'paid',
             'has_limit': False,
-            'questions_used': user.get('questions_asked', 0),
+            'questions_used': questions_used,
             'limit': None
         }
     
-    # Free user - check if monthly reset is needed
-    last_reset = user.get('last_reset_date')
-    today = date.today()
-    
-    if last_reset:
-        # Convert string to date if needed
-        if isinstance(last_reset, str):
-            last_reset = datetime.strptime(last_reset, '%Y-%m-%d').date()
-        
-        # Reset if it's a new month
-        if last_reset.month != today.month or last_reset.year != today.year:
-            db.reset_monthly_questions(user['id'])
-            questions_used = 0
-        else:
-            questions_used = user.get('questions_asked', 0)
-    else:
-        questions_used = user.get('questions_asked', 0)
-    
     return {
         'status': 'free',
         'has_limit': True,
@@ -55,7 +68,7 @@ def get_user_usage(email):
     }
 
 def can_ask_question(email):
-    """Check if user can ask a question"""
+    """Check if user can ask a question (advisory; reserve_question is the gate)"""
     usage = get_user_usage(email)
     
     if not usage:
@@ -68,12 +81,100 @@ def can_ask_question(email):
     # Free users check limit
     return usage['questions_used'] < usage['limit']
 
-def increment_question_count(email):
-    """Increment user's question count"""
-    user = db.get_user_by_email(email)
+def _paid_fast_path(email):
+    """Reserve from the user's token bucket if they were confirmed paid recently"""
+    with _paid_users_lock:
+        entry = _paid_users.get(email)
+    if not entry:
+        return None
+    
+    user_id, confirmed_at, bucket = entry
+    if time.monotonic() - confirmed_at > PAID_STATUS_TTL_SECONDS or not bucket.try_take():
+        return None
+    
+    return {
+        'allowed': True,
+        'email': email,
+        'user_id': user_id,
+        'status': 'paid',
+        'questions_used': None,
+        'limit': None,
+        'month': _current_month(),
+        'fast_path': True
+    }
+
+def forget_paid_status(email):
+    """Send a user back through the backend gate (call when a subscription changes)"""
+    with _paid_users_lock:
+        _paid_users.pop(email, None)
+
+def reserve_question(email):
+    """
+    Atomically start the new month if needed, check the limit and count one question
+    One backend call (deferred to commit_question for recently confirmed paid users)
+    Returns None for unknown users, else a reservation dict with 'allowed' and the
+    usage figures; pass it to commit_question or release_question afterwards
+    """
+    reservation = _paid_fast_path(email)
+    if reservation:
+        return reservation
+    
+    month = _current_month()
+    result = get_database().reserve_question(email, FREE_QUESTIONS_PER_MONTH)
+    
+    if not result:
+        return None
+    
+    if result['is_paid']:
+        bucket = TokenBucket(PAID_FAST_PATH_BURST, PAID_FAST_PATH_REFILL_PER_MINUTE / 60)
+        with _paid_users_lock:
+            _paid_users[email] = (result['user_id'], time.monotonic(), bucket)
+    else:
+        forget_paid_status(email)
+    
+    return {
+        'allowed': not result['over_limit'],
+        'email': email,
+        'user_id': result['user_id'],
+        'status': 'paid' if result['is_paid'] else 'free',
+        'questions_used': result['questions_used'],
+        'limit': None if result['is_paid'] else FREE_QUESTIONS_PER_MONTH,
+        'month': month,
+        'fast_path': False
+    }
+
+def commit_question(reservation):
+    """The answer was delivered: keep the reserved question counted"""
+    if not reservation or not reservation['allowed'] or not reservation['fast_path']:
+        return
+    
+    # Fast-path reservations were not counted yet: count them the same way as the
+    # rest, which also rolls the month over and re-checks the subscription
+    email = reservation['email']
+    result = get_database().reserve_question(email, FREE_QUESTIONS_PER_MONTH)
+    if not result or not result['is_paid']:
+        forget_paid_status(email)
+        return
+
+    with _paid_users_lock:
+        entry = _paid_users.get(email)
+        if entry:
+            _paid_users[email] = (entry[0], time.monotonic(), entry[2])
+
+def release_question(reservation):
+    """The answer failed: give the reserved question back"""
+    if not reservation or not reservation['allowed']:
+        return
+    
+    if reservation['fast_path']:
+        # Nothing was counted yet; only the token goes back
+        with _paid_users_lock:
+            entry = _paid_users.get(reservation['email'])
+        if entry:
+            entry[2].give_back()
+        return
     
-    if user:
-        db.increment_questions_asked(user['id'])
+    get_database().release_question(reservation['user_id'], reservation['month'])
 
 def get_upgrade_message(email, name):
     """Get upgrade message for user"""
@@ -3,26 +3,24 @@ Google OAuth Authentication for EducApp
 """
 import os
 import streamlit as st
-from google.oauth2 import id_token
-from google.auth.transport import requests
-from core.database_supabase import SupabaseDatabase
+from core.supabase_client import get_database
+from core.google_tokens import get_google_verifier
+from core.auth import start_session
 import secrets
 
-# Initialize database
-db = SupabaseDatabase()
 
 def user_exists(email):
     """Check if user exists"""
-    user = db.get_user_by_email(email)
+    user = get_database().get_user_by_email(email)
     return user is not None
 
 def create_user(email, password=None, name=None, google_id=None):
     """Create new user"""
-    return db.create_user(email, password, name, google_id)
+    return get_database().create_user(email, password, name, google_id)
 
 def get_user(email):
     """Get user by email"""
-    return db.get_user_by_email(email)
+    return get_database().get_user_by_email(email)
 
 def get_google_client_id():
     """Get Google OAuth client ID from environment"""
@@ -79,14 +77,8 @@ def show_google_login_button():
 def verify_google_token(token):
     """Verify Google ID token and return user info"""
     try:
-        client_id = get_google_client_id()
-        
-        # Verify the token
-        idinfo = id_token.verify_oauth2_token(
-            token, 
-            requests.Request(), 
-            client_id
-        )
+        # Verify the token locally (certificates come from the process-wide cache)
+        idinfo = get_google_verifier().verify(token)
         
         # Token is valid, return user info
         return {
@@ -114,10 +106,10 @@ def handle_google_login(user_info):
     else:
         st.success(f"Welcome back, {name}!")
     
-    # Set session state
-    st.session_state.authenticated = True
-    st.session_state.user_email = email
-    st.session_state.user_name = name
+    # Set session state and the browser's session token
+    user = get_user(email)
+    start_session(user['id'] if user else None, email, name,
+                  user.get('subscription_status', 'free') if user else 'free')
     
     # Force reload to show main app
     st.rerun()
\ No newline at end of file
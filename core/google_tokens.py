@@ -0,0 +1,122 @@
+"""
+Google ID Token Verification for EducApp
+Verifies Google Sign-In ID tokens locally against Google's public certificates
+The certificates are fetched over one pooled HTTP session and kept in a
+process-wide cache for as long as Google's Cache-Control header allows, so a
+sign-in is a signature check, not an outbound request
+"""
+
+import os
+import re
+import json
+import time
+import base64
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from google.auth import jwt
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+CERTS_TIMEOUT_SECONDS = 5
+# Used when the response has no max-age; Google normally sends several hours
+DEFAULT_CERTS_MAX_AGE_SECONDS = 3600
+# An unknown key id triggers at most one early refresh per this interval
+MIN_REFRESH_INTERVAL_SECONDS = 60
+CLOCK_SKEW_SECONDS = 10
+
+
+def _max_age(headers):
+    """Freshness lifetime from Cache-Control max-age minus Age, if present"""
+    match = re.search(r'max-age=(\d+)', headers.get('Cache-Control', ''))
+    if not match:
+        return None
+    try:
+        age = int(headers.get('Age', 0))
+    except ValueError:
+        age = 0
+    return max(int(match.group(1)) - age, 0)
+
+
+def _key_id(token):
+    """kid from the token header, or None"""
+    try:
+        segment = token.split('.')[0]
+        header = json.loads(base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4)))
+        return header.get('kid')
+    except (AttributeError, ValueError):
+        return None
+
+
+def create_certs_session():
+    """Pooled keep-alive session for the certificate endpoint"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=2))
+    return session
+
+
+class GoogleTokenVerifier:
+    """Verify Google ID tokens against a cached certificate set"""
+
+    def __init__(self, client_id=None, certs_url=GOOGLE_CERTS_URL, session=None, clock=time.time):
+        self.client_id = client_id or os.getenv('GOOGLE_CLIENT_ID')
+        self.certs_url = certs_url
+        self.session = session or create_certs_session()
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._certs = None
+        self._expires_at = 0
+        self._fetched_at = 0
+        self.fetches = 0
+
+    def _fetch_certs(self):
+        response = self.session.get(self.certs_url, timeout=CERTS_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        max_age = _max_age(response.headers)
+        now = self.clock()
+        self._certs = response.json()
+        self._fetched_at = now
+        self._expires_at = now + (DEFAULT_CERTS_MAX_AGE_SECONDS if max_age is None else max_age)
+        self.fetches += 1
+
+    def get_certs(self, key_id=None):
+        """Current certificates (kid -> PEM), fetched only when stale or missing key_id"""
+        with self._lock:
+            now = self.clock()
+            stale = self._certs is None or now >= self._expires_at
+            # Google rotated keys before our copy expired
+            rotated = (key_id is not None and self._certs is not None and key_id not in self._certs
+                       and now - self._fetched_at >= MIN_REFRESH_INTERVAL_SECONDS)
+            if stale or rotated:
+                self._fetch_certs()
+            return self._certs
+
+    def verify(self, token):
+        """
+        Claims of a valid ID token for this app's client id
+        Raises ValueError if the signature, audience, issuer or expiry is wrong
+        """
+        if not self.client_id:
+            raise ValueError("GOOGLE_CLIENT_ID is not set")
+        certs = self.get_certs(_key_id(token))
+        claims = jwt.decode(token, certs=certs, audience=self.client_id,
+                            clock_skew_in_seconds=CLOCK_SKEW_SECONDS)
+        if claims.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer: {claims.get('iss')}")
+        return claims
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_google_verifier():
+    """The process-wide verifier (one certificate cache and session per process)"""
+    global _verifier
+    with _verifier_lock:
+        if _verifier is None:
+            _verifier = GoogleTokenVerifier()
+        return _verifier
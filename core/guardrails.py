@@ -7,6 +7,57 @@ Flags topics where students should consult parents
 import re
 from config.worldview_foundation import PARENT_DISCUSSION_TOPICS, get_biblical_context
 
+# Biblical context areas in priority order - the first area with a match wins
+# Matched as whole words, so plural and other forms are listed explicitly
+BIBLICAL_CONTEXT_TRIGGERS = [
+    ("creation_and_science", ["evolution", "darwin", "created", "creation", "origins", "big bang"]),
+    ("biblical_authority", ["bible", "scripture", "scriptures", "god's word", "biblical"]),
+    ("human_nature", ["human", "humans", "person", "people", "mankind", "man", "men", "woman", "women",
+                      "male", "female", "gender"]),
+    ("morality_and_ethics", ["right", "wrong", "moral", "morals", "ethics", "ethical", "good", "evil",
+                             "sin", "sins"]),
+    ("human_sexuality_and_marriage", ["sex", "sexuality", "marriage", "married", "dating", "relationship",
+                                      "relationships"]),
+    ("life_and_death", ["life", "death", "die", "eternal", "heaven", "hell", "afterlife", "resurrection"]),
+]
+
+# Parent-discussion triggers besides the PARENT_DISCUSSION_TOPICS phrases themselves
+# (single words only where the word alone means the topic - never "and", "of", "end")
+SENSITIVE_KEYWORDS = [
+    "salvation", "saved", "born again", "baptism", "communion",
+    "rapture", "tribulation", "millennium", "end times",
+    "predestination", "election", "free will",
+    "catholic", "protestant", "denomination", "denominations", "denominational",
+    "speaking in tongues", "spiritual gifts", "cessationism"
+]
+
+
+def _trie_pattern(terms):
+    """
+    Regex alternation for a set of strings, factored into a prefix trie
+    so the engine walks each position once instead of trying every term
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    
+    def build(node):
+        is_end = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        pattern = "(?:" + "|".join(branches) + ")"
+        # Optional and greedy, so the longest term at a position wins
+        return pattern + "?" if is_end else pattern
+    
+    return build(trie)
+
+
 class BiblicalGuardrails:
     """
     Ensures all responses maintain biblical integrity
@@ -15,32 +66,53 @@ class BiblicalGuardrails:
     
     def __init__(self):
         self.sensitive_keywords = self._build_keyword_list()
+        self._triggers, self._matcher = self._compile_matcher()
+        self._area_priority = {area: rank for rank, (area, _) in enumerate(BIBLICAL_CONTEXT_TRIGGERS)}
     
     def _build_keyword_list(self):
-        """Expand discussion topics into keyword triggers"""
-        keywords = set()
-        
-        # Add keywords from parent discussion topics
-        for topic in PARENT_DISCUSSION_TOPICS:
-            keywords.update(topic.lower().split())
-        
-        # Add specific theological/worldview trigger words
-        keywords.update([
-            "salvation", "saved", "born again", "baptism", "communion",
-            "rapture", "tribulation", "millennium", "end times",
-            "predestination", "election", "free will",
-            "catholic", "protestant", "denomination",
-            "speaking in tongues", "spiritual gifts", "cessationism"
-        ])
-        
+        """Discussion topics as whole phrases, plus the specific trigger words"""
+        keywords = {topic.lower() for topic in PARENT_DISCUSSION_TOPICS}
+        keywords.update(SENSITIVE_KEYWORDS)
         return keywords
     
+    def _compile_matcher(self):
+        """
+        Compile keywords and context-area triggers into one whole-word regex
+        Returns (triggers, regex): triggers maps each matchable term to a list of
+        ("keyword", keyword) / ("area", area name) entries. A phrase also carries
+        the entries of the terms inside it ("end times theology" -> "end times"),
+        since the regex reports only the longest term at each position.
+        """
+        direct = {}
+        for keyword in self.sensitive_keywords:
+            direct.setdefault(keyword, []).append(("keyword", keyword))
+        for area, words in BIBLICAL_CONTEXT_TRIGGERS:
+            for word in words:
+                direct.setdefault(word, []).append(("area", area))
+        
+        triggers = {}
+        for term in direct:
+            words = term.split()
+            entries = []
+            for length in range(1, len(words) + 1):
+                for start in range(len(words) - length + 1):
+                    for entry in direct.get(" ".join(words[start:start + length]), []):
+                        if entry not in entries:
+                            entries.append(entry)
+            triggers[term] = entries
+        
+        # Whole words only: "man" never fires on "many" nor "sin" on "business"
+        matcher = re.compile(r"\b(" + _trie_pattern(triggers) + r")\b")
+        return triggers, matcher
+    
     def check_query(self, query):
         """
         Analyze student query for topics requiring parental discussion
+        One regex pass finds every keyword and context-area trigger as whole words,
+        so "man" no longer fires on "many" nor "sin" on "business"
         Returns: dict with flags and guidance
         """
-        query_lower = query.lower()
+        query_lower = query.lower().replace("\u2019", "'")
         
         result = {
             "needs_parent_discussion": False,
@@ -48,30 +120,20 @@ class BiblicalGuardrails:
             "biblical_context_area": None
         }
         
-        # Check for parent discussion keywords
-        for keyword in self.sensitive_keywords:
-            if keyword in query_lower:
-                result["needs_parent_discussion"] = True
-                result["detected_topics"].append(keyword)
-        
-        # Identify specific biblical context areas
-        if any(word in query_lower for word in ["evolution", "darwin", "created", "creation", "origins", "big bang"]):
-            result["biblical_context_area"] = "creation_and_science"
-        
-        elif any(word in query_lower for word in ["bible", "scripture", "god's word", "biblical"]):
-            result["biblical_context_area"] = "biblical_authority"
-        
-        elif any(word in query_lower for word in ["human", "person", "people", "mankind", "man", "woman", "male", "female", "gender"]):
-            result["biblical_context_area"] = "human_nature"
-        
-        elif any(word in query_lower for word in ["right", "wrong", "moral", "ethics", "ethical", "good", "evil", "sin"]):
-            result["biblical_context_area"] = "morality_and_ethics"
-        
-        elif any(word in query_lower for word in ["sex", "sexuality", "marriage", "married", "dating", "relationship"]):
-            result["biblical_context_area"] = "human_sexuality_and_marriage"
-        
-        elif any(word in query_lower for word in ["life", "death", "die", "eternal", "heaven", "hell", "afterlife", "resurrection"]):
-            result["biblical_context_area"] = "life_and_death"
+        best_area_rank = None
+        for term in self._matcher.findall(query_lower):
+            for kind, value in self._triggers[term]:
+                if kind == "keyword":
+                    # Check for parent discussion keywords
+                    result["needs_parent_discussion"] = True
+                    if value not in result["detected_topics"]:
+                        result["detected_topics"].append(value)
+                else:
+                    # Identify specific biblical context areas (earlier areas take priority)
+                    rank = self._area_priority[value]
+                    if best_area_rank is None or rank < best_area_rank:
+                        best_area_rank = rank
+                        result["biblical_context_area"] = value
         
         return result
     
@@ -0,0 +1,152 @@
+"""
+Lexical Index for EducApp
+BM25 over an inverted index of knowledge-base chunks, plus reciprocal rank fusion
+Catches exact terms (curriculum names, Scripture references) that embeddings rank poorly
+"""
+
+import os
+import re
+import json
+import math
+from collections import Counter
+from langchain_core.documents import Document
+
+# Bump when tokenization changes so persisted indexes are rebuilt
+TOKENIZER_VERSION = 1
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+# Scripture references like 1:16 (from "Colossians 1:16-17") are kept as their own terms
+VERSE_RE = re.compile(r"\d+:\d+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by do does for from how i in is it of on or so that the this
+to was what when where which who why will with you your
+""".split())
+
+INDEX_FILENAME = "bm25.json"
+
+
+def tokenize(text):
+    """Lowercase word and verse-reference terms, minus stopwords"""
+    text = text.lower()
+    terms = [word for word in WORD_RE.findall(text) if word not in STOPWORDS]
+    terms.extend(VERSE_RE.findall(text))
+    return terms
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring
+    Only the postings of the query's terms are touched at search time
+    """
+
+    def __init__(self, documents, ids, postings, doc_lengths, k1=1.5, b=0.75):
+        self.documents = documents
+        self.ids = ids
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, documents, ids):
+        """Tokenize every chunk into term -> [[doc index, term frequency], ...]"""
+        postings = {}
+        doc_lengths = []
+
+        for position, doc in enumerate(documents):
+            terms = tokenize(doc.page_content)
+            doc_lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                postings.setdefault(term, []).append([position, frequency])
+
+        return cls(documents, list(ids), postings, doc_lengths)
+
+    def save(self, path):
+        """Persist the index atomically as JSON"""
+        os.makedirs(path, exist_ok=True)
+        data = {
+            "tokenizer_version": TOKENIZER_VERSION,
+            "ids": self.ids,
+            "documents": [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in self.documents
+            ],
+            "postings": self.postings,
+            "doc_lengths": self.doc_lengths
+        }
+        index_path = os.path.join(path, INDEX_FILENAME)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(tmp_path, index_path)
+
+    @classmethod
+    def load(cls, path, ids=None):
+        """
+        Load a persisted index
+        Returns None if it is missing, unreadable, or (when ids are given) built from other chunks
+        """
+        try:
+            with open(os.path.join(path, INDEX_FILENAME), 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if data.get("tokenizer_version") != TOKENIZER_VERSION:
+            return None
+        if ids is not None and data["ids"] != list(ids):
+            return None
+
+        documents = [Document(**doc) for doc in data["documents"]]
+        return cls(documents, data["ids"], data["postings"], data["doc_lengths"])
+
+    @classmethod
+    def open(cls, documents, ids, path):
+        """Load the persisted index for these chunks, building and saving it if stale"""
+        index = cls.load(path, ids)
+        if index is None:
+            index = cls.build(documents, ids)
+            index.save(path)
+        return index
+
+    def search(self, query, k=4):
+        """Top-k (document, score) pairs for a query, best first"""
+        total = len(self.documents)
+        scores = {}
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings:
+                length_norm = 1 - self.b + self.b * self.doc_lengths[position] / self.avg_length
+                score = idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                scores[position] = scores.get(position, 0.0) + score
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[position], score) for position, score in ranked]
+
+    def similarity_search(self, query, k=4):
+        """Top-k documents (same shape as the vector stores)"""
+        return [doc for doc, _ in self.search(query, k)]
+
+
+def reciprocal_rank_fusion(result_lists, key, k=4, rrf_k=60):
+    """
+    Merge ranked document lists: score(d) = sum of 1 / (rrf_k + rank)
+    key maps a document to its identity across lists
+    """
+    scores = {}
+    documents = {}
+
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            doc_key = key(doc)
+            scores[doc_key] = scores.get(doc_key, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(doc_key, doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[doc_key] for doc_key in ranked]
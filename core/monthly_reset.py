@@ -0,0 +1,64 @@
+"""
+Monthly Reset Job for EducApp
+Starts every user's question count for the new month in bounded batches,
+off the request path: run it from cron shortly after midnight on the 1st
+Counters are month-scoped (a count from an earlier month reads as 0 and the
+next reservation rolls it over), so the job is an optimization, not a
+requirement; it is idempotent and safe to re-run or interrupt
+
+Usage: python -m core.monthly_reset [--month YYYY-MM] [--batch-size N] [--pause SECONDS]
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timezone
+from core.supabase_client import get_database
+
+RESET_BATCH_SIZE = int(os.getenv('EDUCAPP_RESET_BATCH_SIZE', '500'))
+# Spreads the writes out so the job never competes with the chat UI for the backend
+RESET_BATCH_PAUSE_SECONDS = float(os.getenv('EDUCAPP_RESET_BATCH_PAUSE_SECONDS', '0.5'))
+
+
+def run_monthly_reset(month_start=None, batch_size=RESET_BATCH_SIZE, pause=RESET_BATCH_PAUSE_SECONDS):
+    """
+    Reset counters from before month_start (default: the 1st of this month, UTC)
+    Returns the number of users reset, or None if a batch failed (re-run to continue)
+    """
+    month_start = month_start or datetime.now(timezone.utc).date().replace(day=1)
+    db = get_database()
+    total = 0
+    batches = 0
+
+    while True:
+        started = time.perf_counter()
+        count = db.reset_monthly_questions_batch(month_start, batch_size)
+        if count is None:
+            print(f"❌ Monthly reset stopped after {total} users; re-run to continue")
+            return None
+
+        total += count
+        batches += 1
+        print(f"🔄 Batch {batches}: {count} users reset in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        # A short batch means nothing is left (rows locked by a live reservation are rolled over by it)
+        if count < batch_size:
+            break
+        time.sleep(pause)
+
+    print(f"✅ Monthly reset for {month_start:%Y-%m}: {total} users in {batches} batch(es)")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reset monthly question counters in batches")
+    parser.add_argument('--month', help="Month to start (YYYY-MM, default current)")
+    parser.add_argument('--batch-size', type=int, default=RESET_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=RESET_BATCH_PAUSE_SECONDS,
+                        help="Seconds between batches")
+    args = parser.parse_args()
+
+    month_start = datetime.strptime(args.month, '%Y-%m').date() if args.month else None
+    reset = run_monthly_reset(month_start, args.batch_size, args.pause)
+    sys.exit(0 if reset is not None else 1)
@@ -0,0 +1,165 @@
+"""
+Password Hashing for EducApp
+bcrypt runs in a small, bounded process pool so a burst of logins or signups
+uses at most EDUCAPP_HASH_WORKERS cores and never blocks other sessions'
+script threads on hashing work
+Hashes made with a different cost than EDUCAPP_BCRYPT_ROUNDS are upgraded
+(or downgraded) the next time the user logs in
+Set EDUCAPP_HASH_WORKERS=0 to hash in the calling thread
+"""
+
+import os
+import time
+import atexit
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv('EDUCAPP_BCRYPT_ROUNDS', '12'))
+HASH_WORKERS = int(os.getenv('EDUCAPP_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+LATENCY_SAMPLES = 1000
+
+
+# Run in the worker processes
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _check(password, stored_hash):
+    return bcrypt.checkpw(password, stored_hash)
+
+
+def hash_rounds(stored_hash):
+    """Cost factor of a bcrypt hash ('$2b$12$...'), or None if it is not one"""
+    try:
+        prefix, rounds = stored_hash.split('$')[1:3]
+        return int(rounds) if prefix.startswith('2') else None
+    except (AttributeError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """bcrypt hash/verify on a lazily started process pool, with latency metrics"""
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=HASH_WORKERS):
+        self.rounds = rounds
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        # Callers beyond the pool size wait here instead of queueing unbounded work
+        self._slots = threading.BoundedSemaphore(max(workers, 1))
+        self._latencies = {'hash': deque(maxlen=LATENCY_SAMPLES), 'verify': deque(maxlen=LATENCY_SAMPLES)}
+        self.rehashes = 0
+
+    def _pool(self):
+        """The running executor, or None once hashing has fallen back to the calling thread"""
+        with self._lock:
+            if self.workers <= 0:
+                return None
+            if self._executor is None:
+                # spawn: a fresh interpreter, not a fork of a multi-threaded server
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _fall_back(self, executor):
+        """Stop using the process pool; only the first caller to see it break tears it down"""
+        with self._lock:
+            if self.workers <= 0:
+                return
+            print("⚠️ Password hashing pool failed, hashing in the calling thread")
+            # Set before the executor is cleared so _pool() cannot start a new one
+            self.workers = 0
+            if self._executor is executor:
+                self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, operation, fn, *args):
+        started = time.perf_counter()
+        try:
+            if self.workers <= 0:
+                return fn(*args)
+            with self._slots:
+                executor = self._pool()
+                if executor is None:
+                    return fn(*args)
+                try:
+                    return executor.submit(fn, *args).result()
+                except BrokenProcessPool:
+                    # Workers could not start (or died): keep serving logins in-thread
+                    self._fall_back(executor)
+                    return fn(*args)
+        finally:
+            self._latencies[operation].append((time.perf_counter() - started) * 1000)
+
+    def hash(self, password):
+        """bcrypt hash (str) of a password at the configured cost"""
+        return self._run('hash', _hash, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def verify(self, password, stored_hash):
+        """True if the password matches the stored hash"""
+        try:
+            return self._run('verify', _check, password.encode('utf-8'), stored_hash.encode('utf-8'))
+        except ValueError:
+            # Malformed or non-bcrypt hash
+            return False
+
+    def needs_rehash(self, stored_hash):
+        return hash_rounds(stored_hash) != self.rounds
+
+    def verify_and_update(self, password, stored_hash):
+        """
+        Verify a login; returns (matches, new hash or None)
+        A new hash is returned when the stored one was made with a different cost
+        """
+        if not self.verify(password, stored_hash):
+            return False, None
+        if not self.needs_rehash(stored_hash):
+            return True, None
+        self.rehashes += 1
+        return True, self.hash(password)
+
+    def stats(self):
+        """Latency (ms) per operation over the recent samples"""
+        stats = {'rounds': self.rounds, 'workers': self.workers, 'rehashes': self.rehashes}
+        for operation, samples in self._latencies.items():
+            ordered = sorted(samples)
+            count = len(ordered)
+            stats[operation] = {
+                'count': count,
+                'p50_ms': ordered[count // 2] if count else 0.0,
+                'p95_ms': ordered[min(count - 1, int(count * 0.95))] if count else 0.0,
+                'max_ms': ordered[-1] if count else 0.0
+            }
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+# Shared by every database backend in the process
+password_hasher = PasswordHasher()
+atexit.register(password_hasher.close)
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Password Hasher\n")
+
+    stored = password_hasher.hash("correct horse")
+    print(f"Hash: {stored}")
+    print(f"Verify correct: {password_hasher.verify('correct horse', stored)}")
+    print(f"Verify wrong: {password_hasher.verify('wrong', stored)}")
+
+    cheap = PasswordHasher(rounds=4, workers=0).hash("correct horse")
+    print(f"Rehash cost {hash_rounds(cheap)} -> {BCRYPT_ROUNDS}: "
+          f"{password_hasher.verify_and_update('correct horse', cheap)[1] is not None}")
+    print(f"\nStats: {password_hasher.stats()}")
@@ -4,10 +4,105 @@ Retrieves relevant biblical worldview content to guide AI responses
 """
 
 import os
+import json
+import fcntl
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from core.embeddings import get_embeddings
+from core.vector_index import NumpyVectorIndex, SUPPORTED_DTYPES
+from core.lexical_index import BM25Index, reciprocal_rank_fusion
+
+# Vector store backend: "chroma" (default) or "numpy" (in-process, memory-mapped)
+VECTOR_STORE = os.getenv('EDUCAPP_VECTOR_STORE', 'chroma')
+# Storage precision for the numpy store: float32, float16 or int8
+VECTOR_DTYPE = os.getenv('EDUCAPP_VECTOR_DTYPE', 'float32')
+VECTOR_INDEX_DIR = "./vector_index"
+LEXICAL_INDEX_DIR = "./lexical_index"
+# Each retriever returns this many times the final k before rank fusion
+CANDIDATE_MULTIPLIER = 3
+# Past this many seconds the query is answered from the keyword index alone
+EMBEDDING_TIMEOUT = float(os.getenv('EDUCAPP_EMBEDDING_TIMEOUT', '5'))
+# Queries the engine expects to serve at once (sizes the embedding and search pools)
+RAG_CONCURRENCY = int(os.getenv('EDUCAPP_RAG_CONCURRENCY', '4'))
+
+# Per-collection record of indexed chunks, stored next to the Chroma files
+MANIFEST_FILENAME = "manifest.json"
+# Held while a worker syncs a collection, so concurrent starts never race
+SYNC_LOCK_FILENAME = ".sync.lock"
+
+
+def content_hash(text):
+    """SHA-256 of a chunk's text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def chunk_id(doc):
+    """Deterministic document ID derived from the chunk's source file and content"""
+    return content_hash(f"{doc.metadata['source']}\n{doc.page_content}")
+
+
+def _read_manifest(path):
+    """
+    Load a collection manifest
+    Returns None if the collection has never been synced or the manifest is unreadable
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read index manifest {path}: {e}")
+        return None
+
+
+def _write_manifest(path, embedding_model, chunks):
+    """Write a manifest atomically so concurrent workers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump({"embedding_model": embedding_model, "chunks": chunks}, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_directory(path):
+    """Load all .txt files from directory into chunked Document objects"""
+    documents = []
+    
+    if not os.path.exists(path):
+        print(f"Warning: Directory not found: {path}")
+        return documents
+    
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith('.txt'):
+            filepath = os.path.join(path, filename)
+            try:
+                with open(filepath, 'r', encoding='utf-8') as file:
+                    content = file.read()
+                    
+                    # Split into chunks for better retrieval
+                    splitter = RecursiveCharacterTextSplitter(
+                        chunk_size=1000,
+                        chunk_overlap=200
+                    )
+                    chunks = splitter.split_text(content)
+                    
+                    for chunk in chunks:
+                        documents.append(
+                            Document(
+                                page_content=chunk,
+                                metadata={"source": filename}
+                            )
+                        )
+            except Exception as e:
+                print(f"Error loading {filename}: {e}")
+    
+    return documents
+
 
 class BiblicalWorldviewRAG:
     """
@@ -17,121 +112,258 @@ class BiblicalWorldviewRAG:
     3. Scripture references
     """
     
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings()
+    def __init__(self, embeddings=None, vector_store=None, vector_dtype=None):
+        # Cached provider from core.embeddings unless the caller supplies one
+        self.embeddings = embeddings or get_embeddings()
+        self.vector_store = vector_store or VECTOR_STORE
+        self.vector_dtype = vector_dtype or VECTOR_DTYPE
+        if self.vector_store not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown vector store: {self.vector_store} (expected 'chroma' or 'numpy')")
+        if self.vector_dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {self.vector_dtype} (expected one of {SUPPORTED_DTYPES})")
         self.worldview_db = None
         self.curriculum_db = None
         self.scripture_db = None
+        # BM25 index per collection, keyed like the retrieve_context output
+        self.lexical_indexes = {}
+        # Separate pools: an embedding call still running after its timeout
+        # holds an embedding worker, never one that searches
+        self._embedding_executor = ThreadPoolExecutor(max_workers=RAG_CONCURRENCY,
+                                                      thread_name_prefix="rag-embed")
+        # One worker per collection for each query in flight, so its searches run side by side
+        self._search_executor = ThreadPoolExecutor(max_workers=3 * RAG_CONCURRENCY,
+                                                   thread_name_prefix="rag-search")
         self._initialize_knowledge_bases()
     
     def _initialize_knowledge_bases(self):
-        """Load and vectorize all knowledge bases"""
+        """Open the persisted knowledge bases, embedding only chunks that changed"""
         
         print("Loading biblical worldview knowledge base...")
         
         # Priority 1: Biblical Worldview
         worldview_docs = self._load_directory("knowledge_base/biblical_worldview/")
         if worldview_docs:
-            self.worldview_db = Chroma.from_documents(
+            self.worldview_db = self._open_collection(
                 worldview_docs,
-                self.embeddings,
                 collection_name="biblical_worldview",
                 persist_directory="./chroma_db/worldview"
             )
+            self.lexical_indexes["worldview"] = self._open_lexical_index(worldview_docs, "biblical_worldview")
             print(f"✓ Loaded {len(worldview_docs)} worldview documents")
         
         # Priority 2: Curricula (Saxon, Apologia, Classical)
         curriculum_docs = self._load_directory("knowledge_base/curricula/")
         if curriculum_docs:
-            self.curriculum_db = Chroma.from_documents(
+            self.curriculum_db = self._open_collection(
                 curriculum_docs,
-                self.embeddings,
                 collection_name="curricula",
                 persist_directory="./chroma_db/curricula"
             )
+            self.lexical_indexes["curriculum"] = self._open_lexical_index(curriculum_docs, "curricula")
             print(f"✓ Loaded {len(curriculum_docs)} curriculum documents")
         
         # Priority 3: Scripture topical index
         scripture_docs = self._load_directory("knowledge_base/scripture/")
         if scripture_docs:
-            self.scripture_db = Chroma.from_documents(
+            self.scripture_db = self._open_collection(
                 scripture_docs,
-                self.embeddings,
                 collection_name="scripture",
                 persist_directory="./chroma_db/scripture"
             )
+            self.lexical_indexes["scripture"] = self._open_lexical_index(scripture_docs, "scripture")
             print(f"✓ Loaded {len(scripture_docs)} scripture documents")
         
         print("Knowledge bases ready!\n")
     
-    def _load_directory(self, path):
-        """Load all .txt files from directory into Document objects"""
-        documents = []
+    def _open_collection(self, documents, collection_name, persist_directory):
+        """Open one knowledge base in the configured vector store"""
+        if self.vector_store == "numpy":
+            return self._open_numpy_collection(documents, collection_name)
+        return self._sync_collection(documents, collection_name, persist_directory)
+    
+    def _open_lexical_index(self, documents, collection_name):
+        """Load the persisted BM25 index for a collection, rebuilding it if the chunks changed"""
+        ids = [chunk_id(doc) for doc in documents]
+        return BM25Index.open(documents, ids, os.path.join(LEXICAL_INDEX_DIR, collection_name))
+    
+    def _open_numpy_collection(self, documents, collection_name):
+        """
+        Memory-map a saved NumpyVectorIndex, rebuilding it only when the chunk set,
+        embedding model or storage dtype changed (unchanged chunks come from the embedding cache)
+        """
+        path = os.path.join(VECTOR_INDEX_DIR, collection_name)
+        embedding_model = getattr(self.embeddings, "model_name", type(self.embeddings).__name__)
         
-        if not os.path.exists(path):
-            print(f"Warning: Directory not found: {path}")
-            return documents
+        wanted = {}
+        for doc in documents:
+            wanted[chunk_id(doc)] = doc
         
-        for filename in os.listdir(path):
-            if filename.endswith('.txt'):
-                filepath = os.path.join(path, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as file:
-                        content = file.read()
-                        
-                        # Split into chunks for better retrieval
-                        splitter = RecursiveCharacterTextSplitter(
-                            chunk_size=1000,
-                            chunk_overlap=200
-                        )
-                        chunks = splitter.split_text(content)
-                        
-                        for chunk in chunks:
-                            documents.append(
-                                Document(
-                                    page_content=chunk,
-                                    metadata={"source": filename}
-                                )
-                            )
-                except Exception as e:
-                    print(f"Error loading {filename}: {e}")
+        if NumpyVectorIndex.read_metadata(path) == (embedding_model, self.vector_dtype, list(wanted)):
+            return NumpyVectorIndex.load(path, embedding_function=self.embeddings)
         
-        return documents
+        print(f"  {collection_name}: building {self.vector_dtype} index for {len(wanted)} chunks")
+        return NumpyVectorIndex.build(
+            list(wanted.values()),
+            list(wanted),
+            self.embeddings,
+            path,
+            dtype=self.vector_dtype,
+            embedding_model=embedding_model
+        )
     
-    def retrieve_context(self, query, subject="general"):
+    def _sync_collection(self, documents, collection_name, persist_directory):
+        """
+        Open a persisted Chroma collection and bring it in line with the documents on disk.
+        Chunk IDs are content hashes, so unchanged chunks are never re-embedded,
+        chunks from edited or deleted files are removed, and restarts add nothing.
+        Workers starting together take turns, so only the first one embeds anything.
+        """
+        os.makedirs(persist_directory, exist_ok=True)
+        with open(os.path.join(persist_directory, SYNC_LOCK_FILENAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return self._sync_collection_locked(documents, collection_name, persist_directory)
+    
+    def _sync_collection_locked(self, documents, collection_name, persist_directory):
+        db = Chroma(
+            collection_name=collection_name,
+            embedding_function=self.embeddings,
+            persist_directory=persist_directory
+        )
+        
+        manifest_path = os.path.join(persist_directory, MANIFEST_FILENAME)
+        embedding_model = getattr(self.embeddings, "model_name", type(self.embeddings).__name__)
+        manifest = _read_manifest(manifest_path)
+        
+        # Reconcile against what Chroma actually holds, not the manifest: the
+        # Chroma files may have been wiped, or a sync may have died before
+        # writing the manifest
+        stored_ids = set(db.get(include=[])["ids"])
+        
+        if manifest and manifest.get("embedding_model") != embedding_model and stored_ids:
+            # Vectors from another model cannot be mixed with new ones - start over once
+            print(f"Rebuilding {collection_name}: dropping {len(stored_ids)} vectors "
+                  f"from {manifest.get('embedding_model')}")
+            db.delete_collection()
+            db = Chroma(
+                collection_name=collection_name,
+                embedding_function=self.embeddings,
+                persist_directory=persist_directory
+            )
+            stored_ids = set()
+        
+        wanted = {}
+        for doc in documents:
+            wanted[chunk_id(doc)] = doc
+        
+        # Also drops the random-ID duplicates left by collections built before the manifest
+        removed_ids = [doc_id for doc_id in stored_ids if doc_id not in wanted]
+        added_ids = [doc_id for doc_id in wanted if doc_id not in stored_ids]
+        
+        if removed_ids:
+            db.delete(ids=removed_ids)
+        
+        if added_ids:
+            db.add_documents([wanted[doc_id] for doc_id in added_ids], ids=added_ids)
+        
+        chunks = {
+            doc_id: {
+                "source": doc.metadata["source"],
+                "sha256": content_hash(doc.page_content)
+            }
+            for doc_id, doc in wanted.items()
+        }
+        if added_ids or removed_ids or manifest != {"embedding_model": embedding_model, "chunks": chunks}:
+            _write_manifest(manifest_path, embedding_model, chunks)
+            print(f"  {collection_name}: embedded {len(added_ids)} new chunks, removed {len(removed_ids)}")
+        
+        return db
+    
+    def _load_directory(self, path):
+        """Load all .txt files from directory into Document objects"""
+        return load_directory(path)
+    
+    def embed_query(self, query):
+        """Embed a query once so every collection can be searched with the same vector"""
+        return self.embeddings.embed_query(query)
+    
+    def try_embed_query(self, query):
+        """
+        Embed a query, giving up after EMBEDDING_TIMEOUT seconds
+        Returns None if the embedding service fails or is too slow
+        """
+        future = self._embedding_executor.submit(self.embed_query, query)
+        try:
+            return future.result(timeout=EMBEDDING_TIMEOUT)
+        except Exception as e:
+            # Drop the call if it is still queued behind slow ones
+            future.cancel()
+            print(f"Embedding unavailable, using keyword search only: {e!r}")
+            return None
+    
+    def _search_collection(self, db, query_vector, k):
+        """Run one vector search and time it (called from the retrieval thread pool)"""
+        start = time.perf_counter()
+        results = db.similarity_search_by_vector(query_vector, k=k)
+        return results, (time.perf_counter() - start) * 1000
+    
+    def retrieve_context(self, query, subject="general", query_vector=None, embed=True):
         """
         Retrieve relevant context with biblical worldview prioritized
-        Returns: dict with worldview, curriculum, and scripture contexts
+        The query is embedded once, all collections are searched in parallel, and
+        vector and BM25 results are merged with reciprocal rank fusion.
+        If the embedding service fails or is slow, keyword results are used alone.
+        Pass embed=False when the caller already tried try_embed_query: a None
+        query_vector then goes straight to keyword search instead of waiting again.
+        Returns: dict with worldview, curriculum, and scripture contexts,
+        plus per-step timings in milliseconds
         """
         
         context = {
             "worldview": [],
             "curriculum": [],
-            "scripture": []
+            "scripture": [],
+            "timings": {}
         }
         
-        # Always check worldview first for foundational issues
-        if self.worldview_db:
-            try:
-                worldview_results = self.worldview_db.similarity_search(query, k=2)
-                context["worldview"] = [doc.page_content for doc in worldview_results]
-            except Exception as e:
-                print(f"Error retrieving worldview context: {e}")
+        start = time.perf_counter()
+        if query_vector is None and embed:
+            query_vector = self.try_embed_query(query)
+            context["timings"]["embedding"] = (time.perf_counter() - start) * 1000
         
-        # Get curriculum-specific context
-        if self.curriculum_db:
-            try:
-                curriculum_results = self.curriculum_db.similarity_search(query, k=3)
-                context["curriculum"] = [doc.page_content for doc in curriculum_results]
-            except Exception as e:
-                print(f"Error retrieving curriculum context: {e}")
+        # Worldview first for foundational issues, then curriculum, then Scripture
+        # (the prompt uses at most two curriculum passages)
+        collections = [
+            ("worldview", self.worldview_db, 2),
+            ("curriculum", self.curriculum_db, 2),
+            ("scripture", self.scripture_db, 1)
+        ]
         
-        # Get relevant Scripture
-        if self.scripture_db:
-            try:
-                scripture_results = self.scripture_db.similarity_search(query, k=1)
-                context["scripture"] = [doc.page_content for doc in scripture_results]
-            except Exception as e:
-                print(f"Error retrieving scripture context: {e}")
+        futures = {}
+        if query_vector is not None:
+            futures = {
+                name: self._search_executor.submit(self._search_collection, db, query_vector, k * CANDIDATE_MULTIPLIER)
+                for name, db, k in collections
+                if db
+            }
+        
+        for name, db, k in collections:
+            lexical_results = []
+            lexical_index = self.lexical_indexes.get(name)
+            if lexical_index:
+                lexical_start = time.perf_counter()
+                lexical_results = lexical_index.similarity_search(query, k=k * CANDIDATE_MULTIPLIER)
+                context["timings"][f"{name}_bm25"] = (time.perf_counter() - lexical_start) * 1000
+            
+            vector_results = []
+            if name in futures:
+                try:
+                    vector_results, elapsed = futures[name].result()
+                    context["timings"][name] = elapsed
+                except Exception as e:
+                    print(f"Error retrieving {name} context: {e}")
+            
+            fused = reciprocal_rank_fusion([vector_results, lexical_results], key=chunk_id, k=k)
+            context[name] = [doc.page_content for doc in fused]
         
-        return context
\ No newline at end of file
+        context["timings"]["total"] = (time.perf_counter() - start) * 1000
+        return context
@@ -0,0 +1,134 @@
+"""
+Semantic Response Cache for EducApp
+Serves stored tutor answers for near-duplicate questions
+Entries are matched by query-embedding similarity within the same subject,
+grade and guardrail result, and expire by TTL and LRU size limit
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SIMILARITY_THRESHOLD = float(os.getenv('EDUCAPP_CACHE_SIMILARITY', '0.95'))
+CACHE_TTL_SECONDS = int(os.getenv('EDUCAPP_CACHE_TTL_SECONDS', str(24 * 60 * 60)))
+CACHE_MAX_ENTRIES = int(os.getenv('EDUCAPP_CACHE_MAX_ENTRIES', '2000'))
+
+
+def cache_scope(subject, grade, guardrail_check):
+    """Answers are only reused between questions with the same subject, grade and guardrail flags"""
+    return (
+        (subject or "general").lower(),
+        grade,
+        guardrail_check["needs_parent_discussion"],
+        guardrail_check["biblical_context_area"],
+        tuple(sorted(guardrail_check["detected_topics"]))
+    )
+
+
+class SemanticResponseCache:
+    """
+    Thread-safe in-process cache of raw LLM answers
+    Post-processing (parent guidance, biblical grounding) is applied by the caller on every hit
+    """
+
+    def __init__(self, similarity_threshold=SIMILARITY_THRESHOLD, ttl_seconds=CACHE_TTL_SECONDS,
+                 max_entries=CACHE_MAX_ENTRIES):
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # entry id -> entry, least recently used first
+        self._entries = OrderedDict()
+        # scope -> {entry id, ...}
+        self._scopes = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        scope_ids = self._scopes[entry["scope"]]
+        scope_ids.discard(entry_id)
+        if not scope_ids:
+            del self._scopes[entry["scope"]]
+
+    def lookup(self, query_vector, subject, grade, guardrail_check):
+        """
+        Return the most similar fresh entry in scope above the threshold, or None
+        Entry keys: response, scripture, similarity
+        """
+        scope = cache_scope(subject, grade, guardrail_check)
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        now = time.time()
+
+        with self._lock:
+            candidates = []
+            for entry_id in list(self._scopes.get(scope, ())):
+                entry = self._entries[entry_id]
+                if now - entry["created"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    self.evictions += 1
+                else:
+                    candidates.append(entry_id)
+
+            if candidates:
+                matrix = np.stack([self._entries[entry_id]["vector"] for entry_id in candidates])
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    entry_id = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    entry = self._entries[entry_id]
+                    return {
+                        "response": entry["response"],
+                        "scripture": entry["scripture"],
+                        "similarity": float(similarities[best])
+                    }
+
+            self.misses += 1
+            return None
+
+    def store(self, query_vector, subject, grade, guardrail_check, response, scripture):
+        """Remember a raw answer (before post-processing) and the Scripture context it used"""
+        scope = cache_scope(subject, grade, guardrail_check)
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "scope": scope,
+                "vector": vector,
+                "response": response,
+                "scripture": list(scripture),
+                "created": time.time()
+            }
+            self._scopes.setdefault(scope, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (metrics are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self):
+        """Hit/miss metrics for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'evictions': self.evictions
+            }
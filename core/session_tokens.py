@@ -0,0 +1,196 @@
+"""
+Session Tokens for EducApp
+Signed, expiring tokens that let a returning browser skip the login form
+A token carries the user's id, email, name and subscription tier, signed with
+HMAC-SHA256, so checking one is local work: no database call, no bcrypt
+Logouts and password changes go on a small revocation list kept in memory
+and in a JSON file, so every process on the machine sees them
+
+The token travels in the page URL (?session=..., see core/auth.py), so it ends up
+in browser history, in Referer headers sent to linked sites and in any link a
+student copies or shares. Anyone holding it is logged in as that student until
+it expires or they log out, which is why EDUCAPP_SESSION_TTL_HOURS is short
+
+EDUCAPP_SESSION_SECRET must be set (it also keeps tokens valid across restarts);
+only with EDUCAPP_ENV=development does a missing secret fall back to a random one
+"""
+
+import os
+import hmac
+import json
+import time
+import fcntl
+import base64
+import hashlib
+import secrets
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SESSION_TTL_HOURS = float(os.getenv('EDUCAPP_SESSION_TTL_HOURS', '24'))
+REVOCATION_PATH = os.getenv('EDUCAPP_REVOKED_SESSIONS_PATH', './revoked_sessions.json')
+APP_ENV = os.getenv('EDUCAPP_ENV', 'production')
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _load_secret():
+    secret = os.getenv('EDUCAPP_SESSION_SECRET')
+    if secret:
+        return secret.encode('utf-8')
+    if APP_ENV != 'development':
+        # A random per-process secret logs students out on every restart and makes
+        # each worker reject the others' tokens
+        raise ValueError("EDUCAPP_SESSION_SECRET must be set in .env file "
+                         "(or set EDUCAPP_ENV=development to use a throwaway secret)")
+    print("⚠️ EDUCAPP_SESSION_SECRET not set: using a throwaway secret, sessions will not survive a restart")
+    return secrets.token_bytes(32)
+
+
+class SessionTokens:
+    """Issue and verify HMAC-signed session tokens, with revocation"""
+
+    def __init__(self, secret=None, ttl_hours=SESSION_TTL_HOURS, revocation_path=REVOCATION_PATH):
+        self._secret = secret or _load_secret()
+        self.ttl_seconds = ttl_hours * 3600
+        self.revocation_path = revocation_path
+        self._lock = threading.Lock()
+        # token id -> expiry of the revoked token
+        self._revoked = {}
+        # user id -> tokens issued before this time are revoked
+        self._revoked_before = {}
+        self._revocations_mtime = None
+
+    def _sign(self, payload):
+        return hmac.new(self._secret, payload.encode('ascii'), hashlib.sha256).digest()
+
+    def issue(self, user_id, email, name, tier='free'):
+        """A signed token for this user, valid for ttl_hours"""
+        now = time.time()
+        claims = {
+            'jti': secrets.token_urlsafe(12),
+            'uid': user_id,
+            'email': email,
+            'name': name,
+            'tier': tier,
+            'iat': now,
+            'exp': now + self.ttl_seconds
+        }
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        return f"{payload}.{_b64encode(self._sign(payload))}"
+
+    def verify(self, token):
+        """The token's claims, or None if it is forged, malformed, expired or revoked"""
+        try:
+            payload, signature = token.split('.')
+            if not hmac.compare_digest(_b64decode(signature), self._sign(payload)):
+                return None
+            claims = json.loads(_b64decode(payload))
+        except (AttributeError, ValueError, UnicodeEncodeError):
+            return None
+
+        if claims.get('exp', 0) < time.time():
+            return None
+
+        self._refresh_revocations()
+        with self._lock:
+            if claims['jti'] in self._revoked:
+                return None
+            if claims['iat'] < self._revoked_before.get(str(claims['uid']), 0):
+                return None
+        return claims
+
+    def revoke(self, token):
+        """Revoke one token (logout)"""
+        try:
+            claims = json.loads(_b64decode(token.split('.')[0]))
+        except (AttributeError, ValueError, UnicodeEncodeError):
+            return
+        with self._lock:
+            self._revoked[claims['jti']] = claims['exp']
+        self._save_revocations()
+
+    def revoke_user(self, user_id):
+        """Revoke every token issued to a user so far (see auth.update_password)"""
+        with self._lock:
+            self._revoked_before[str(user_id)] = time.time()
+        self._save_revocations()
+
+    def _refresh_revocations(self, force=False):
+        """Pick up revocations written by other processes (one stat() per check)"""
+        try:
+            mtime = os.stat(self.revocation_path).st_mtime
+        except OSError:
+            return
+        if mtime == self._revocations_mtime and not force:
+            return
+        try:
+            with open(self.revocation_path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading revoked sessions: {e}")
+            return
+        with self._lock:
+            self._revoked.update(saved.get('tokens', {}))
+            for user_id, before in saved.get('users', {}).items():
+                self._revoked_before[user_id] = max(before, self._revoked_before.get(user_id, 0))
+            self._revocations_mtime = mtime
+
+    def _save_revocations(self):
+        try:
+            lock_file = open(f"{self.revocation_path}.lock", 'a')
+        except OSError as e:
+            print(f"Error saving revoked sessions: {e}")
+            return
+
+        # One writer at a time across processes, so the merge below never drops
+        # a revocation another worker saved between our read and our write
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._refresh_revocations(force=True)
+            now = time.time()
+            with self._lock:
+                # Expired tokens fail verification anyway
+                self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+                self._revoked_before = {uid: before for uid, before in self._revoked_before.items()
+                                        if before > now - self.ttl_seconds}
+                saved = {'tokens': self._revoked, 'users': self._revoked_before}
+                tmp_path = None
+                try:
+                    directory, name = os.path.split(os.path.abspath(self.revocation_path))
+                    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix='.tmp', dir=directory)
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(saved, f)
+                    os.replace(tmp_path, self.revocation_path)
+                    self._revocations_mtime = os.stat(self.revocation_path).st_mtime
+                except OSError as e:
+                    print(f"Error saving revoked sessions: {e}")
+                    if tmp_path and os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+session_tokens = SessionTokens()
+
+
+if __name__ == "__main__":
+    print("🧪 Testing Session Tokens\n")
+
+    token = session_tokens.issue(1, 'student@example.com', 'Student', 'free')
+    print(f"Token: {token}")
+    print(f"Valid: {session_tokens.verify(token) is not None}")
+    print(f"Tampered: {session_tokens.verify(token[:-2] + 'xx') is not None}")
+
+    started = time.perf_counter()
+    for _ in range(10000):
+        session_tokens.verify(token)
+    print(f"Verify: {(time.perf_counter() - started) * 100:.1f} µs per token")
+
+    session_tokens.revoke(token)
+    print(f"After revoke: {session_tokens.verify(token) is not None}")
@@ -6,18 +6,16 @@ Stripe payment integration for EducApp
 import stripe
 import os
 from dotenv import load_dotenv
-from core.database_supabase import SupabaseDatabase
+from core.supabase_client import get_database
 
-# Initialize database
-db = SupabaseDatabase()
 
 def upgrade_to_paid(email, subscription_id=None):
     """Upgrade user to paid subscription"""
-    db.update_subscription(email, 'active', subscription_id)
+    get_database().update_subscription(email, 'active', subscription_id)
 
 def get_user_subscription_status(email):
     """Get user's subscription status"""
-    user = db.get_user_by_email(email)
+    user = get_database().get_user_by_email(email)
     return user.get('subscription_status', 'free') if user else 'free'
 
 # Load environment variables
@@ -0,0 +1,104 @@
+"""
+Database Client Registry for EducApp
+One lazily created database per process, shared by every module and session
+The Supabase client reuses pooled HTTP/2 keep-alive connections with explicit
+timeouts, and retries transient connection failures with jittered backoff
+Set EDUCAPP_DB_BACKEND=local to use the SQLite stand-in (core/database_local.py)
+"""
+
+import os
+import time
+import random
+import threading
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_BACKEND = os.getenv('EDUCAPP_DB_BACKEND', 'supabase')
+
+SUPABASE_CONNECT_TIMEOUT = float(os.getenv('EDUCAPP_SUPABASE_CONNECT_TIMEOUT', '5'))
+SUPABASE_TIMEOUT = float(os.getenv('EDUCAPP_SUPABASE_TIMEOUT', '15'))
+SUPABASE_RETRIES = int(os.getenv('EDUCAPP_SUPABASE_RETRIES', '3'))
+RETRY_BACKOFF_SECONDS = 0.2
+MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Safe to resend after the request may have reached the server
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+RETRY_STATUS_CODES = frozenset([502, 503, 504])
+
+
+class RetryTransport(httpx.HTTPTransport):
+    """
+    Retries with full-jitter exponential backoff:
+    connection failures for every request (nothing was sent), and read
+    timeouts / gateway errors only for idempotent reads
+    """
+
+    def __init__(self, retries=SUPABASE_RETRIES, backoff=RETRY_BACKOFF_SECONDS, **kwargs):
+        super().__init__(**kwargs)
+        self.retries = retries
+        self.backoff = backoff
+
+    def handle_request(self, request):
+        idempotent = request.method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                response = super().handle_request(request)
+                if not (idempotent and response.status_code in RETRY_STATUS_CODES and attempt < self.retries):
+                    return response
+                response.close()
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt >= self.retries:
+                    raise
+            except (httpx.ReadTimeout, httpx.RemoteProtocolError):
+                if not idempotent or attempt >= self.retries:
+                    raise
+
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            attempt += 1
+
+
+def create_http_client():
+    """Pooled HTTP/2 client with keep-alive, timeouts and retries"""
+    return httpx.Client(
+        transport=RetryTransport(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+        ),
+        timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+        follow_redirects=True
+    )
+
+
+def create_supabase_client(url, key):
+    """Supabase client on the shared pooled transport"""
+    from supabase import create_client, ClientOptions
+
+    try:
+        options = ClientOptions(httpx_client=create_http_client())
+    except TypeError:
+        # supabase-py releases without httpx_client: at least bound the timeout
+        options = ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT)
+    return create_client(url, key, options=options)
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_database():
+    """The process-wide database, created on first use"""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                if DB_BACKEND == 'local':
+                    from core.database_local import LocalDatabase
+                    _database = LocalDatabase()
+                else:
+                    from core.database_supabase import SupabaseDatabase
+                    _database = SupabaseDatabase()
+                print(f"✅ Database backend: {DB_BACKEND}")
+    return _database
@@ -6,10 +6,9 @@ Tracks token usage and estimates costs for Anthropic Claude API
 
 import os
 from datetime import datetime
-from core.database_supabase import SupabaseDatabase
+from core.supabase_client import get_database
+from core.write_behind import queue_api_call
 
-# Initialize database
-db = SupabaseDatabase()
 
 # Claude 3 Opus Pricing (as of Nov 2024)
 INPUT_COST_PER_1M_TOKENS = 15.00   # $15 per 1M input tokens
@@ -19,15 +18,21 @@ OUTPUT_COST_PER_1M_TOKENS = 75.00  # $75 per 1M output tokens
 SONNET_INPUT_COST_PER_1M = 3.00
 SONNET_OUTPUT_COST_PER_1M = 15.00
 
+# Prompt caching, relative to the model's input price
+CACHE_WRITE_MULTIPLIER = 1.25  # 5-minute cache writes cost 25% more
+CACHE_READ_MULTIPLIER = 0.10   # cache hits cost 10% of normal input
 
-def estimate_cost(input_tokens, output_tokens, model='claude-3-opus'):
+
+def estimate_cost(input_tokens, output_tokens, model='claude-3-opus', cache_read_tokens=0, cache_write_tokens=0):
     """
     Estimate cost for an API call
     
     Args:
-        input_tokens: Number of input tokens
+        input_tokens: Number of uncached input tokens
         output_tokens: Number of output tokens
         model: Model name ('claude-3-opus' or 'claude-3-5-sonnet')
+        cache_read_tokens: Input tokens served from the prompt cache
+        cache_write_tokens: Input tokens written to the prompt cache
     
     Returns:
         Estimated cost in USD
@@ -41,8 +46,11 @@ def estimate_cost(input_tokens, output_tokens, model='claude-3-opus'):
     
     input_cost = (input_tokens / 1_000_000) * input_cost_per_1m
     output_cost = (output_tokens / 1_000_000) * output_cost_per_1m
+    cache_cost = (
+        cache_read_tokens * CACHE_READ_MULTIPLIER + cache_write_tokens * CACHE_WRITE_MULTIPLIER
+    ) / 1_000_000 * input_cost_per_1m
     
-    total_cost = input_cost + output_cost
+    total_cost = input_cost + output_cost + cache_cost
     return round(total_cost, 6)  # Round to 6 decimal places
 
 
@@ -52,25 +60,27 @@ def format_cost(cost_usd):
     return f"${cost_usd:.4f} (R${cost_brl:.2f})"
 
 
-def track_api_call(user_email, input_tokens, output_tokens, model='claude-3-opus'):
+def track_api_call(user_email, input_tokens, output_tokens, model='claude-3-opus',
+                   cache_read_tokens=0, cache_write_tokens=0):
     """
     Track an API call and log to database
     
     Args:
         user_email: User's email address
-        input_tokens: Number of input tokens
+        input_tokens: Number of uncached input tokens
         output_tokens: Number of output tokens
         model: Model name
+        cache_read_tokens: Input tokens served from the prompt cache
+        cache_write_tokens: Input tokens written to the prompt cache
     
     Returns:
         Estimated cost in USD
     """
-    # Note: API call logging not yet implemented in Supabase
-    # This is a placeholder for future implementation
-    estimated_cost = estimate_cost(input_tokens, output_tokens, model)
+    estimated_cost = estimate_cost(input_tokens, output_tokens, model, cache_read_tokens, cache_write_tokens)
     
-    # TODO: Add API call logging to Supabase database
-    # db.log_api_call(user_email, input_tokens, output_tokens, estimated_cost, model)
+    # Written in the background with the user's monthly usage_rollup row
+    queue_api_call(user_email, input_tokens, output_tokens, estimated_cost, model,
+                   cache_read_tokens, cache_write_tokens)
     
     return estimated_cost
 
@@ -82,24 +92,23 @@ def get_user_monthly_stats(user_email):
     Returns:
         Dictionary with usage stats
     """
-    # Note: Detailed usage tracking not yet implemented
-    # This is a placeholder for future implementation
-    
-    # TODO: Add monthly cost tracking to Supabase
-    # total_cost = db.get_monthly_cost(user_email)
-    # total_questions = db.get_monthly_usage(user_email)
+    rollup = get_database().get_monthly_usage_rollup(user_email)
     
-    user = db.get_user_by_email(user_email)
-    total_questions = user.get('questions_asked', 0) if user else 0
+    if rollup is not None:
+        total_calls = rollup['api_calls']
+        total_cost = rollup['estimated_cost']
+    else:
+        # Rollup unavailable: rough estimate, one call per question asked
+        user = get_database().get_user_by_email(user_email)
+        total_calls = user.get('questions_asked', 0) if user else 0
+        total_cost = total_calls * 0.05  # Approximate $0.05 per call
     
-    # Rough estimate based on questions asked
-    total_cost = total_questions * 0.05  # Approximate $0.05 per question
-    avg_cost_per_question = total_cost / total_questions if total_questions > 0 else 0
+    avg_cost_per_call = total_cost / total_calls if total_calls > 0 else 0
     
     return {
         'total_cost': total_cost,
-        'total_questions': total_questions,
-        'avg_cost_per_question': avg_cost_per_question
+        'total_api_calls': total_calls,
+        'avg_cost_per_call': avg_cost_per_call
     }
 
 
@@ -125,19 +134,21 @@ def estimate_monthly_burn_rate():
     Returns:
         Dictionary with burn rate statistics
     """
-    # Note: Detailed API cost tracking not yet implemented
-    # This is a placeholder for future implementation
-    
-    # TODO: Add comprehensive API cost tracking to Supabase
-    user_stats = db.get_user_stats()
+    user_stats = get_database().get_user_stats()
+    usage_totals = get_database().get_monthly_usage_totals()
     
     free_users = user_stats.get('free_users', 0)
     paid_users = user_stats.get('paid_users', 0)
-    total_questions = user_stats.get('total_questions', 0)
     
-    # Rough estimate
-    total_cost = total_questions * 0.05  # ~$0.05 per question
-    avg_cost_per_call = 0.05
+    if usage_totals is not None:
+        total_calls = usage_totals['api_calls']
+        total_cost = usage_totals['estimated_cost']
+        avg_cost_per_call = total_cost / total_calls if total_calls > 0 else 0
+    else:
+        # Rollup unavailable: rough estimate, one call per question
+        total_calls = user_stats.get('total_questions', 0)
+        total_cost = total_calls * 0.05  # ~$0.05 per call
+        avg_cost_per_call = 0.05
     
     # Calculate revenue
     monthly_revenue = paid_users * 15  # $15 per paid user
@@ -151,7 +162,8 @@ def estimate_monthly_burn_rate():
         'profit_loss': profit,
         'free_users': free_users,
         'paid_users': paid_users,
-        'total_calls': total_questions,
+        'new_users': user_stats.get('new_users', 0),
+        'total_calls': total_calls,
         'avg_cost_per_call': avg_cost_per_call
     }
 
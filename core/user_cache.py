@@ -0,0 +1,98 @@
+"""
+User Row Cache for EducApp
+Short-lived, process-wide cache of Supabase user rows, keyed by email and id
+A single Streamlit rerun looks the same user up several times (sidebar usage,
+user id, payment checks); the cache turns those into one request
+Writes that change a user (subscriptions, counters, resets) invalidate the entry
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+USER_CACHE_TTL_SECONDS = float(os.getenv('EDUCAPP_USER_CACHE_TTL_SECONDS', '30'))
+USER_CACHE_MAX_ENTRIES = int(os.getenv('EDUCAPP_USER_CACHE_MAX_ENTRIES', '10000'))
+
+
+class UserCache:
+    """Thread-safe TTL + LRU cache of user rows; returns copies so callers cannot mutate entries"""
+
+    def __init__(self, ttl_seconds=USER_CACHE_TTL_SECONDS, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # email -> (expires at, row), least recently used first
+        self._rows = OrderedDict()
+        # id -> email
+        self._emails = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _remove(self, email):
+        _, row = self._rows.pop(email)
+        self._emails.pop(row.get('id'), None)
+
+    def get(self, email):
+        """Cached row for this email, or None"""
+        with self._lock:
+            entry = self._rows.get(email)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(email)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._rows.move_to_end(email)
+            self.hits += 1
+            return dict(entry[1])
+
+    def get_by_id(self, user_id):
+        with self._lock:
+            email = self._emails.get(user_id)
+        return self.get(email) if email is not None else None
+
+    def put(self, row):
+        """Remember a freshly fetched row"""
+        if not row or not row.get('email'):
+            return
+        with self._lock:
+            email = row['email']
+            if email in self._rows:
+                self._remove(email)
+            self._rows[email] = (time.monotonic() + self.ttl_seconds, dict(row))
+            if row.get('id') is not None:
+                self._emails[row['id']] = email
+            while len(self._rows) > self.max_entries:
+                self._remove(next(iter(self._rows)))
+
+    def invalidate(self, email=None, user_id=None):
+        """Drop a user's row after a write, by email and/or id"""
+        with self._lock:
+            if email is None and user_id is not None:
+                email = self._emails.get(user_id)
+            if email in self._rows:
+                self._remove(email)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._emails.clear()
+
+    def stats(self):
+        """Hit/miss metrics for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._rows),
+                'invalidations': self.invalidations
+            }
+
+
+# Shared by every SupabaseDatabase in the process
+user_cache = UserCache()
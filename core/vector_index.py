@@ -0,0 +1,159 @@
+"""
+In-Process Vector Index for EducApp
+Exact top-k search over a memory-mapped, optionally quantized embedding matrix
+Drop-in alternative to Chroma for the small knowledge_base/ corpus
+"""
+
+import os
+import json
+import numpy as np
+from langchain_core.documents import Document
+
+# Storage precisions: float32 (exact), float16 (half the size), int8 (a quarter, per-row scale)
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+VECTORS_FILENAME = "vectors.npy"
+SCALES_FILENAME = "scales.npy"
+METADATA_FILENAME = "index.json"
+
+
+def _normalize(matrix):
+    """L2-normalize rows so a dot product is cosine similarity"""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(vectors, dtype):
+    """
+    Convert normalized float32 vectors to the storage dtype
+    Returns (matrix, scales) - scales is only set for int8
+    """
+    if dtype == "float32":
+        return np.ascontiguousarray(vectors, dtype=np.float32), None
+    if dtype == "float16":
+        return np.ascontiguousarray(vectors, dtype=np.float16), None
+    if dtype == "int8":
+        # Symmetric per-row quantization: row = int8 values * scale
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        matrix = np.round(vectors / scales[:, None]).astype(np.int8)
+        return np.ascontiguousarray(matrix), scales.astype(np.float32)
+    raise ValueError(f"Unsupported dtype: {dtype} (expected one of {SUPPORTED_DTYPES})")
+
+
+def top_k(scores, k):
+    """Indices of the k highest scores, best first"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class NumpyVectorIndex:
+    """
+    One collection stored as a contiguous matrix on disk
+    Loaded with mmap so every Streamlit process shares the same page cache
+    """
+
+    def __init__(self, vectors, documents, ids, scales=None, embedding_function=None):
+        self.vectors = vectors
+        self.scales = scales
+        self.documents = documents
+        self.ids = ids
+        self.embedding_function = embedding_function
+
+    @property
+    def dtype(self):
+        return str(self.vectors.dtype)
+
+    @classmethod
+    def build(cls, documents, ids, embeddings, path, dtype="float32", embedding_model=None):
+        """Embed documents, write the index to path and return it memory-mapped"""
+        vectors = np.asarray(
+            embeddings.embed_documents([doc.page_content for doc in documents]),
+            dtype=np.float32
+        )
+        matrix, scales = quantize(_normalize(vectors), dtype)
+
+        os.makedirs(path, exist_ok=True)
+        _save_array(os.path.join(path, VECTORS_FILENAME), matrix)
+        if scales is not None:
+            _save_array(os.path.join(path, SCALES_FILENAME), scales)
+
+        # Metadata is written last - its id list is what marks the index as complete
+        metadata = {
+            "embedding_model": embedding_model,
+            "dtype": dtype,
+            "ids": list(ids),
+            "documents": [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in documents
+            ]
+        }
+        tmp_path = os.path.join(path, f"{METADATA_FILENAME}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(metadata, file)
+        os.replace(tmp_path, os.path.join(path, METADATA_FILENAME))
+
+        return cls.load(path, embedding_function=embeddings)
+
+    @classmethod
+    def load(cls, path, embedding_function=None):
+        """Open a saved index without copying the matrix into process memory"""
+        with open(os.path.join(path, METADATA_FILENAME), 'r', encoding='utf-8') as file:
+            metadata = json.load(file)
+
+        vectors = np.load(os.path.join(path, VECTORS_FILENAME), mmap_mode='r')
+        scales = None
+        if metadata["dtype"] == "int8":
+            scales = np.load(os.path.join(path, SCALES_FILENAME), mmap_mode='r')
+
+        documents = [Document(**doc) for doc in metadata["documents"]]
+        index = cls(vectors, documents, metadata["ids"], scales, embedding_function)
+        index.embedding_model = metadata.get("embedding_model")
+        return index
+
+    @staticmethod
+    def read_metadata(path):
+        """Return (embedding_model, dtype, ids) of a saved index, or None if absent"""
+        try:
+            with open(os.path.join(path, METADATA_FILENAME), 'r', encoding='utf-8') as file:
+                metadata = json.load(file)
+            return metadata.get("embedding_model"), metadata.get("dtype"), metadata.get("ids", [])
+        except (OSError, ValueError):
+            return None
+
+    def scores(self, embedding):
+        """Cosine similarity of the query against every row (one matmul)"""
+        query = _normalize(np.asarray(embedding, dtype=np.float32))
+
+        if self.scales is not None:
+            return (self.vectors @ query) * self.scales
+        if self.vectors.dtype == np.float16:
+            return (self.vectors @ query.astype(np.float16)).astype(np.float32)
+        return self.vectors @ query
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        """Exact top-k documents for a query vector"""
+        if len(self.documents) == 0:
+            return []
+        return [self.documents[i] for i in top_k(self.scores(embedding), k)]
+
+    def similarity_search(self, query, k=4):
+        """Exact top-k documents for a query string"""
+        if self.embedding_function is None:
+            raise ValueError("similarity_search needs an embedding_function; use similarity_search_by_vector")
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k)
+
+
+def _save_array(path, array):
+    """np.save through a temp file so readers with the old file mapped are unaffected"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        np.save(file, array)
+    os.replace(tmp_path, path)
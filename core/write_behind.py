@@ -0,0 +1,284 @@
+"""
+Write-Behind Buffer for EducApp
+Conversation saves and usage logs are queued in memory and
+written to the database in batches by a background thread, off the request path
+Batches that fail are spilled to a local JSONL file and can be replayed with:
+
+    python -m core.write_behind replay
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime
+
+FLUSH_INTERVAL_MS = int(os.getenv('EDUCAPP_WRITE_BEHIND_INTERVAL_MS', '500'))
+BATCH_SIZE = int(os.getenv('EDUCAPP_WRITE_BEHIND_BATCH_SIZE', '100'))
+SPILL_PATH = os.getenv('EDUCAPP_WRITE_BEHIND_SPILL', './write_behind_spill.jsonl')
+# How long shutdown waits for the last flush before spilling what is left
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+# Wakes the writer thread for shutdown
+_STOP = object()
+
+
+class WriteBehindBuffer:
+    """
+    Batches queued writes by kind and hands each batch to its handler
+    handlers maps a kind to a function taking a list of JSON-serializable payloads
+    """
+
+    def __init__(self, handlers, flush_interval_ms=FLUSH_INTERVAL_MS, batch_size=BATCH_SIZE,
+                 spill_path=SPILL_PATH):
+        self.handlers = handlers
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.spill_path = spill_path
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._stats = Counter()
+
+    def submit(self, kind, payload):
+        """Queue one write; returns immediately"""
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown write kind: {kind}")
+        with self._lock:
+            closed = self._closed
+            if not closed and self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+            self._stats['submitted'] += 1
+
+        if closed:
+            # Too late for the writer thread: keep it for replay
+            self._spill([(kind, payload)])
+            return
+        self._queue.put((kind, payload))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._write(batch)
+
+    def _collect(self):
+        """Wait for the first item, then gather more until the batch is full or the interval ends"""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Drain whatever was queued ahead of shutdown in this last batch
+                batch.extend(self._drain())
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _write(self, batch):
+        """Hand each kind's payloads to its handler; spill the ones that fail. Returns items written."""
+        by_kind = {}
+        for kind, payload in batch:
+            by_kind.setdefault(kind, []).append(payload)
+
+        written = 0
+        for kind, payloads in by_kind.items():
+            try:
+                self.handlers[kind](payloads)
+            except Exception as e:
+                print(f"⚠️ Write-behind: {len(payloads)} {kind} write(s) failed, spilling to disk: {e}")
+                self._spill([(kind, payload) for payload in payloads])
+                with self._lock:
+                    self._stats['failed_batches'] += 1
+                continue
+            written += len(payloads)
+            with self._lock:
+                self._stats['written'] += len(payloads)
+                self._stats['batches'] += 1
+        return written
+
+    def _spill(self, items):
+        """Append items to the spill file and fsync, so they survive a crash"""
+        with self._spill_lock:
+            with open(self.spill_path, 'a', encoding='utf-8') as file:
+                for kind, payload in items:
+                    file.write(json.dumps({'kind': kind, 'payload': payload}) + '\n')
+                file.flush()
+                os.fsync(file.fileno())
+        with self._lock:
+            self._stats['spilled'] += len(items)
+
+    def close(self, timeout=SHUTDOWN_TIMEOUT_SECONDS):
+        """Flush everything queued and stop the writer thread (registered with atexit)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+            if thread.is_alive():
+                print("⚠️ Write-behind: shutdown flush timed out, spilling the rest to disk")
+
+        leftover = self._drain()
+        if leftover:
+            self._spill(leftover)
+
+    def replay(self):
+        """Write spilled items through the handlers; items that fail again are re-spilled"""
+        replay_path = f"{self.spill_path}.replaying"
+        replayed = 0
+
+        # A leftover file from an interrupted replay goes first
+        if os.path.exists(replay_path):
+            replayed += self._replay_file(replay_path)
+
+        # New spills keep going to a fresh file while this one is replayed
+        try:
+            os.replace(self.spill_path, replay_path)
+        except FileNotFoundError:
+            return replayed
+        return replayed + self._replay_file(replay_path)
+
+    def _replay_file(self, path):
+        items = []
+        with open(path, 'r', encoding='utf-8') as file:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    items.append((record['kind'], record['payload']))
+                except (ValueError, KeyError):
+                    # A torn last line from a crash mid-write
+                    print(f"⚠️ Write-behind: skipping unreadable line {line_number} in {path}")
+
+        written = 0
+        for start in range(0, len(items), self.batch_size):
+            written += self._write(items[start:start + self.batch_size])
+        os.remove(path)
+        return written
+
+    def stats(self):
+        """Queue metrics, for monitoring"""
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'submitted': self._stats['submitted'],
+                'written': self._stats['written'],
+                'batches': self._stats['batches'],
+                'failed_batches': self._stats['failed_batches'],
+                'spilled': self._stats['spilled']
+            }
+
+
+# Database handlers
+
+def _database():
+    from core.supabase_client import get_database
+    return get_database()
+
+
+def _write_conversations(payloads):
+    _database().save_conversations(payloads)
+
+
+def _write_api_calls(payloads):
+    _database().log_api_calls(payloads)
+
+
+def _write_question_counts(payloads):
+    # Questions are counted by reserve_question now; this only replays older spill files.
+    # One increment per user, however many questions they asked in this batch
+    counts = Counter(payload['user_id'] for payload in payloads)
+    _database().increment_questions_asked_batch(
+        [{'user_id': user_id, 'amount': amount} for user_id, amount in counts.items()]
+    )
+
+
+HANDLERS = {
+    'conversation': _write_conversations,
+    'api_call': _write_api_calls,
+    'question': _write_question_counts
+}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Process-wide buffer shared by every session"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = WriteBehindBuffer(HANDLERS)
+        return _writer
+
+
+def queue_conversation(user_id, question, answer, subject=None):
+    """Save a conversation in the background"""
+    get_writer().submit('conversation', {
+        'user_id': user_id,
+        'question': question,
+        'answer': answer,
+        'subject': subject,
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+def queue_api_call(user_email, input_tokens, output_tokens, estimated_cost, model='claude-3-opus',
+                   cache_read_tokens=0, cache_write_tokens=0):
+    """Log an API call (and its usage_rollup update) in the background"""
+    get_writer().submit('api_call', {
+        'user_email': user_email,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'estimated_cost': estimated_cost,
+        'model': model,
+        'cache_read_tokens': cache_read_tokens,
+        'cache_write_tokens': cache_write_tokens,
+        'timestamp': datetime.now().astimezone().isoformat()
+    })
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ['replay']:
+        writer = WriteBehindBuffer(HANDLERS)
+        replayed = writer.replay()
+        print(f"✅ Replayed {replayed} write(s) from {writer.spill_path}")
+        if writer.stats()['spilled']:
+            print(f"⚠️ {writer.stats()['spilled']} write(s) failed again and were re-spilled")
+    else:
+        print("Usage: python -m core.write_behind replay")
@@ -0,0 +1,119 @@
+-- Per-user monthly usage rollup for EducApp
+-- Run in the Supabase Dashboard SQL editor
+--
+-- log_api_call() inserts the raw api_usage row and adds it to usage_rollup in
+-- one transaction, so quota checks and cost views read a single row per
+-- (month, user, model) instead of aggregating api_usage.
+-- Months are UTC, formatted 'YYYY-MM'.
+
+CREATE TABLE IF NOT EXISTS api_usage (
+    id BIGSERIAL PRIMARY KEY,
+    user_email TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_read_tokens INTEGER NOT NULL DEFAULT 0,
+    cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+    estimated_cost NUMERIC(12, 6) NOT NULL DEFAULT 0,
+    model TEXT NOT NULL DEFAULT 'claude-3-opus',
+    timestamp TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_api_usage_user_timestamp ON api_usage (user_email, timestamp);
+CREATE INDEX IF NOT EXISTS idx_api_usage_timestamp ON api_usage (timestamp);
+
+CREATE TABLE IF NOT EXISTS usage_rollup (
+    month TEXT NOT NULL,
+    user_email TEXT NOT NULL,
+    model TEXT NOT NULL,
+    questions BIGINT NOT NULL DEFAULT 0,
+    input_tokens BIGINT NOT NULL DEFAULT 0,
+    output_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_read_tokens BIGINT NOT NULL DEFAULT 0,
+    cache_write_tokens BIGINT NOT NULL DEFAULT 0,
+    estimated_cost NUMERIC(14, 6) NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, user_email, model)
+);
+
+
+CREATE OR REPLACE FUNCTION log_api_call(
+    p_user_email TEXT,
+    p_input_tokens INTEGER,
+    p_output_tokens INTEGER,
+    p_estimated_cost NUMERIC,
+    p_model TEXT DEFAULT 'claude-3-opus',
+    p_cache_read_tokens INTEGER DEFAULT 0,
+    p_cache_write_tokens INTEGER DEFAULT 0
+) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api_usage (user_email, input_tokens, output_tokens, cache_read_tokens,
+                           cache_write_tokens, estimated_cost, model)
+    VALUES (p_user_email, p_input_tokens, p_output_tokens, p_cache_read_tokens,
+            p_cache_write_tokens, p_estimated_cost, p_model);
+
+    INSERT INTO usage_rollup AS r (month, user_email, model, questions, input_tokens, output_tokens,
+                                   cache_read_tokens, cache_write_tokens, estimated_cost)
+    VALUES (to_char(now() AT TIME ZONE 'utc', 'YYYY-MM'), p_user_email, p_model, 1,
+            p_input_tokens, p_output_tokens, p_cache_read_tokens, p_cache_write_tokens, p_estimated_cost)
+    ON CONFLICT (month, user_email, model) DO UPDATE SET
+        questions = r.questions + 1,
+        input_tokens = r.input_tokens + EXCLUDED.input_tokens,
+        output_tokens = r.output_tokens + EXCLUDED.output_tokens,
+        cache_read_tokens = r.cache_read_tokens + EXCLUDED.cache_read_tokens,
+        cache_write_tokens = r.cache_write_tokens + EXCLUDED.cache_write_tokens,
+        estimated_cost = r.estimated_cost + EXCLUDED.estimated_cost;
+END;
+$$;
+
+
+-- Totals across all users for one month (admin dashboard)
+CREATE OR REPLACE FUNCTION monthly_usage_totals(p_month TEXT DEFAULT NULL)
+RETURNS TABLE (
+    questions BIGINT,
+    input_tokens BIGINT,
+    output_tokens BIGINT,
+    cache_read_tokens BIGINT,
+    cache_write_tokens BIGINT,
+    estimated_cost NUMERIC
+)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        COALESCE(SUM(questions), 0)::BIGINT,
+        COALESCE(SUM(input_tokens), 0)::BIGINT,
+        COALESCE(SUM(output_tokens), 0)::BIGINT,
+        COALESCE(SUM(cache_read_tokens), 0)::BIGINT,
+        COALESCE(SUM(cache_write_tokens), 0)::BIGINT,
+        COALESCE(SUM(estimated_cost), 0)
+    FROM usage_rollup
+    WHERE month = COALESCE(p_month, to_char(now() AT TIME ZONE 'utc', 'YYYY-MM'));
+$$;
+
+
+-- Recompute usage_rollup from api_usage (backfills): SELECT rebuild_usage_rollup();
+CREATE OR REPLACE FUNCTION rebuild_usage_rollup() RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    row_count INTEGER;
+BEGIN
+    LOCK TABLE usage_rollup IN EXCLUSIVE MODE;
+    DELETE FROM usage_rollup;
+
+    INSERT INTO usage_rollup (month, user_email, model, questions, input_tokens, output_tokens,
+                              cache_read_tokens, cache_write_tokens, estimated_cost)
+    SELECT
+        to_char(timestamp AT TIME ZONE 'utc', 'YYYY-MM'),
+        user_email,
+        model,
+        COUNT(*),
+        SUM(input_tokens),
+        SUM(output_tokens),
+        SUM(cache_read_tokens),
+        SUM(cache_write_tokens),
+        SUM(estimated_cost)
+    FROM api_usage
+    GROUP BY 1, 2, 3;
+
+    GET DIAGNOSTICS row_count = ROW_COUNT;
+    RETURN row_count;
+END;
+$$;
@@ -0,0 +1,66 @@
+-- Batch endpoints for the write-behind buffer (core/write_behind.py)
+-- Run in the Supabase Dashboard SQL editor after 001_usage_rollup.sql
+
+
+-- Log many API calls in one transaction; each call is rolled up into the month of its own timestamp
+-- p_calls: [{user_email, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens,
+--            estimated_cost, model, timestamp}, ...]
+CREATE OR REPLACE FUNCTION log_api_calls(p_calls JSONB) RETURNS VOID
+LANGUAGE sql AS $$
+    WITH inserted AS (
+        INSERT INTO api_usage (user_email, input_tokens, output_tokens, cache_read_tokens,
+                               cache_write_tokens, estimated_cost, model, "timestamp")
+        SELECT
+            c.user_email,
+            c.input_tokens,
+            c.output_tokens,
+            COALESCE(c.cache_read_tokens, 0),
+            COALESCE(c.cache_write_tokens, 0),
+            c.estimated_cost,
+            COALESCE(c.model, 'claude-3-opus'),
+            COALESCE(c."timestamp", now())
+        FROM jsonb_to_recordset(p_calls) AS c(
+            user_email TEXT,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            cache_read_tokens INTEGER,
+            cache_write_tokens INTEGER,
+            estimated_cost NUMERIC,
+            model TEXT,
+            "timestamp" TIMESTAMPTZ
+        )
+        RETURNING *
+    )
+    INSERT INTO usage_rollup AS r (month, user_email, model, questions, input_tokens, output_tokens,
+                                   cache_read_tokens, cache_write_tokens, estimated_cost)
+    SELECT
+        to_char("timestamp" AT TIME ZONE 'utc', 'YYYY-MM'),
+        user_email,
+        model,
+        COUNT(*),
+        SUM(input_tokens),
+        SUM(output_tokens),
+        SUM(cache_read_tokens),
+        SUM(cache_write_tokens),
+        SUM(estimated_cost)
+    FROM inserted
+    GROUP BY 1, 2, 3
+    ON CONFLICT (month, user_email, model) DO UPDATE SET
+        questions = r.questions + EXCLUDED.questions,
+        input_tokens = r.input_tokens + EXCLUDED.input_tokens,
+        output_tokens = r.output_tokens + EXCLUDED.output_tokens,
+        cache_read_tokens = r.cache_read_tokens + EXCLUDED.cache_read_tokens,
+        cache_write_tokens = r.cache_write_tokens + EXCLUDED.cache_write_tokens,
+        estimated_cost = r.estimated_cost + EXCLUDED.estimated_cost;
+$$;
+
+
+-- Add to several users' question counts in one statement
+-- p_increments: [{user_id, amount}, ...]
+CREATE OR REPLACE FUNCTION increment_questions_asked_batch(p_increments JSONB) RETURNS VOID
+LANGUAGE sql AS $$
+    UPDATE users u
+    SET questions_asked = COALESCE(u.questions_asked, 0) + i.amount
+    FROM jsonb_to_recordset(p_increments) AS i(user_id BIGINT, amount INTEGER)
+    WHERE u.id = i.user_id;
+$$;
@@ -0,0 +1,53 @@
+-- Atomic question counters for the freemium gate (core/freemium.py)
+-- Run in the Supabase Dashboard SQL editor after 002_write_behind_batches.sql
+
+
+-- Add to one user's question count in a single statement; returns the new count
+CREATE OR REPLACE FUNCTION increment_questions_asked(p_user_id BIGINT, p_amount INTEGER DEFAULT 1)
+RETURNS INTEGER
+LANGUAGE sql AS $$
+    UPDATE users
+    SET questions_asked = COALESCE(questions_asked, 0) + p_amount
+    WHERE id = p_user_id
+    RETURNING questions_asked;
+$$;
+
+
+-- Check the quota and count one question against it, under a row lock so two tabs
+-- cannot both take the last free question. Starts a new month's count first if needed.
+-- Returns no row for unknown emails.
+CREATE OR REPLACE FUNCTION reserve_question(p_email TEXT, p_free_limit INTEGER)
+RETURNS TABLE (user_id BIGINT, questions_used INTEGER, over_limit BOOLEAN, is_paid BOOLEAN)
+LANGUAGE plpgsql AS $$
+DECLARE
+    u users%ROWTYPE;
+    used INTEGER;
+    paid BOOLEAN;
+    over BOOLEAN;
+BEGIN
+    SELECT * INTO u FROM users WHERE email = p_email FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    used := COALESCE(u.questions_asked, 0);
+    IF u.last_reset_date IS NOT NULL
+       AND date_trunc('month', u.last_reset_date::date) < date_trunc('month', current_date) THEN
+        used := 0;
+        u.last_reset_date := current_date;
+    END IF;
+
+    paid := u.subscription_status = 'active';
+    over := NOT paid AND used >= p_free_limit;
+    IF NOT over THEN
+        used := used + 1;
+    END IF;
+
+    UPDATE users
+    SET questions_asked = used,
+        last_reset_date = u.last_reset_date
+    WHERE id = u.id;
+
+    RETURN QUERY SELECT u.id::BIGINT, used, over, paid;
+END;
+$$;
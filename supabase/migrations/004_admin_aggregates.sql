@@ -0,0 +1,50 @@
+-- Admin statistics computed in the database (core/database_supabase.py)
+-- Run in the Supabase Dashboard SQL editor after 003_question_counters.sql
+
+
+-- Status counts and the users keyset (newest first) used by get_users_page
+CREATE INDEX IF NOT EXISTS idx_users_subscription_status ON users (subscription_status);
+CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users (created_at DESC, id DESC);
+
+
+-- One row of headline numbers for a month ('YYYY-MM', UTC; default current):
+-- user counts by status, questions from usage_rollup and signups in the month
+CREATE OR REPLACE FUNCTION user_stats(p_month TEXT DEFAULT NULL)
+RETURNS TABLE (total_users BIGINT, paid_users BIGINT, free_users BIGINT,
+               total_questions BIGINT, new_users BIGINT)
+LANGUAGE sql STABLE AS $$
+    WITH bounds AS (
+        SELECT key,
+               (key || '-01')::TIMESTAMP AT TIME ZONE 'UTC' AS month_start
+        FROM (SELECT COALESCE(p_month, to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM')) AS key) k
+    )
+    SELECT
+        (SELECT COUNT(*) FROM users),
+        (SELECT COUNT(*) FROM users WHERE subscription_status = 'active'),
+        (SELECT COUNT(*) FROM users WHERE subscription_status = 'free'),
+        (SELECT COALESCE(SUM(r.questions), 0)::BIGINT FROM usage_rollup r WHERE r.month = b.key),
+        (SELECT COUNT(*) FROM users u
+         WHERE u.created_at >= b.month_start
+           AND u.created_at < b.month_start + INTERVAL '1 month')
+    FROM bounds b;
+$$;
+
+
+-- Signups grouped by 'day', 'week' or 'month' (UTC) since a point in time
+CREATE OR REPLACE FUNCTION signups_per_period(p_period TEXT DEFAULT 'day',
+                                              p_since TIMESTAMPTZ DEFAULT now() - INTERVAL '30 days')
+RETURNS TABLE (period_start TIMESTAMPTZ, signups BIGINT)
+LANGUAGE plpgsql STABLE AS $$
+BEGIN
+    IF p_period NOT IN ('day', 'week', 'month') THEN
+        RAISE EXCEPTION 'period must be day, week or month, got %', p_period;
+    END IF;
+
+    RETURN QUERY
+    SELECT date_trunc(p_period, u.created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC', COUNT(*)
+    FROM users u
+    WHERE u.created_at >= p_since
+    GROUP BY 1
+    ORDER BY 1;
+END;
+$$;
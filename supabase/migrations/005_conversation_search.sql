@@ -0,0 +1,62 @@
+-- Full-text search over conversation history (core/conversation_manager.py)
+-- Run in the Supabase Dashboard SQL editor after 004_admin_aggregates.sql
+--
+-- search_vector is a stored generated column, so Postgres keeps it (and the GIN
+-- index) current on every insert, update and delete; no triggers or rebuilds.
+-- Questions weigh more than answers in the ranking.
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS subject TEXT;
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(question, '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(answer, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_conversations_search ON conversations USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_conversations_user_timestamp ON conversations (user_id, timestamp DESC);
+
+
+-- One page of a student's matching conversations, best match first.
+-- Highlights mark matches with ** (Markdown bold) and are built only for the
+-- returned page; total is the number of matches across all pages.
+CREATE OR REPLACE FUNCTION search_conversations(p_user_id BIGINT, p_query TEXT,
+                                                p_subject TEXT DEFAULT NULL,
+                                                p_limit INTEGER DEFAULT 20,
+                                                p_offset INTEGER DEFAULT 0)
+RETURNS TABLE (id BIGINT, question TEXT, answer TEXT, subject TEXT, "timestamp" TEXT, rank REAL,
+               question_highlight TEXT, answer_highlight TEXT, total BIGINT)
+LANGUAGE sql STABLE AS $$
+    WITH matches AS (
+        SELECT c.id, c.question, c.answer, c.subject, c.timestamp::TEXT AS ts,
+               ts_rank_cd(c.search_vector, q.query) AS rank,
+               q.query,
+               COUNT(*) OVER () AS total
+        FROM conversations c,
+             websearch_to_tsquery('english', p_query) AS q(query)
+        WHERE c.user_id = p_user_id
+          AND c.search_vector @@ q.query
+          AND (p_subject IS NULL OR c.subject = p_subject)
+        ORDER BY rank DESC, c.timestamp DESC, c.id DESC
+        LIMIT p_limit OFFSET p_offset
+    )
+    SELECT m.id::BIGINT, m.question, m.answer, m.subject, m.ts, m.rank,
+           ts_headline('english', m.question, m.query,
+                       'StartSel=**, StopSel=**, HighlightAll=true'),
+           ts_headline('english', m.answer, m.query,
+                       'StartSel=**, StopSel=**, MaxFragments=2, MaxWords=30, MinWords=10, FragmentDelimiter=" … "'),
+           m.total
+    FROM matches m
+    ORDER BY m.rank DESC, m.ts DESC, m.id DESC;
+$$;
+
+
+-- Subjects a student has conversations in, for the history filter
+CREATE OR REPLACE FUNCTION conversation_subjects(p_user_id BIGINT)
+RETURNS TABLE (subject TEXT)
+LANGUAGE sql STABLE AS $$
+    SELECT DISTINCT c.subject
+    FROM conversations c
+    WHERE c.user_id = p_user_id AND c.subject IS NOT NULL
+    ORDER BY 1;
+$$;
@@ -0,0 +1,10 @@
+-- Keyset pages of conversation history (core/conversation_manager.py)
+-- Run in the Supabase Dashboard SQL editor after 005_conversation_search.sql
+--
+-- Pages are ordered by (timestamp, id) newest first and continue after the last
+-- row shown, so each page is one index range scan however deep the history goes.
+
+CREATE INDEX IF NOT EXISTS idx_conversations_user_timestamp_id
+    ON conversations (user_id, timestamp DESC, id DESC);
+
+DROP INDEX IF EXISTS idx_conversations_user_timestamp;
@@ -0,0 +1,17 @@
+-- Give back a reserved question when the answer could not be generated
+-- Run in the Supabase Dashboard SQL editor after 006_conversation_pages.sql
+--
+-- reserve_question() (003) counts the question up front; the app calls this when
+-- the LLM call fails. The count is only lowered while the month the question was
+-- reserved in ('YYYY-MM') is still the current one, and never below zero.
+-- Returns the new count, or no row if nothing was released.
+
+CREATE OR REPLACE FUNCTION release_question(p_user_id BIGINT, p_month TEXT)
+RETURNS INTEGER
+LANGUAGE sql AS $$
+    UPDATE users
+    SET questions_asked = GREATEST(COALESCE(questions_asked, 0) - 1, 0)
+    WHERE id = p_user_id
+      AND p_month = to_char(current_date, 'YYYY-MM')
+    RETURNING questions_asked;
+$$;
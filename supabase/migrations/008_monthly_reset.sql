@@ -0,0 +1,39 @@
+-- Batch monthly reset of question counters (python -m core.monthly_reset)
+-- Run in the Supabase Dashboard SQL editor after 007_question_release.sql
+--
+-- questions_asked counts questions in the month of last_reset_date; readers
+-- treat an older month as 0 and reserve_question() (003) rolls a user over on
+-- their next question. This job does the rollover ahead of time, a bounded
+-- batch per call, so the 1st of the month does not start with a write burst
+-- from the chat UI. Re-running it changes nothing: rows already in the month
+-- no longer match, and rows locked by a concurrent reservation are skipped
+-- and picked up by the next batch (or rolled over by the reservation itself).
+
+CREATE INDEX IF NOT EXISTS idx_users_last_reset_date ON users (last_reset_date);
+
+
+-- Reset up to p_batch_size users whose counters belong to a month before
+-- p_month_start; returns how many were reset (0 when the month is done)
+CREATE OR REPLACE FUNCTION reset_monthly_questions_batch(p_month_start DATE, p_batch_size INTEGER DEFAULT 500)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    reset_count INTEGER;
+BEGIN
+    WITH stale AS (
+        SELECT id FROM users
+        WHERE last_reset_date::DATE < p_month_start
+        ORDER BY id
+        LIMIT p_batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE users u
+    SET questions_asked = 0,
+        last_reset_date = p_month_start
+    FROM stale
+    WHERE u.id = stale.id;
+
+    GET DIAGNOSTICS reset_count = ROW_COUNT;
+    RETURN reset_count;
+END;
+$$;
@@ -0,0 +1,170 @@
+-- usage_rollup counts API calls, not questions
+-- Run in the Supabase Dashboard SQL editor after 008_monthly_reset.sql
+--
+-- usage_rollup.questions was bumped once per logged API call, so a question
+-- that took several calls counted several times and a cached answer counted
+-- none. The column is renamed api_calls, and user_stats() reports questions
+-- as the conversations saved in the month. Months stay UTC, 'YYYY-MM'.
+
+ALTER TABLE usage_rollup RENAME COLUMN questions TO api_calls;
+
+-- Monthly conversation counts for the admin dashboard
+CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations (timestamp);
+
+
+CREATE OR REPLACE FUNCTION log_api_call(
+    p_user_email TEXT,
+    p_input_tokens INTEGER,
+    p_output_tokens INTEGER,
+    p_estimated_cost NUMERIC,
+    p_model TEXT DEFAULT 'claude-3-opus',
+    p_cache_read_tokens INTEGER DEFAULT 0,
+    p_cache_write_tokens INTEGER DEFAULT 0
+) RETURNS VOID
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO api_usage (user_email, input_tokens, output_tokens, cache_read_tokens,
+                           cache_write_tokens, estimated_cost, model)
+    VALUES (p_user_email, p_input_tokens, p_output_tokens, p_cache_read_tokens,
+            p_cache_write_tokens, p_estimated_cost, p_model);
+
+    INSERT INTO usage_rollup AS r (month, user_email, model, api_calls, input_tokens, output_tokens,
+                                   cache_read_tokens, cache_write_tokens, estimated_cost)
+    VALUES (to_char(now() AT TIME ZONE 'utc', 'YYYY-MM'), p_user_email, p_model, 1,
+            p_input_tokens, p_output_tokens, p_cache_read_tokens, p_cache_write_tokens, p_estimated_cost)
+    ON CONFLICT (month, user_email, model) DO UPDATE SET
+        api_calls = r.api_calls + 1,
+        input_tokens = r.input_tokens + EXCLUDED.input_tokens,
+        output_tokens = r.output_tokens + EXCLUDED.output_tokens,
+        cache_read_tokens = r.cache_read_tokens + EXCLUDED.cache_read_tokens,
+        cache_write_tokens = r.cache_write_tokens + EXCLUDED.cache_write_tokens,
+        estimated_cost = r.estimated_cost + EXCLUDED.estimated_cost;
+END;
+$$;
+
+
+CREATE OR REPLACE FUNCTION log_api_calls(p_calls JSONB) RETURNS VOID
+LANGUAGE sql AS $$
+    WITH inserted AS (
+        INSERT INTO api_usage (user_email, input_tokens, output_tokens, cache_read_tokens,
+                               cache_write_tokens, estimated_cost, model, "timestamp")
+        SELECT
+            c.user_email,
+            c.input_tokens,
+            c.output_tokens,
+            COALESCE(c.cache_read_tokens, 0),
+            COALESCE(c.cache_write_tokens, 0),
+            c.estimated_cost,
+            COALESCE(c.model, 'claude-3-opus'),
+            COALESCE(c."timestamp", now())
+        FROM jsonb_to_recordset(p_calls) AS c(
+            user_email TEXT,
+            input_tokens INTEGER,
+            output_tokens INTEGER,
+            cache_read_tokens INTEGER,
+            cache_write_tokens INTEGER,
+            estimated_cost NUMERIC,
+            model TEXT,
+            "timestamp" TIMESTAMPTZ
+        )
+        RETURNING *
+    )
+    INSERT INTO usage_rollup AS r (month, user_email, model, api_calls, input_tokens, output_tokens,
+                                   cache_read_tokens, cache_write_tokens, estimated_cost)
+    SELECT
+        to_char("timestamp" AT TIME ZONE 'utc', 'YYYY-MM'),
+        user_email,
+        model,
+        COUNT(*),
+        SUM(input_tokens),
+        SUM(output_tokens),
+        SUM(cache_read_tokens),
+        SUM(cache_write_tokens),
+        SUM(estimated_cost)
+    FROM inserted
+    GROUP BY 1, 2, 3
+    ON CONFLICT (month, user_email, model) DO UPDATE SET
+        api_calls = r.api_calls + EXCLUDED.api_calls,
+        input_tokens = r.input_tokens + EXCLUDED.input_tokens,
+        output_tokens = r.output_tokens + EXCLUDED.output_tokens,
+        cache_read_tokens = r.cache_read_tokens + EXCLUDED.cache_read_tokens,
+        cache_write_tokens = r.cache_write_tokens + EXCLUDED.cache_write_tokens,
+        estimated_cost = r.estimated_cost + EXCLUDED.estimated_cost;
+$$;
+
+
+-- The result column changes name, so the function is replaced, not redefined
+DROP FUNCTION IF EXISTS monthly_usage_totals(TEXT);
+CREATE FUNCTION monthly_usage_totals(p_month TEXT DEFAULT NULL)
+RETURNS TABLE (
+    api_calls BIGINT,
+    input_tokens BIGINT,
+    output_tokens BIGINT,
+    cache_read_tokens BIGINT,
+    cache_write_tokens BIGINT,
+    estimated_cost NUMERIC
+)
+LANGUAGE sql STABLE AS $$
+    SELECT
+        COALESCE(SUM(api_calls), 0)::BIGINT,
+        COALESCE(SUM(input_tokens), 0)::BIGINT,
+        COALESCE(SUM(output_tokens), 0)::BIGINT,
+        COALESCE(SUM(cache_read_tokens), 0)::BIGINT,
+        COALESCE(SUM(cache_write_tokens), 0)::BIGINT,
+        COALESCE(SUM(estimated_cost), 0)
+    FROM usage_rollup
+    WHERE month = COALESCE(p_month, to_char(now() AT TIME ZONE 'utc', 'YYYY-MM'));
+$$;
+
+
+CREATE OR REPLACE FUNCTION rebuild_usage_rollup() RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    row_count INTEGER;
+BEGIN
+    LOCK TABLE usage_rollup IN EXCLUSIVE MODE;
+    DELETE FROM usage_rollup;
+
+    INSERT INTO usage_rollup (month, user_email, model, api_calls, input_tokens, output_tokens,
+                              cache_read_tokens, cache_write_tokens, estimated_cost)
+    SELECT
+        to_char(timestamp AT TIME ZONE 'utc', 'YYYY-MM'),
+        user_email,
+        model,
+        COUNT(*),
+        SUM(input_tokens),
+        SUM(output_tokens),
+        SUM(cache_read_tokens),
+        SUM(cache_write_tokens),
+        SUM(estimated_cost)
+    FROM api_usage
+    GROUP BY 1, 2, 3;
+
+    GET DIAGNOSTICS row_count = ROW_COUNT;
+    RETURN row_count;
+END;
+$$;
+
+
+-- total_questions: conversations saved in the month (one per answered question)
+CREATE OR REPLACE FUNCTION user_stats(p_month TEXT DEFAULT NULL)
+RETURNS TABLE (total_users BIGINT, paid_users BIGINT, free_users BIGINT,
+               total_questions BIGINT, new_users BIGINT)
+LANGUAGE sql STABLE AS $$
+    WITH bounds AS (
+        SELECT key,
+               (key || '-01')::TIMESTAMP AT TIME ZONE 'UTC' AS month_start
+        FROM (SELECT COALESCE(p_month, to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM')) AS key) k
+    )
+    SELECT
+        (SELECT COUNT(*) FROM users),
+        (SELECT COUNT(*) FROM users WHERE subscription_status = 'active'),
+        (SELECT COUNT(*) FROM users WHERE subscription_status = 'free'),
+        (SELECT COUNT(*) FROM conversations c
+         WHERE c.timestamp >= b.month_start
+           AND c.timestamp < b.month_start + INTERVAL '1 month'),
+        (SELECT COUNT(*) FROM users u
+         WHERE u.created_at >= b.month_start
+           AND u.created_at < b.month_start + INTERVAL '1 month')
+    FROM bounds b;
+$$;
@@ -0,0 +1,172 @@
+# Test the LLM concurrency limiter and the async tutor entry point (no network)
+
+import time
+import asyncio
+import threading
+from core.concurrency import ConcurrencyLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+print("Testing the limit from threads...")
+limiter = ConcurrencyLimiter(limit=3)
+peak = 0
+in_flight = 0
+counter_lock = threading.Lock()
+
+
+def call():
+    global peak, in_flight
+    with limiter.slot():
+        with counter_lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with counter_lock:
+            in_flight -= 1
+
+
+threads = [threading.Thread(target=call) for _ in range(12)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+stats = limiter.stats()
+assert peak == 3, peak
+assert stats['completed'] == 12 and stats['in_flight'] == 0 and stats['queue_depth'] == 0
+print(f"✅ 12 calls, at most {peak} at once, peak queue depth {stats['peak_queue_depth']}")
+
+print("\nTesting the limit from an event loop...")
+limiter = ConcurrencyLimiter(limit=2)
+order = []
+
+
+async def acall(i):
+    async with limiter.aslot():
+        order.append(i)
+        await asyncio.sleep(0.01)
+
+
+async def run_calls():
+    await asyncio.gather(*(acall(i) for i in range(8)))
+
+asyncio.run(run_calls())
+assert order == list(range(8)), order
+assert limiter.stats()['in_flight'] == 0
+print("✅ 8 coroutines served in arrival order")
+
+print("\nTesting threads and coroutines sharing one limit...")
+limiter = ConcurrencyLimiter(limit=1)
+blocker_started = threading.Event()
+
+
+def blocker():
+    with limiter.slot():
+        blocker_started.set()
+        time.sleep(0.05)
+
+thread = threading.Thread(target=blocker)
+thread.start()
+blocker_started.wait()
+started = time.perf_counter()
+asyncio.run(acall(0))
+waited = time.perf_counter() - started
+thread.join()
+assert waited >= 0.03, waited
+print(f"✅ Coroutine waited {waited * 1000:.0f} ms for the thread's slot")
+
+print("\nTesting a cancelled waiter gives its place up...")
+limiter = ConcurrencyLimiter(limit=1)
+
+
+async def cancel_while_waiting():
+    async with limiter.aslot():
+        waiter = asyncio.create_task(acall(1))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+
+asyncio.run(cancel_while_waiting())
+stats = limiter.stats()
+assert stats['in_flight'] == 0 and stats['queue_depth'] == 0, stats
+print("✅ No slot leaked")
+
+print("\nTesting the token bucket...")
+clock = FakeClock()
+bucket = TokenBucket(capacity=2, refill_per_second=1, clock=clock)
+assert bucket.try_take() and bucket.try_take() and not bucket.try_take()
+clock.now += 1
+assert bucket.try_take() and not bucket.try_take()
+bucket.give_back()
+assert bucket.try_take()
+print("✅ Capacity, refill and give_back")
+
+
+print("\nTesting EducAppTutor.aget_response with stub components...")
+from core.chatbot import EducAppTutor
+from core.guardrails import BiblicalGuardrails
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+        self.response_metadata = {'usage': {'input_tokens': 10, 'output_tokens': 5}}
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = []
+
+    async def ainvoke(self, messages):
+        self.calls.append(messages)
+        await asyncio.sleep(0.01)
+        return FakeMessage(f"Answer {len(self.calls)}")
+
+
+class FakeRAG:
+    def try_embed_query(self, query):
+        return None
+
+    def retrieve_context(self, query, subject="general", query_vector=None, embed=True):
+        return {"worldview": [], "curriculum": [], "scripture": [], "timings": {}}
+
+
+class FakeCache:
+    def lookup(self, *args):
+        return None
+
+    def store(self, *args):
+        pass
+
+
+tutor = object.__new__(EducAppTutor)
+tutor.llm = FakeLLM()
+tutor.rag_engine = FakeRAG()
+tutor.guardrails = BiblicalGuardrails()
+tutor.response_cache = FakeCache()
+
+history = [
+    {"role": "user", "content": "What is a fraction?"},
+    {"role": "assistant", "content": "A part of a whole."},
+]
+
+
+async def ask_many():
+    return await asyncio.gather(
+        tutor.aget_response("Can you give an example?", "math", "5", history=history),
+        *(tutor.aget_response(f"Question {i}", "math", "5") for i in range(4))
+    )
+
+answers = asyncio.run(ask_many())
+assert all(answer.startswith("Answer") for answer in answers), answers
+follow_ups = [messages for messages in tutor.llm.calls if len(messages) > 2]
+assert len(follow_ups) == 1 and len(tutor.llm.calls) == 5
+assert [type(m).__name__ for m in follow_ups[0]] == ['SystemMessage', 'HumanMessage', 'AIMessage', 'HumanMessage']
+assert follow_ups[0][-1].content == "Student question: Can you give an example?"
+print(f"✅ {len(answers)} concurrent answers; history sent only with the follow-up")
@@ -0,0 +1,82 @@
+# Test the freemium gate's reserve/commit/release against the local database (no network)
+
+import os
+
+os.environ['EDUCAPP_DB_BACKEND'] = 'local'
+os.environ['EDUCAPP_LOCAL_DB_PATH'] = ':memory:'
+
+from core import freemium
+from core.supabase_client import get_database
+
+db = get_database()
+limit = freemium.FREE_QUESTIONS_PER_MONTH
+
+
+def questions_asked(email):
+    return db.get_user_by_email(email)['questions_asked']
+
+
+print("Testing the free limit...")
+db.create_user('free@example.com', name='Free')
+for asked in range(1, limit + 1):
+    reservation = freemium.reserve_question('free@example.com')
+    assert reservation['allowed'] and reservation['questions_used'] == asked, reservation
+    freemium.commit_question(reservation)
+refused = freemium.reserve_question('free@example.com')
+assert not refused['allowed'] and refused['questions_used'] == limit, refused
+assert questions_asked('free@example.com') == limit
+assert freemium.reserve_question('nobody@example.com') is None
+print(f"✅ {limit} questions allowed, the next refused without being counted")
+
+print("\nTesting release gives a question back...")
+db.create_user('release@example.com', name='Release')
+reservation = freemium.reserve_question('release@example.com')
+assert questions_asked('release@example.com') == 1
+freemium.release_question(reservation)
+assert questions_asked('release@example.com') == 0
+freemium.release_question(reservation)
+assert questions_asked('release@example.com') == 0
+print("✅ Released once, never below zero")
+
+print("\nTesting a reservation from last month is not released...")
+reservation = freemium.reserve_question('release@example.com')
+reservation['month'] = '2000-01'
+freemium.release_question(reservation)
+assert questions_asked('release@example.com') == 1
+print("✅ Count kept")
+
+print("\nTesting a new (UTC) month starts from zero...")
+user = db.get_user_by_email('free@example.com')
+db._execute('UPDATE users SET last_reset_date = ? WHERE id = ?', ('2000-01-15', user['id']))
+assert freemium.get_user_usage('free@example.com')['questions_used'] == 0
+reservation = freemium.reserve_question('free@example.com')
+assert reservation['allowed'] and reservation['questions_used'] == 1, reservation
+assert db.get_user_by_email('free@example.com')['last_reset_date'][:7] == freemium._current_month()
+print(f"✅ Rolled over to {freemium._current_month()}")
+
+print("\nTesting paid users count the same on the fast path...")
+db.create_user('paid@example.com', name='Paid')
+db.update_subscription('paid@example.com', 'active', 'sub_123')
+first = freemium.reserve_question('paid@example.com')
+assert first['allowed'] and not first['fast_path']
+freemium.commit_question(first)
+assert questions_asked('paid@example.com') == 1
+
+fast = freemium.reserve_question('paid@example.com')
+assert fast['allowed'] and fast['fast_path']
+assert questions_asked('paid@example.com') == 1
+freemium.commit_question(fast)
+assert questions_asked('paid@example.com') == 2
+
+failed = freemium.reserve_question('paid@example.com')
+freemium.release_question(failed)
+assert questions_asked('paid@example.com') == 2
+print("✅ Fast-path questions counted on commit, nothing counted when released")
+
+print("\nTesting a cancelled subscription leaves the fast path...")
+fast = freemium.reserve_question('paid@example.com')
+db.update_subscription('paid@example.com', 'free')
+freemium.commit_question(fast)
+assert 'paid@example.com' not in freemium._paid_users
+assert not freemium.reserve_question('paid@example.com')['fast_path']
+print("✅ Next reservation went back to the backend")
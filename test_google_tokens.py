@@ -0,0 +1,133 @@
+# Test Google ID token verification with local keys (no network)
+
+import time
+import datetime
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import crypt, jwt
+from core.google_tokens import GoogleTokenVerifier
+
+CLIENT_ID = 'educapp-test.apps.googleusercontent.com'
+
+
+def make_key(kid):
+    """RSA key, a signer for it, and its self-signed certificate (PEM) as Google publishes them"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, kid)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = x509.CertificateBuilder()\
+        .subject_name(name).issuer_name(name)\
+        .public_key(key.public_key())\
+        .serial_number(x509.random_serial_number())\
+        .not_valid_before(now - datetime.timedelta(days=1))\
+        .not_valid_after(now + datetime.timedelta(days=1))\
+        .sign(key, hashes.SHA256())
+    key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+    return crypt.RSASigner.from_string(key_pem, kid), cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def make_token(signer, audience=CLIENT_ID, issuer='https://accounts.google.com', expires_in=3600):
+    now = int(time.time())
+    return jwt.encode(signer, {
+        'iss': issuer,
+        'aud': audience,
+        'sub': '1234567890',
+        'email': 'student@example.com',
+        'email_verified': True,
+        'name': 'Test Student',
+        'iat': now,
+        'exp': now + expires_in
+    }).decode()
+
+
+class FakeResponse:
+    def __init__(self, certs, headers):
+        self._certs = certs
+        self.headers = headers
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return dict(self._certs)
+
+
+class FakeSession:
+    """Stands in for the pooled requests session; counts certificate downloads"""
+
+    def __init__(self, certs, headers):
+        self.certs = certs
+        self.headers = headers
+        self.requests = 0
+
+    def get(self, url, timeout=None):
+        self.requests += 1
+        return FakeResponse(self.certs, self.headers)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+def rejected(verifier, token):
+    try:
+        verifier.verify(token)
+        return False
+    except ValueError:
+        return True
+
+
+signer, cert = make_key('key-1')
+session = FakeSession({'key-1': cert}, {'Cache-Control': 'public, max-age=600, must-revalidate', 'Age': '100'})
+clock = FakeClock()
+verifier = GoogleTokenVerifier(CLIENT_ID, session=session, clock=clock)
+
+print("Testing valid token...")
+claims = verifier.verify(make_token(signer))
+assert claims['email'] == 'student@example.com'
+print(f"✅ Verified {claims['email']}")
+
+print("\nTesting certificate cache...")
+for _ in range(50):
+    verifier.verify(make_token(signer))
+assert session.requests == 1
+print(f"✅ 51 verifications, {session.requests} certificate download")
+
+print("\nTesting Cache-Control expiry (max-age 600, Age 100)...")
+clock.now += 499
+verifier.verify(make_token(signer))
+assert session.requests == 1
+clock.now += 2
+verifier.verify(make_token(signer))
+assert session.requests == 2
+print("✅ Refetched only after 500 seconds")
+
+print("\nTesting key rotation...")
+new_signer, new_cert = make_key('key-2')
+session.certs = {'key-1': cert, 'key-2': new_cert}
+clock.now += 120
+assert verifier.verify(make_token(new_signer))['email'] == 'student@example.com'
+assert session.requests == 3
+print("✅ Unknown key id refreshed the certificates once")
+
+print("\nTesting rejected tokens...")
+assert rejected(verifier, make_token(signer, audience='someone-else'))
+assert rejected(verifier, make_token(signer, issuer='https://evil.example.com'))
+assert rejected(verifier, make_token(signer, expires_in=-3600))
+forged_signer, _ = make_key('key-1')
+assert rejected(verifier, make_token(forged_signer))
+print("✅ Wrong audience, issuer, expiry and signature rejected")
+
+print("\nTiming local verification...")
+token = make_token(signer)
+started = time.perf_counter()
+for _ in range(200):
+    verifier.verify(token)
+print(f"✅ {(time.perf_counter() - started) / 200 * 1000:.2f} ms per token, {session.requests} downloads in total")
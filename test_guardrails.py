@@ -0,0 +1,56 @@
+# Test guardrail keyword and context-area matching
+
+from core.guardrails import BiblicalGuardrails
+
+guardrails = BiblicalGuardrails()
+
+
+def check(query, topics, area=None):
+    result = guardrails.check_query(query)
+    assert sorted(result["detected_topics"]) == sorted(topics), (query, result)
+    assert result["needs_parent_discussion"] == bool(topics), (query, result)
+    assert result["biblical_context_area"] == area, (query, result)
+
+
+print("Testing parent-discussion topics...")
+check("What happens in the end times?", ["end times"])
+check("Will there be a rapture before the tribulation?", ["rapture", "tribulation"])
+check("Why do Catholic and Protestant churches differ?", ["catholic", "protestant"])
+check("Is speaking in tongues for today?", ["speaking in tongues"])
+check("What does it mean to be born again?", ["born again"])
+check("Tell me about end times theology", ["end times", "end times theology"])
+check("What are the denominational distinctives of Baptists?",
+      ["denominational", "denominational distinctives"])
+print("✅ Topics detected as whole phrases")
+
+print("\nTesting stopwords and common words never trigger on their own...")
+check("How did the Romans build their roads and aqueducts?", [])
+check("What is the end of times?", [])
+check("What is the theme of Romeo and Juliet?", [])
+check("Is my personal faith enough to pass the test?", [])
+check("How many times does the church bell ring?", [])
+check("What happens at the end of the story?", [])
+print("✅ No misfires on 'and', 'of', 'end', 'times', 'personal', 'faith', 'church'")
+
+print("\nTesting whole-word matching...")
+check("How many businesses are there in my town?", [])
+check("Who won the class election?", ["election"])
+check("Is it a sin to lie?", [], "morality_and_ethics")
+check("Why do humans have sins?", [], "human_nature")
+check("Is there a sinusoidal curve in this graph?", [])
+check("What is a salvationist?", [])
+print("✅ No substring or suffix matches ('man' in 'many', 'sin' in 'sinusoidal')")
+
+print("\nTesting context-area priority...")
+check("Why do people believe in evolution?", [], "creation_and_science")
+check("What does the Bible say about marriage?", [], "biblical_authority")
+check("What is the difference between right and wrong?", [], "morality_and_ethics")
+check("What does God’s word say about heaven?", [], "biblical_authority")
+check("What is photosynthesis?", [])
+print("✅ Earliest matching area wins")
+
+print("\nTesting parent guidance note...")
+flagged = guardrails.check_query("Is baptism required for salvation?")
+assert "Discussion with Parents" in guardrails.add_parent_guidance("Answer.", flagged)
+assert guardrails.add_parent_guidance("Answer.", guardrails.check_query("What is 2+2?")) == "Answer."
+print("✅ Added only for flagged questions")
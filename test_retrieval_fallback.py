@@ -0,0 +1,96 @@
+# Test retrieval when the embedding service fails or hangs (no network)
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from core import rag_engine
+from core.rag_engine import BiblicalWorldviewRAG, chunk_id
+from core.lexical_index import BM25Index
+
+rag_engine.EMBEDDING_TIMEOUT = 0.2
+
+
+class FailingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        raise ConnectionError("embedding service down")
+
+
+class HangingEmbeddings:
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.release.wait(5)
+        return [0.0]
+
+
+class FakeCollection:
+    """Stands in for a Chroma collection; counts vector searches"""
+
+    def __init__(self):
+        self.searches = 0
+
+    def similarity_search_by_vector(self, vector, k):
+        self.searches += 1
+        return [Document(page_content="vector hit", metadata={"source": "v.txt"})]
+
+
+def make_rag(embeddings):
+    rag = object.__new__(BiblicalWorldviewRAG)
+    rag.embeddings = embeddings
+    rag._embedding_executor = ThreadPoolExecutor(max_workers=2)
+    rag._search_executor = ThreadPoolExecutor(max_workers=3)
+    rag.worldview_db = FakeCollection()
+    rag.curriculum_db = FakeCollection()
+    rag.scripture_db = FakeCollection()
+    rag.lexical_indexes = {}
+    for name, texts in {
+        "worldview": ["God created the heavens and the earth", "Truth is found in Christ"],
+        "curriculum": ["Saxon Math lesson on fractions", "Apologia chemistry of water"],
+        "scripture": ["Colossians 1:16 all things were created through him"],
+    }.items():
+        docs = [Document(page_content=text, metadata={"source": f"{name}.txt"}) for text in texts]
+        rag.lexical_indexes[name] = BM25Index.build(docs, [chunk_id(doc) for doc in docs])
+    return rag
+
+
+print("Testing keyword fallback when embedding fails...")
+embeddings = FailingEmbeddings()
+rag = make_rag(embeddings)
+context = rag.retrieve_context("How were all things created?")
+assert embeddings.calls == 1
+assert rag.worldview_db.searches == 0
+assert context["worldview"] == ["God created the heavens and the earth"], context["worldview"]
+assert context["scripture"] == ["Colossians 1:16 all things were created through him"]
+print(f"✅ BM25 answered alone: {context['worldview'][0]!r}")
+
+print("\nTesting a failed embedding is not retried by retrieve_context...")
+embeddings = HangingEmbeddings()
+rag = make_rag(embeddings)
+started = time.perf_counter()
+# The chatbot's order: try once (semantic cache), then retrieve with that result
+query_vector = rag.try_embed_query("Saxon fractions")
+context = rag.retrieve_context("Saxon fractions", query_vector=query_vector, embed=False)
+elapsed = time.perf_counter() - started
+embeddings.release.set()
+assert query_vector is None
+assert embeddings.calls == 1, embeddings.calls
+assert elapsed < 2 * rag_engine.EMBEDDING_TIMEOUT, elapsed
+assert context["curriculum"][0] == "Saxon Math lesson on fractions"
+assert "embedding" not in context["timings"]
+print(f"✅ One embedding attempt, answered in {elapsed * 1000:.0f} ms "
+      f"(timeout {rag_engine.EMBEDDING_TIMEOUT * 1000:.0f} ms)")
+
+print("\nTesting vector and keyword results are fused when embedding works...")
+rag = make_rag(FailingEmbeddings())
+context = rag.retrieve_context("Saxon fractions", query_vector=[0.0], embed=False)
+assert rag.curriculum_db.searches == 1
+assert set(context["curriculum"]) == {"vector hit", "Saxon Math lesson on fractions"}
+print(f"✅ Curriculum context: {context['curriculum']}")
@@ -0,0 +1,75 @@
+# Test session token issue, verify, revocation and expiry (no network)
+
+import os
+import time
+import tempfile
+
+os.environ['EDUCAPP_SESSION_SECRET'] = 'test-secret'
+
+from core import session_tokens as session_tokens_module
+from core.session_tokens import SessionTokens
+
+directory = tempfile.mkdtemp()
+revocation_path = os.path.join(directory, 'revoked_sessions.json')
+
+
+def make_tokens(secret=b'test-secret', ttl_hours=1):
+    return SessionTokens(secret=secret, ttl_hours=ttl_hours, revocation_path=revocation_path)
+
+
+print("Testing issue and verify...")
+tokens = make_tokens()
+token = tokens.issue(7, 'student@example.com', 'Student', 'paid')
+claims = tokens.verify(token)
+assert claims['uid'] == 7 and claims['email'] == 'student@example.com' and claims['tier'] == 'paid', claims
+assert claims['exp'] - claims['iat'] == 3600
+print("✅ Claims round-trip")
+
+print("\nTesting forged and malformed tokens...")
+payload, signature = token.split('.')
+assert tokens.verify(payload + '.' + signature[:-2] + 'xx') is None
+assert tokens.verify(make_tokens(secret=b'other-secret').issue(7, 'student@example.com', 'Student')) is None
+for bad in ['', 'garbage', 'a.b.c', None, 'ünicode.token']:
+    assert tokens.verify(bad) is None, bad
+print("✅ Rejected")
+
+print("\nTesting expiry...")
+short_lived = make_tokens(ttl_hours=0.1 / 3600)
+expiring = short_lived.issue(7, 'student@example.com', 'Student')
+assert short_lived.verify(expiring) is not None
+time.sleep(0.2)
+assert short_lived.verify(expiring) is None
+print("✅ Expired after its TTL")
+
+print("\nTesting logout revokes one token, for every process...")
+other_process = make_tokens()
+first = tokens.issue(7, 'student@example.com', 'Student')
+second = tokens.issue(7, 'student@example.com', 'Student')
+assert other_process.verify(first) is not None
+tokens.revoke(first)
+assert tokens.verify(first) is None
+assert other_process.verify(first) is None
+assert other_process.verify(second) is not None
+print("✅ Revoked token rejected by a second instance sharing the file")
+
+print("\nTesting a password change revokes every earlier token...")
+other_user = tokens.issue(8, 'other@example.com', 'Other')
+other_process.revoke_user(7)
+assert tokens.verify(second) is None
+assert tokens.verify(other_user) is not None
+time.sleep(0.01)
+assert tokens.verify(tokens.issue(7, 'student@example.com', 'Student')) is not None
+print("✅ Old tokens rejected, new ones and other users unaffected")
+
+print("\nTesting a missing secret...")
+del os.environ['EDUCAPP_SESSION_SECRET']
+session_tokens_module.APP_ENV = 'production'
+try:
+    make_tokens(secret=None)
+    raise AssertionError("expected a missing secret to fail outside development")
+except ValueError:
+    pass
+session_tokens_module.APP_ENV = 'development'
+dev_tokens = make_tokens(secret=None)
+assert dev_tokens.verify(dev_tokens.issue(7, 'student@example.com', 'Student')) is not None
+print("✅ Fails outside development, throwaway secret in development")
@@ -0,0 +1,129 @@
+# Test write-behind batching, shutdown flush and the JSONL spill/replay (no network)
+
+import os
+import json
+import time
+import tempfile
+import threading
+
+os.environ['EDUCAPP_DB_BACKEND'] = 'local'
+os.environ['EDUCAPP_LOCAL_DB_PATH'] = ':memory:'
+
+from core.write_behind import WriteBehindBuffer, HANDLERS
+
+directory = tempfile.mkdtemp()
+
+
+class Recorder:
+    """Handler that keeps every batch; fails while failing is set"""
+
+    def __init__(self):
+        self.batches = []
+        self.failing = False
+        self.written = threading.Event()
+
+    def __call__(self, payloads):
+        if self.failing:
+            raise ConnectionError("database unavailable")
+        self.batches.append(list(payloads))
+        self.written.set()
+
+
+def spill_path(name):
+    return os.path.join(directory, f"{name}.jsonl")
+
+
+print("Testing writes are batched off the calling thread...")
+recorder = Recorder()
+buffer = WriteBehindBuffer({'note': recorder}, flush_interval_ms=50, batch_size=4,
+                           spill_path=spill_path('batched'))
+started = time.perf_counter()
+for i in range(10):
+    buffer.submit('note', {'i': i})
+submitted = time.perf_counter() - started
+buffer.close()
+assert [payload['i'] for batch in recorder.batches for payload in batch] == list(range(10))
+assert all(len(batch) <= 4 for batch in recorder.batches), recorder.batches
+stats = buffer.stats()
+assert stats['submitted'] == 10 and stats['written'] == 10 and stats['spilled'] == 0, stats
+print(f"✅ 10 writes in {len(recorder.batches)} batches, submit took {submitted * 1000:.2f} ms")
+
+print("\nTesting a lone write is flushed after the interval...")
+recorder = Recorder()
+buffer = WriteBehindBuffer({'note': recorder}, flush_interval_ms=50, batch_size=100,
+                           spill_path=spill_path('interval'))
+buffer.submit('note', {'i': 0})
+assert recorder.written.wait(2), "nothing flushed"
+assert recorder.batches == [[{'i': 0}]]
+buffer.close()
+print("✅ Flushed without waiting for a full batch")
+
+print("\nTesting close flushes what is still queued...")
+recorder = Recorder()
+buffer = WriteBehindBuffer({'note': recorder}, flush_interval_ms=60000, batch_size=100,
+                           spill_path=spill_path('shutdown'))
+for i in range(3):
+    buffer.submit('note', {'i': i})
+buffer.close()
+assert recorder.batches == [[{'i': 0}, {'i': 1}, {'i': 2}]], recorder.batches
+buffer.submit('note', {'i': 3})
+assert buffer.stats()['spilled'] == 1
+print("✅ Queued writes flushed at shutdown; a write after close was spilled")
+
+try:
+    buffer.submit('unknown', {})
+    raise AssertionError("expected an unknown kind to be refused")
+except ValueError:
+    pass
+
+print("\nTesting failed batches spill to JSONL and replay...")
+recorder = Recorder()
+recorder.failing = True
+path = spill_path('failed')
+buffer = WriteBehindBuffer({'note': recorder}, flush_interval_ms=10, batch_size=100, spill_path=path)
+for i in range(5):
+    buffer.submit('note', {'i': i})
+buffer.close()
+with open(path, encoding='utf-8') as file:
+    spilled = [json.loads(line) for line in file]
+assert spilled == [{'kind': 'note', 'payload': {'i': i}} for i in range(5)], spilled
+assert buffer.stats()['failed_batches'] >= 1 and buffer.stats()['spilled'] == 5
+
+# A crash mid-write leaves a torn last line
+with open(path, 'a', encoding='utf-8') as file:
+    file.write('{"kind": "note", "payl')
+
+recorder.failing = False
+replayer = WriteBehindBuffer({'note': recorder}, batch_size=2, spill_path=path)
+assert replayer.replay() == 5
+assert [payload['i'] for batch in recorder.batches for payload in batch] == list(range(5))
+assert not os.path.exists(path) and not os.path.exists(f"{path}.replaying")
+print("✅ 5 spilled writes replayed, torn line skipped, spill file removed")
+
+print("\nTesting writes that fail again during replay are re-spilled...")
+recorder.failing = True
+buffer = WriteBehindBuffer({'note': recorder}, spill_path=path)
+buffer._spill([('note', {'i': 99})])
+assert buffer.replay() == 0
+with open(path, encoding='utf-8') as file:
+    assert [json.loads(line)['payload'] for line in file] == [{'i': 99}]
+print("✅ Kept for the next replay")
+
+print("\nTesting replay into the local database...")
+from core.supabase_client import get_database
+
+db = get_database()
+user_id = db.create_user('writer@example.com', name='Writer')
+path = spill_path('database')
+with open(path, 'w', encoding='utf-8') as file:
+    for record in [
+        {'kind': 'conversation', 'payload': {'user_id': user_id, 'question': 'What is 2+2?', 'answer': '4',
+                                             'subject': 'math', 'timestamp': '2025-01-15T10:00:00'}},
+        {'kind': 'question', 'payload': {'user_id': user_id}},
+        {'kind': 'question', 'payload': {'user_id': user_id}},
+    ]:
+        file.write(json.dumps(record) + '\n')
+assert WriteBehindBuffer(HANDLERS, spill_path=path).replay() == 3
+assert [conv['question'] for conv in db.get_user_conversations(user_id)] == ['What is 2+2?']
+assert db.get_user_by_email('writer@example.com')['questions_asked'] == 2
+print("✅ Conversations and older question-count spills written")